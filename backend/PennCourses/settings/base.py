@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "corsheaders",
     "shortener.apps.ShortenerConfig",
@@ -174,22 +175,82 @@ OPEN_DATA_API_BASE = "https://3scale-public-prod-open-data.apps.k8s.upenn.edu/ap
 WEBHOOK_USERNAME = os.environ.get("WEBHOOK_USERNAME", "webhook")
 WEBHOOK_PASSWORD = os.environ.get("WEBHOOK_PASSWORD", "password")
 
+# Webhook ingest-and-ack mode (enabled by the WEBHOOK_INGEST_MODE Option),
+# see alert/webhook_stream.py
+WEBHOOK_STREAM_SHARDS = 1  # run one consumewebhooks process per shard
+WEBHOOK_STREAM_MAXLEN = 100000  # approximate max entries kept in each stream
+WEBHOOK_IDEMPOTENCY_TTL = 60 * 60 * 24 * 7  # how long processed stream entry ids are remembered
+WEBHOOK_STREAM_RECLAIM_INTERVAL = 60  # seconds between retries of pending entries
+WEBHOOK_STREAM_CLAIM_IDLE_MS = 5 * 60 * 1000  # idle time before claiming another consumer's entry
+
+# Reject duplicate status update webhooks using a Redis cache of each section's last known
+# status (see alert/status_cache.py), rather than querying the DB
+WEBHOOK_STATUS_CACHE = False
+WEBHOOK_STATUS_CACHE_TTL = 60 * 60 * 24  # how long each section's cached status is trusted
+
+# Record alert latency histograms in Redis (see alert/latency.py)
+ALERT_LATENCY_METRICS = False
+
+# Answer course/section code searches from an in-process prefix index of each semester's codes
+# (see courses/code_index.py), rather than querying the DB
+CODE_PREFIX_INDEX = False
+
+# Cache course search responses, invalidated by per-semester generations
+# (see courses/search_cache.py)
+COURSE_SEARCH_CACHE = False
+
+# Serve each semester's course list from a precompiled, gzipped snapshot with an ETag
+# (see courses/catalog_snapshot.py)
+COURSE_CATALOG_SNAPSHOT = False
+
+# Stream unpaginated course / section list responses from a server-side cursor
+# (see StreamingListMixin in courses/views.py)
+STREAM_LIST_RESPONSES = False
+
 # Email Configuration
 SMTP_HOST = os.environ.get("SMTP_HOST", "")
 SMTP_PORT = os.environ.get("SMTP_PORT", 587)
 SMTP_USERNAME = os.environ.get("SMTP_USERNAME", "")
 SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 2))  # open connections per worker process
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100  # reconnect after this many messages in one session
 
 # Twilio Credentials
 TWILIO_SID = os.environ.get("TWILIO_SID", "")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_TOKEN", "")
 TWILIO_NUMBER = os.environ.get("TWILIO_NUMBER", "+12153984277")
+TWILIO_SENDS_PER_SECOND = 1  # per worker process; paces texts to the number's throughput limit
+TWILIO_SEND_BURST = 1
+TWILIO_MAX_RETRIES = 3  # retries for throttled (HTTP 429) texts
+TWILIO_RETRY_BACKOFF = 1  # seconds, doubled after each throttled attempt
+
+# Mobile push notifications (sent through the Penn Labs notifications API)
+PUSH_NOTIFICATION_URL = "https://api.pennlabs.org/notifications/send/internal"
+PUSH_NOTIFICATION_CONCURRENCY = 20  # max in-flight requests per dispatch_push_notifications call
+PUSH_NOTIFICATION_TIMEOUT = 10  # seconds
 
 # Redis
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/1")
 
 # Celery
 MESSAGE_BROKER_URL = REDIS_URL
+# Route alert and background tasks to separate queues (see alert/queues.py), and have workers
+# consume their queues in priority order (open alerts first, background recomputes last)
+CELERY_TASK_ROUTES = ("alert.queues.route_task",)
+CELERY_BROKER_TRANSPORT_OPTIONS = {"queue_order_strategy": "priority"}
+
+# While more than this many alert tasks are queued, background tasks are deferred by
+# BACKGROUND_TASK_DEFER_SECONDS (and duplicates shed); None disables the admission policy
+ALERT_BACKLOG_THRESHOLD = None
+BACKGROUND_TASK_DEFER_SECONDS = 60
+
+# How many registrations each send_alert_batch task handles, when alerts are sent
+# with the batched fan-out (enabled by the BATCH_ALERT_FANOUT Option)
+ALERT_FANOUT_CHUNK_SIZE = 50
+
+# Demand changes within this many seconds of each other (in the same semester) are coalesced
+# into a single demand distribution estimate recomputation (0 to recompute on every change)
+DEMAND_CHANGE_COALESCE_SECONDS = 10
 
 # Django REST Framework
 REST_FRAMEWORK = {
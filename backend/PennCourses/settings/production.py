@@ -39,3 +39,11 @@ CACHES = {
 }
 
 MOBILE_NOTIFICATION_SECRET = os.environ.get("MOBILE_NOTIFICATION_SECRET", "")
+
+WEBHOOK_STATUS_CACHE = True
+ALERT_LATENCY_METRICS = True
+CODE_PREFIX_INDEX = True
+COURSE_SEARCH_CACHE = True
+COURSE_CATALOG_SNAPSHOT = True
+STREAM_LIST_RESPONSES = True
+ALERT_BACKLOG_THRESHOLD = 200
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import reverse
 from django.utils.html import format_html
 
-from alert.models import AddDropPeriod, PcaDemandDistributionEstimate, Registration
+from alert.models import AddDropPeriod, DailyAlertStats, PcaDemandDistributionEstimate, Registration
 
 
 class RegistrationAdmin(admin.ModelAdmin):
@@ -66,6 +66,15 @@ class AddDropPeriodAdmin(admin.ModelAdmin):
     list_filter = ["semester"]
 
 
+class DailyAlertStatsAdmin(admin.ModelAdmin):
+    list_display = ("date", "semester", "new_registrations", "alerts_sent", "status_updates")
+
+    list_filter = ["semester"]
+
+    ordering = ("-date",)
+
+
 admin.site.register(Registration, RegistrationAdmin)
 admin.site.register(PcaDemandDistributionEstimate, PcaDemandDistributionEstimateAdmin)
 admin.site.register(AddDropPeriod, AddDropPeriodAdmin)
+admin.site.register(DailyAlertStats, DailyAlertStatsAdmin)
@@ -1,15 +1,24 @@
+import asyncio
 import json
 import logging
+import os
+import queue
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future
 from email.mime.text import MIMEText
-from smtplib import SMTP, SMTPRecipientsRefused
+from smtplib import SMTP, SMTPRecipientsRefused, SMTPServerDisconnected
 
+import aiohttp
 import requests
 from django.conf import settings
 from django.template import loader
 from twilio.base.exceptions import TwilioRestException
 from twilio.rest import Client
 
+from courses.util import percentile
 from PennCourses.settings.production import MOBILE_NOTIFICATION_SECRET
 
 
@@ -17,37 +26,423 @@ logger = logging.getLogger(__name__)
 SEPARATOR = ", "
 
 
+class PooledSMTPConnection:
+    """
+    An authenticated SMTP connection which is kept open across many sent messages
+    (managed by `SMTPConnectionPool`). The connection is (re)established lazily,
+    and `messages_sent` / `reconnects` count sends and reconnections over its lifetime.
+    """
+
+    def __init__(self, pool, connection_id):
+        self.pool = pool
+        self.connection_id = connection_id
+        self.server = None
+        self.messages_sent = 0
+        self.session_messages_sent = 0
+        self.reconnects = 0
+        self.failures = 0
+
+    def connect(self):
+        if self.server is not None:
+            self.close()
+            self.reconnects += 1
+        server = SMTP(self.pool.host, self.pool.port, timeout=self.pool.timeout)
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+        server.login(self.pool.username, self.pool.password)
+        self.server = server
+        self.session_messages_sent = 0
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (SMTPServerDisconnected, OSError):
+            pass  # the connection is already gone
+        self.server = None
+
+    def send_message(self, msg):
+        """
+        Sends the given message, (re)connecting first if the connection is closed or has
+        reached the pool's `max_messages_per_connection`. If the server has dropped the
+        connection, we reconnect and retry the send once.
+        """
+        if self.server is None or (
+            self.pool.max_messages_per_connection
+            and self.session_messages_sent >= self.pool.max_messages_per_connection
+        ):
+            self.connect()
+        try:
+            self.server.send_message(msg)
+        except (SMTPServerDisconnected, ConnectionError):
+            self.failures += 1
+            self.connect()
+            self.server.send_message(msg)
+        self.messages_sent += 1
+        self.session_messages_sent += 1
+
+    def stats(self):
+        return {
+            "connection_id": self.connection_id,
+            "connected": self.server is not None,
+            "messages_sent": self.messages_sent,
+            "session_messages_sent": self.session_messages_sent,
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+        }
+
+
+class SMTPConnectionPool:
+    """
+    A thread-safe pool of up to `size` authenticated SMTP connections, which are kept open
+    between sends (so we don't pay for a TCP/TLS handshake and login on every alert email).
+    Use `get_smtp_pool` to get the pool for the current worker process.
+    """
+
+    def __init__(
+        self,
+        host,
+        port,
+        username,
+        password,
+        size=2,
+        max_messages_per_connection=100,
+        timeout=30,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+        self.connections = []
+        self.idle = []
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while not self.idle and len(self.connections) >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            connection = PooledSMTPConnection(self, connection_id=len(self.connections))
+            self.connections.append(connection)
+            return connection
+
+    def release(self, connection):
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def send_message(self, msg):
+        connection = self.acquire()
+        try:
+            connection.send_message(msg)
+        except SMTPRecipientsRefused:
+            raise  # the connection is still usable
+        except Exception:
+            connection.failures += 1
+            connection.close()  # don't hand out a connection in an unknown state
+            raise
+        finally:
+            self.release(connection)
+        return True
+
+    def stats(self):
+        """
+        Returns a list of per-connection send counters (see `PooledSMTPConnection.stats`).
+        """
+        with self.condition:
+            return [connection.stats() for connection in self.connections]
+
+    def close(self):
+        with self.condition:
+            for connection in self.connections:
+                connection.close()
+
+
+_smtp_pool = None
+_smtp_pool_pid = None
+_smtp_pool_lock = threading.Lock()
+
+
+def get_smtp_pool():
+    """
+    Returns the SMTPConnectionPool for this process, creating it if necessary. The pool is
+    recreated after a fork (e.g. in Celery prefork workers), so sockets are never shared
+    between processes.
+    """
+    global _smtp_pool, _smtp_pool_pid
+    with _smtp_pool_lock:
+        if _smtp_pool is None or _smtp_pool_pid != os.getpid():
+            _smtp_pool = SMTPConnectionPool(
+                settings.SMTP_HOST,
+                settings.SMTP_PORT,
+                settings.SMTP_USERNAME,
+                settings.SMTP_PASSWORD,
+                size=settings.SMTP_POOL_SIZE,
+                max_messages_per_connection=settings.SMTP_MAX_MESSAGES_PER_CONNECTION,
+            )
+            _smtp_pool_pid = os.getpid()
+        return _smtp_pool
+
+
 def send_email(from_, to, subject, html):
     msg = MIMEText(html, "html")
     msg["Subject"] = subject
     msg["From"] = from_
     msg["To"] = to
 
-    with SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-        server.ehlo()
-        server.starttls()
-        server.ehlo()
-        server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-        server.send_message(msg)
-        return True
+    return get_smtp_pool().send_message(msg)
+
+
+_twilio_client = None
+_twilio_client_pid = None
+
+
+def get_twilio_client():
+    """
+    Returns a Twilio client for this process, creating it if necessary
+    (the client is reused across texts rather than being recreated for each one).
+    """
+    global _twilio_client, _twilio_client_pid
+    if _twilio_client is None or _twilio_client_pid != os.getpid():
+        _twilio_client = Client(settings.TWILIO_SID, settings.TWILIO_AUTH_TOKEN)
+        _twilio_client_pid = os.getpid()
+    return _twilio_client
+
+
+class TokenBucket:
+    """
+    A token bucket allowing `rate` operations per second on average,
+    with bursts of up to `capacity` operations.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """
+        Takes a token from the bucket, blocking until one is available.
+        Returns the number of seconds spent waiting.
+        """
+        waited = 0
+        self.refill()
+        while self.tokens < 1:
+            wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+            self.refill()
+        self.tokens -= 1
+        return waited
+
+
+class SMSQueue:
+    """
+    A queue of outgoing texts, sent by a background thread through a single long-lived
+    Twilio client. Sends are paced by a token bucket (`rate` texts per second, since Twilio
+    rejects messages sent faster than a number's throughput limit), and throttled sends
+    (HTTP 429) are retried with exponential backoff, up to `max_retries` times.
+    Use `get_sms_queue` to get the queue for the current worker process.
+    """
+
+    def __init__(
+        self,
+        client_factory=get_twilio_client,
+        from_=None,
+        rate=1,
+        burst=1,
+        max_retries=3,
+        backoff=1,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.client_factory = client_factory
+        self.from_ = from_
+        self.bucket = TokenBucket(rate, capacity=burst, clock=clock, sleep=sleep)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sleep = sleep
+        self.queue = queue.Queue()
+        self.latencies = deque(maxlen=1000)
+        self.counts = {"sent": 0, "failed": 0, "throttled": 0}
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def submit(self, to, text):
+        """
+        Adds a text to the queue, and returns a Future resolving to the result of the send
+        (True if the text was sent, or None if an error occurred).
+        """
+        future = Future()
+        self.queue.put((to, text, future, time.monotonic()))
+        self.start()
+        return future
+
+    def send(self, to, text):
+        return self.submit(to, text).result()
+
+    def run(self):
+        while True:
+            to, text, future, enqueued_at = self.queue.get()
+            try:
+                future.set_result(self.send_now(to, text))
+            except Exception as e:  # never let the sender thread die
+                future.set_exception(e)
+            finally:
+                self.latencies.append(time.monotonic() - enqueued_at)
+                self.queue.task_done()
+
+    def send_now(self, to, text):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                msg = self.client_factory().messages.create(
+                    to=to, from_=self.from_ or settings.TWILIO_NUMBER, body=text
+                )
+                if msg.sid is not None:
+                    self.counts["sent"] += 1
+                    return True
+                self.counts["failed"] += 1
+                return None
+            except TwilioRestException as e:
+                if e.status == 429 and attempt < self.max_retries:
+                    self.counts["throttled"] += 1
+                    self.sleep(self.backoff * 2**attempt)
+                    continue
+                logger.exception("Text Error")
+                self.counts["failed"] += 1
+                return None
+
+    def stats(self):
+        """
+        Returns the current queue depth, send counters, and send latency percentiles
+        (in seconds, from enqueueing a text to the end of its send) over the last 1000 texts.
+        """
+        latencies = list(self.latencies)
+        return {
+            "queue_depth": self.queue.qsize(),
+            **self.counts,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_max": max(latencies, default=None),
+        }
+
+
+_sms_queue = None
+_sms_queue_pid = None
+_sms_queue_lock = threading.Lock()
+
+
+def get_sms_queue():
+    """
+    Returns the SMSQueue for this process, creating it if necessary
+    (it is recreated after a fork, since the sender thread doesn't survive forking).
+    """
+    global _sms_queue, _sms_queue_pid
+    with _sms_queue_lock:
+        if _sms_queue is None or _sms_queue_pid != os.getpid():
+            _sms_queue = SMSQueue(
+                rate=settings.TWILIO_SENDS_PER_SECOND,
+                burst=settings.TWILIO_SEND_BURST,
+                max_retries=settings.TWILIO_MAX_RETRIES,
+                backoff=settings.TWILIO_RETRY_BACKOFF,
+            )
+            _sms_queue_pid = os.getpid()
+        return _sms_queue
 
 
 def send_text(to, text):
-    try:
-        client = Client(settings.TWILIO_SID, settings.TWILIO_AUTH_TOKEN)
-        msg = client.messages.create(to=to, from_=settings.TWILIO_NUMBER, body=text)
-        if msg.sid is not None:
-            return True
-    except TwilioRestException:
-        logger.exception("Text Error")
-        return None
+    return get_sms_queue().send(to, text)
+
+
+async def send_push_notification_async(session, semaphore, url, pennkey, title, body):
+    """
+    Sends a single push notification using the given aiohttp session, waiting on the given
+    semaphore to bound concurrency. Returns True if the notification was sent,
+    and None if an error occurred.
+    """
+    async with semaphore:
+        try:
+            async with session.post(
+                url, data={"title": title, "body": body, "pennkey": pennkey}
+            ) as response:
+                if response.status != 200:
+                    content = await response.read()
+                    logger.error(f"Push Notification {response.status} Response: {content}")
+                    return None
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.exception(f"Push Notification Request Error: {e}")
+            return None
+
+
+async def dispatch_push_notifications_async(notifications, concurrency, url):
+    semaphore = asyncio.Semaphore(concurrency)  # Limit concurrent push notification requests
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency),  # keep-alive connections are reused
+        headers={"Authorization": f"Bearer {MOBILE_NOTIFICATION_SECRET}"},
+        timeout=aiohttp.ClientTimeout(total=settings.PUSH_NOTIFICATION_TIMEOUT),
+    ) as session:
+        tasks = [
+            asyncio.create_task(
+                coro=send_push_notification_async(session, semaphore, url, pennkey, title, body)
+            )
+            for pennkey, title, body in notifications
+        ]
+        return await asyncio.gather(*tasks, return_exceptions=False)
+
+
+def dispatch_push_notifications(notifications, concurrency=None, url=None):
+    """
+    Sends a batch of push notifications concurrently, over a single HTTP session.
+    :param notifications: a list of (pennkey, title, body) tuples
+    :param concurrency: the max number of in-flight requests
+        (defaults to settings.PUSH_NOTIFICATION_CONCURRENCY)
+    :param url: the notifications API endpoint (defaults to settings.PUSH_NOTIFICATION_URL)
+    :return: a list of results in the same order as `notifications`; each result is
+        True if the notification was sent, or None if an error occurred
+        (the same convention as `Alert.send_alert`).
+    """
+    if not notifications:
+        return []
+    return asyncio.run(
+        dispatch_push_notifications_async(
+            notifications,
+            concurrency=concurrency or settings.PUSH_NOTIFICATION_CONCURRENCY,
+            url=url or settings.PUSH_NOTIFICATION_URL,
+        )
+    )
 
 
 def get_meeting_string(reg):
+    return get_section_meeting_string(reg.section)
+
+
+def get_section_meeting_string(section):
     meeting_string = ""
-    if reg.section.meeting_times:
+    if section.meeting_times:
         try:
-            meetings = json.loads(reg.section.meeting_times)
+            meetings = json.loads(section.meeting_times)
             if isinstance(meetings, list):
                 meeting_string = SEPARATOR.join(meetings)
         except json.JSONDecodeError:
@@ -55,31 +450,71 @@ def get_meeting_string(reg):
     return meeting_string
 
 
-class Alert(ABC):
-    def __init__(self, template, reg, close_template=None):
-        t = loader.get_template(template)
-        meetings_string = get_meeting_string(reg)
-
-        self.text = t.render(
-            {
-                "course": reg.section.full_code,
-                "brand": "Penn Course Alert",
-                "auto_resubscribe": reg.auto_resubscribe,
-                "meetings": meetings_string,
-            }
+ALERT_TEMPLATES = (
+    "alert/email_alert.html",
+    "alert/email_alert_close.html",
+    "alert/text_alert.txt",
+    "alert/push_notif.txt",
+    "alert/push_notif_close.txt",
+)
+
+
+def alert_template_key(template, auto_resubscribe):
+    return f"{template}:{int(bool(auto_resubscribe))}"
+
+
+def render_alert_template(template, section, auto_resubscribe, meetings_string=None):
+    if meetings_string is None:
+        meetings_string = get_section_meeting_string(section)
+    return loader.get_template(template).render(
+        {
+            "course": section.full_code,
+            "brand": "Penn Course Alert",
+            "auto_resubscribe": auto_resubscribe,
+            "meetings": meetings_string,
+        }
+    )
+
+
+def render_alert_templates(section):
+    """
+    Renders every alert template once for the given section (for both possible values of
+    `auto_resubscribe`), and returns a dict mapping `alert_template_key(template, auto_resubscribe)`
+    to the rendered text. This dict can be passed to `Registration.alert` (via the
+    `rendered_templates` kwarg) so that alerts sent in bulk for the same section don't
+    each re-render the same templates.
+    """
+    meetings_string = get_section_meeting_string(section)
+    return {
+        alert_template_key(template, auto_resubscribe): render_alert_template(
+            template, section, auto_resubscribe, meetings_string
         )
+        for template in ALERT_TEMPLATES
+        for auto_resubscribe in [False, True]
+    }
+
+
+class Alert(ABC):
+    def __init__(self, template, reg, close_template=None, rendered_templates=None):
+        """
+        :param rendered_templates: an optional dict of pre-rendered templates
+            (see `render_alert_templates`). Templates missing from the dict are rendered
+            and added to it, so the same dict can be shared across alerts for one section.
+        """
+        self.registration = reg
+        self.rendered_templates = rendered_templates if rendered_templates is not None else dict()
+        self.text = self.render(template)
         self.close_text = None
         if close_template:
-            t = loader.get_template(close_template)
-            self.close_text = t.render(
-                {
-                    "course": reg.section.full_code,
-                    "brand": "Penn Course Alert",
-                    "auto_resubscribe": reg.auto_resubscribe,
-                    "meetings": meetings_string,
-                }
+            self.close_text = self.render(close_template)
+
+    def render(self, template):
+        key = alert_template_key(template, self.registration.auto_resubscribe)
+        if key not in self.rendered_templates:
+            self.rendered_templates[key] = render_alert_template(
+                template, self.registration.section, self.registration.auto_resubscribe
             )
-        self.registration = reg
+        return self.rendered_templates[key]
 
     @abstractmethod
     def send_alert(self, close_notification=False):
@@ -87,8 +522,13 @@ class Alert(ABC):
 
 
 class Email(Alert):
-    def __init__(self, reg):
-        super().__init__("alert/email_alert.html", reg, "alert/email_alert_close.html")
+    def __init__(self, reg, rendered_templates=None):
+        super().__init__(
+            "alert/email_alert.html",
+            reg,
+            "alert/email_alert_close.html",
+            rendered_templates=rendered_templates,
+        )
 
     def send_alert(self, close_notification=False):
         """
@@ -124,8 +564,8 @@ class Email(Alert):
 
 
 class Text(Alert):
-    def __init__(self, reg):
-        super().__init__("alert/text_alert.txt", reg)
+    def __init__(self, reg, rendered_templates=None):
+        super().__init__("alert/text_alert.txt", reg, rendered_templates=rendered_templates)
 
     def send_alert(self, close_notification=False):
         """
@@ -150,44 +590,55 @@ class Text(Alert):
 
 
 class PushNotification(Alert):
-    def __init__(self, reg):
-        super().__init__("alert/push_notif.txt", reg, close_template="alert/push_notif_close.txt")
+    def __init__(self, reg, rendered_templates=None):
+        super().__init__(
+            "alert/push_notif.txt",
+            reg,
+            close_template="alert/push_notif_close.txt",
+            rendered_templates=rendered_templates,
+        )
+
+    def get_payload(self, close_notification=False):
+        """
+        Returns the (pennkey, title, body) of this push notification, or None if
+        push notifications are not enabled for the registration's user.
+        """
+        if self.registration.user is None or not self.registration.user.profile.push_notifications:
+            # Only send push notification if push_notifications is enabled
+            return None
+        if close_notification:
+            alert_title = f"{self.registration.section.full_code} just closed."
+            alert_body = self.close_text
+        else:
+            alert_title = f"{self.registration.section.full_code} is now open!"
+            alert_body = self.text
+        return self.registration.user.username, alert_title, alert_body
 
     def send_alert(self, close_notification=False):
         """
         Returns False if notification was not sent intentionally,
         and None if notification was attempted to be sent but an error occurred.
         """
-        if self.registration.user is not None and self.registration.user.profile.push_notifications:
-            # Only send push notification if push_notifications is enabled
-            pennkey = self.registration.user.username
-            bearer_token = MOBILE_NOTIFICATION_SECRET
-            if close_notification:
-                if not self.close_text:
-                    # This should be unreachable
-                    return None
-                alert_title = f"{self.registration.section.full_code} just closed."
-                alert_body = self.close_text
-            else:
-                alert_title = f"{self.registration.section.full_code} is now open!"
-                alert_body = self.text
-            try:
-                response = requests.post(
-                    "https:/api.pennlabs.org/notifications/send/internal",
-                    data={
-                        "title": alert_title,
-                        "body": alert_body,
-                        "pennkey": pennkey,
-                    },
-                    headers={"Authorization": f"Bearer {bearer_token}"},
+        payload = self.get_payload(close_notification=close_notification)
+        if payload is None:
+            return False
+        pennkey, alert_title, alert_body = payload
+        try:
+            response = requests.post(
+                settings.PUSH_NOTIFICATION_URL,
+                data={
+                    "title": alert_title,
+                    "body": alert_body,
+                    "pennkey": pennkey,
+                },
+                headers={"Authorization": f"Bearer {MOBILE_NOTIFICATION_SECRET}"},
+            )
+            if response.status_code != 200:
+                logger.exception(
+                    f"Push Notification {response.status_code} Response: {response.content}"
                 )
-                if response.status_code != 200:
-                    logger.exception(
-                        f"Push Notification {response.status_code} Response: {response.content}"
-                    )
-                    return None
-            except requests.exceptions.RequestException as e:
-                logger.exception(f"Push Notification Request Error: {e}")
                 return None
-            return True
-        return False
+        except requests.exceptions.RequestException as e:
+            logger.exception(f"Push Notification Request Error: {e}")
+            return None
+        return True
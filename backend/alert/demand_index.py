@@ -0,0 +1,206 @@
+"""
+A Redis index of the raw demand (registration_volume / capacity) of each current-semester
+section counted toward PCA demand distribution estimates (i.e. each section matching
+`extra_metrics_section_filters`).
+
+Each semester has two sorted sets, mapping section id to raw demand: one containing all
+such sections, and one containing only the closed ones. When the SECTION_DEMAND_INDEX Option
+is enabled, `update_demand_distribution_estimate` reads the lowest / highest demand sections
+and the closed sections' raw demand values from these sorted sets, rather than sorting every
+section in the semester while holding row locks.
+
+The index is updated whenever a section's registration_volume or status changes (with
+`update_section_demand_index`, once the change commits), and rebuilt from the DB by
+`recompute_soft_state` (with `rebuild_section_demand_index`), which is run after every
+registrar import (the only way capacities change). If an update can't be written to Redis, the
+index is marked stale (in the Django cache), and it is rebuilt the next time the demand
+distribution estimate reads it. Use the `checkdemandindex` management command to compare the
+index with the DB.
+"""
+
+import logging
+import math
+
+import numpy as np
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from options.models import get_bool
+
+from courses.models import Section
+from courses.util import get_current_semester
+from review.views import extra_metrics_section_filters
+
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+
+def demand_index_enabled():
+    return get_bool("SECTION_DEMAND_INDEX", False)
+
+
+def demand_index_key(semester, closed=False):
+    return f"section_demand:{semester}" + (":closed" if closed else "")
+
+
+def demand_index_stale_key(semester):
+    return f"section_demand_stale:{semester}"
+
+
+def mark_section_demand_index_stale(semester):
+    """
+    Marks the index for the given semester as needing a rebuild (see `demand_index_is_stale`).
+    """
+    cache.set(demand_index_stale_key(semester), True, timeout=None)
+
+
+def demand_index_is_stale(semester):
+    """
+    Returns True if an update to the index for the given semester failed since it was last
+    rebuilt (so it should be rebuilt before it is read).
+    """
+    return bool(cache.get(demand_index_stale_key(semester)))
+
+
+def section_raw_demand(registration_volume, capacity):
+    return registration_volume / capacity if capacity and capacity > 0 else None
+
+
+def indexed_sections(semester):
+    """
+    Returns a queryset of the sections in the given semester that belong in the index.
+    """
+    return Section.objects.filter(extra_metrics_section_filters, course__semester=semester)
+
+
+def get_db_demands(semester):
+    """
+    Returns a tuple of two dicts, mapping section id to raw demand, for all of the given
+    semester's indexed sections and for only the closed ones (computed from the DB).
+    """
+    demands, closed_demands = dict(), dict()
+    sections = indexed_sections(semester).values_list(
+        "id", "registration_volume", "capacity", "status"
+    )
+    for section_id, registration_volume, capacity, status in sections:
+        demands[section_id] = section_raw_demand(registration_volume, capacity)
+        if status == "C":
+            closed_demands[section_id] = demands[section_id]
+    return demands, closed_demands
+
+
+def update_section_demand_index(section):
+    """
+    Updates the given section's entries in the index, once the current transaction commits.
+    This function should be called after a section's registration_volume, capacity or status
+    changes (and the section is saved). Does nothing unless the SECTION_DEMAND_INDEX Option is
+    enabled, and the section is in the current semester. If Redis can't be written to, the
+    error is logged and the index is marked stale.
+    """
+    semester = section.semester
+    if semester != get_current_semester() or not demand_index_enabled():
+        return
+    demand = None
+    if indexed_sections(semester).filter(id=section.id).exists():
+        demand = section_raw_demand(section.registration_volume, section.capacity)
+    closed = section.status == "C"
+
+    def write():
+        key, closed_key = demand_index_key(semester), demand_index_key(semester, closed=True)
+        pipeline = r.pipeline()
+        if demand is not None:
+            pipeline.zadd(key, {section.id: demand})
+            if closed:
+                pipeline.zadd(closed_key, {section.id: demand})
+            else:
+                pipeline.zrem(closed_key, section.id)
+        else:
+            pipeline.zrem(key, section.id)
+            pipeline.zrem(closed_key, section.id)
+        try:
+            pipeline.execute()
+        except redis.exceptions.RedisError:
+            logger.exception(f"Error updating section demand index for section {section.id}")
+            mark_section_demand_index_stale(semester)
+
+    transaction.on_commit(write)
+
+
+def rebuild_section_demand_index(semester):
+    """
+    Rebuilds the index for the given semester from the DB, and clears its stale mark. The new
+    sorted sets are built under temporary keys and renamed into place, so readers never see a
+    partial index.
+    """
+    # Cleared before reading the DB, so updates that fail from here on mark it stale again
+    cache.delete(demand_index_stale_key(semester))
+    demands, closed_demands = get_db_demands(semester)
+    pipeline = r.pipeline()
+    for closed, mapping in [(False, demands), (True, closed_demands)]:
+        key = demand_index_key(semester, closed=closed)
+        if mapping:
+            pipeline.delete(key + ":rebuild")
+            pipeline.zadd(key + ":rebuild", mapping)
+            pipeline.rename(key + ":rebuild", key)
+        else:
+            pipeline.delete(key)
+    try:
+        pipeline.execute()
+    except redis.exceptions.RedisError:
+        mark_section_demand_index_stale(semester)
+        raise
+    return len(demands)
+
+
+def get_demand_extremes(semester):
+    """
+    Returns a tuple `((lowest_id, lowest_demand), (highest_id, highest_demand))` of the
+    sections with the lowest and highest raw demand in the given semester, or None if the index
+    for that semester is empty. Among sections with equal demand, Redis orders members
+    lexicographically (so e.g. section id 10 comes before 9).
+    """
+    key = demand_index_key(semester)
+    pipeline = r.pipeline()
+    pipeline.zrange(key, 0, 0, withscores=True)
+    pipeline.zrange(key, -1, -1, withscores=True)
+    lowest, highest = pipeline.execute()
+    if not lowest or not highest:
+        return None
+    return tuple((int(section_id), demand) for section_id, demand in [lowest[0], highest[0]])
+
+
+def get_closed_section_demands(semester):
+    """
+    Returns a numpy array of the raw demand values of the given semester's closed sections.
+    """
+    closed_demands = r.zrange(demand_index_key(semester, closed=True), 0, -1, withscores=True)
+    return np.asarray([demand for _, demand in closed_demands])
+
+
+def check_section_demand_index(semester):
+    """
+    Compares the index for the given semester with the DB. Returns a dict mapping
+    `"all"` and `"closed"` (the two sorted sets) each to a dict of section id lists:
+    `missing` (in the DB but not the index), `extra` (in the index but not the DB), and
+    `mismatched` (with a different raw demand in the index than in the DB).
+    """
+    discrepancies = dict()
+    for name, db_demands in zip(["all", "closed"], get_db_demands(semester)):
+        index_demands = {
+            int(section_id): demand
+            for section_id, demand in r.zrange(
+                demand_index_key(semester, closed=(name == "closed")), 0, -1, withscores=True
+            )
+        }
+        discrepancies[name] = {
+            "missing": sorted(db_demands.keys() - index_demands.keys()),
+            "extra": sorted(index_demands.keys() - db_demands.keys()),
+            "mismatched": sorted(
+                section_id
+                for section_id in db_demands.keys() & index_demands.keys()
+                if not math.isclose(db_demands[section_id], index_demands[section_id])
+            ),
+        }
+    return discrepancies
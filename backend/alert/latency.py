@@ -0,0 +1,210 @@
+"""
+End-to-end alert latency instrumentation.
+
+Latencies are recorded at each stage of sending an alert:
+- `queue_wait:send_course_alerts`: from the webhook being received by `accept_webhook` to
+  `send_course_alerts` (or `send_course_alerts_batched`) starting
+- `queue_wait:send_alert`: from `send_course_alerts` enqueueing a `send_alert` (or
+  `send_alert_batch`) task to that task starting
+- `send:{channel}`: how long the channel (`email`, `text` or `push`) took to send an alert
+- `end_to_end:{channel}`: from the webhook being received to the channel finishing sending
+  an alert (only for alerts triggered by a webhook)
+
+Each metric is aggregated into a histogram with fixed, roughly logarithmic buckets (see
+`LATENCY_BUCKETS`), stored in Redis as one hash per metric per day (mapping bucket index to
+count, plus the sum of all observations). To keep the overhead negligible, observations are
+buffered in memory and written in a single pipelined request by `flush_latencies` (called at
+the end of every alert task, or once the buffer is large or old enough); Redis errors are
+logged and otherwise ignored, so instrumentation never blocks an alert.
+
+Latencies are only recorded if the ALERT_LATENCY_METRICS setting is enabled.
+Use `get_latency_stats` (or the `alertlatency` management command, or the staff-only
+`/api/alert/latency` endpoint) to read percentiles from the histograms.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+# Upper bounds (in seconds) of the histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = [
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+    1800,
+    3600,
+]
+LATENCY_PERCENTILES = [50, 95, 99]
+LATENCY_TTL = 60 * 60 * 24 * 30  # how long daily histograms are kept
+FLUSH_MAX_BUFFERED = 100
+FLUSH_MAX_SECONDS = 10
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def latency_key(metric, day):
+    return f"alert_latency:{day.isoformat()}:{metric}"
+
+
+def bucket_index(seconds):
+    return bisect.bisect_left(LATENCY_BUCKETS, seconds)
+
+
+def parse_timestamp(timestamp):
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return timestamp
+
+
+def record_latency(metric, seconds):
+    """
+    Buffers a latency observation (in seconds) for the given metric, flushing the buffer if it
+    is large or old enough.
+    """
+    global _last_flush
+    if not settings.ALERT_LATENCY_METRICS:
+        return
+    with _buffer_lock:
+        _buffer.append((metric, max(seconds, 0)))
+        should_flush = (
+            len(_buffer) >= FLUSH_MAX_BUFFERED
+            or time.monotonic() - _last_flush >= FLUSH_MAX_SECONDS
+        )
+    if should_flush:
+        flush_latencies()
+
+
+def record_latency_since(metric, since):
+    """
+    Buffers a latency observation for the given metric, from the given datetime (or ISO string)
+    until now. Does nothing if `since` is None.
+    """
+    since = parse_timestamp(since)
+    if since is None:
+        return
+    record_latency(metric, (timezone.now() - since).total_seconds())
+
+
+def record_channel_latency(channel, started, webhook_received_at=None):
+    """
+    Buffers the latencies of an alert successfully sent through the given channel, given the
+    `time.monotonic()` value when the channel started sending, and (if the alert was triggered
+    by a webhook) the datetime (or ISO string) at which the webhook was received.
+    """
+    record_latency(f"send:{channel}", time.monotonic() - started)
+    record_latency_since(f"end_to_end:{channel}", webhook_received_at)
+
+
+def flush_latencies():
+    """
+    Writes all buffered latency observations to their histograms, in a single request.
+    """
+    global _last_flush
+    with _buffer_lock:
+        observations = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if not observations:
+        return
+    counts = defaultdict(int)
+    sums = defaultdict(float)
+    for metric, seconds in observations:
+        counts[(metric, str(bucket_index(seconds)))] += 1
+        sums[metric] += seconds
+    day = timezone.now().date()
+    pipeline = r.pipeline(transaction=False)
+    for (metric, field), count in counts.items():
+        pipeline.hincrby(latency_key(metric, day), field, count)
+    for metric, total in sums.items():
+        pipeline.hincrbyfloat(latency_key(metric, day), "sum", total)
+        pipeline.expire(latency_key(metric, day), LATENCY_TTL)
+    try:
+        pipeline.execute()
+    except redis.exceptions.RedisError:
+        logger.exception("Error recording alert latencies")
+
+
+def histogram_percentile(bucket_counts, total, percentile):
+    """
+    Estimates the given percentile (0-100) from a list of bucket counts (corresponding to
+    `LATENCY_BUCKETS`, plus the unbounded last bucket), interpolating linearly within the
+    bucket containing the percentile. Returns None if the histogram is empty.
+    """
+    if not total:
+        return None
+    rank = total * percentile / 100
+    cumulative = 0
+    for i, count in enumerate(bucket_counts):
+        if count and cumulative + count >= rank:
+            lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0
+            if i == len(LATENCY_BUCKETS):
+                return lower  # the unbounded bucket; report its lower bound
+            return round(lower + (LATENCY_BUCKETS[i] - lower) * (rank - cumulative) / count, 4)
+        cumulative += count
+    return LATENCY_BUCKETS[-1]
+
+
+def get_latency_stats(days=1):
+    """
+    Returns a dict mapping each recorded metric to its count, mean, percentiles
+    (see `LATENCY_PERCENTILES`) and bucket counts, aggregated over the last `days` days
+    (including today).
+    """
+    today = timezone.now().date()
+    stats = dict()
+    for i in range(days):
+        day = today - timedelta(days=i)
+        prefix = latency_key("", day)
+        for key in r.scan_iter(match=prefix + "*"):
+            metric = key.decode().removeprefix(prefix)
+            histogram = stats.setdefault(
+                metric, {"sum": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+            )
+            for field, value in r.hgetall(key).items():
+                if field == b"sum":
+                    histogram["sum"] += float(value)
+                else:
+                    histogram["buckets"][int(field)] += int(value)
+
+    for metric, histogram in stats.items():
+        total = sum(histogram["buckets"])
+        stats[metric] = {
+            "count": total,
+            "mean": round(histogram["sum"] / total, 4) if total else None,
+            **{
+                f"p{p}": histogram_percentile(histogram["buckets"], total, p)
+                for p in LATENCY_PERCENTILES
+            },
+            "buckets": {
+                (f"<={bound}" if i < len(LATENCY_BUCKETS) else f">{LATENCY_BUCKETS[-1]}"): count
+                for i, (bound, count) in enumerate(
+                    zip(LATENCY_BUCKETS + [None], histogram["buckets"])
+                )
+            },
+        }
+    return dict(sorted(stats.items()))
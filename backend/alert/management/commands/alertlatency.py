@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from alert.latency import LATENCY_PERCENTILES, get_latency_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Print per-channel end-to-end alert latency percentiles, as well as queue wait times "
+        "(see alert/latency.py), aggregated over the last few days."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=1,
+            help="The number of days (including today) to aggregate latencies over.",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the stats (including bucket counts) as JSON.",
+        )
+
+    def handle(self, *args, **kwargs):
+        stats = get_latency_stats(days=kwargs["days"])
+        if kwargs["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        if not stats:
+            self.stdout.write("No alert latencies recorded.")
+            return
+        columns = ["count", "mean"] + [f"p{p}" for p in LATENCY_PERCENTILES]
+        width = max(len(metric) for metric in stats)
+        self.stdout.write("metric".ljust(width) + "".join(column.rjust(10) for column in columns))
+        for metric, metric_stats in stats.items():
+            self.stdout.write(
+                metric.ljust(width)
+                + "".join(str(metric_stats[column]).rjust(10) for column in columns)
+            )
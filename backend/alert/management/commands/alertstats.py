@@ -4,11 +4,9 @@ from textwrap import dedent
 import requests
 from django.conf import settings
 from django.core.management import BaseCommand
-from django.db.models import Q
 from django.utils import timezone
 
-from alert.models import Registration
-from courses.models import StatusUpdate
+from alert.models import get_alert_stats
 from courses.util import get_current_semester
 
 
@@ -16,7 +14,8 @@ class Command(BaseCommand):
     help = (
         "Get statistics on PCA, and optionally send to Slack (for analytics use only; do "
         "not confuse this script with the recompute_soft_state command, which actually updates "
-        "cached statistics)."
+        "cached statistics). Stats are read from the DailyAlertStats rollup, which is kept "
+        "up to date by the rollupalertstats command."
     )
 
     def add_arguments(self, parser):
@@ -27,44 +26,24 @@ class Command(BaseCommand):
         days = options["days"]
         send_to_slack = options["slack"]
 
-        start = timezone.now() - timezone.timedelta(days=days)
-
-        qs = Registration.objects.filter(section__course__semester=get_current_semester())
-
-        num_registrations = qs.filter(created_at__gte=start, resubscribed_from__isnull=True).count()
-        num_alerts_sent = qs.filter(notification_sent=True, notification_sent_at__gte=start).count()
-        num_resubscribe = qs.filter(
-            resubscribed_from__isnull=False,
-            created_at__gte=start,
-            auto_resubscribe=False,
-        ).count()
-        num_status_updates = StatusUpdate.objects.filter(created_at__gte=start).count()
-        num_active_perpetual = qs.filter(
-            resubscribed_to__isnull=True,
-            auto_resubscribe=True,
-            deleted=False,
-            cancelled=False,
-            notification_sent=False,
-        ).count()
-        num_cancelled_perpetual = (
-            qs.filter(
-                resubscribed_to__isnull=True,
-                auto_resubscribe=True,
-            )
-            .filter(Q(deleted=True) | Q(cancelled=True))
-            .count()
+        end_date = timezone.localdate()
+        start_date = end_date - timezone.timedelta(days=days - 1)
+        stats = get_alert_stats(get_current_semester(), start_date, end_date)
+        channels = " / ".join(
+            str(stats[field]) for field in ["emails_sent", "texts_sent", "push_notifications_sent"]
         )
 
         message = dedent(
             f"""
         {f'Penn Course Alert stats in the past {days} day(s)'
-         f' since {start.strftime("%H:%M on %d %B, %Y")}'}:
-        New registrations: {num_registrations}
-        Alerts sent: {num_alerts_sent}
-        Manual resubscribes: {num_resubscribe}
-        Active auto-resubscribe requests: {num_active_perpetual}
-        Cancelled auto-resubscribe requests: {num_cancelled_perpetual}
-        Status Updates from Penn InTouch: {num_status_updates}
+         f' since {start_date.strftime("%d %B, %Y")}'}:
+        New registrations: {stats["new_registrations"]}
+        Alerts sent: {stats["alerts_sent"]}
+        Emails / texts / push notifications sent: {channels}
+        Manual resubscribes: {stats["resubscribes"]}
+        Active auto-resubscribe requests: {stats["active_auto_resubscribe"]}
+        Cancelled auto-resubscribe requests: {stats["cancelled_auto_resubscribe"]}
+        Status Updates from Penn InTouch: {stats["status_updates"]}
         """
         )
 
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from alert.demand_index import check_section_demand_index, rebuild_section_demand_index
+from courses.util import get_current_semester
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the Redis section demand index (see alert/demand_index.py) with the DB, "
+        "printing any sections missing from the index, extra sections in the index, and "
+        "sections whose indexed raw demand differs from the DB. Exits with an error if the "
+        "index is inconsistent (unless --rebuild is passed, in which case it is rebuilt)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester to check (defaults to the current semester).",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rebuild the index from the DB if it is inconsistent.",
+        )
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        discrepancies = check_section_demand_index(semester)
+        self.stdout.write(json.dumps(discrepancies, indent=2))
+        if not any(ids for d in discrepancies.values() for ids in d.values()):
+            self.stdout.write(f"Section demand index for {semester} is consistent with the DB.")
+            return
+        if not kwargs["rebuild"]:
+            raise CommandError(f"Section demand index for {semester} is inconsistent with the DB.")
+        num_sections = rebuild_section_demand_index(semester)
+        self.stdout.write(f"Rebuilt section demand index for {semester} ({num_sections} sections).")
@@ -0,0 +1,54 @@
+import json
+import logging
+import socket
+
+from django.core.management.base import BaseCommand
+
+from alert.webhook_stream import consume_webhook_stream, get_webhook_stream_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Process status update webhooks queued in Redis by accept_webhook while the "
+        "WEBHOOK_INGEST_MODE Option is enabled (see alert/webhook_stream.py). "
+        "Run one consumer per stream shard (WEBHOOK_STREAM_SHARDS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shard", type=int, default=0, help="The stream shard to consume.")
+        parser.add_argument(
+            "--batch-size", type=int, default=100, help="Max entries per micro-batch."
+        )
+        parser.add_argument(
+            "--block-ms",
+            type=int,
+            default=5000,
+            help="How long to wait for new entries before polling again, in milliseconds.",
+        )
+        parser.add_argument(
+            "--consumer",
+            default=None,
+            help=(
+                "The consumer name (defaults to '{hostname}-{shard}'). Keep this stable across "
+                "restarts so unacknowledged entries are re-processed."
+            ),
+        )
+        parser.add_argument(
+            "--metrics",
+            action="store_true",
+            help="Print consumer lag / throughput metrics for all shards and exit.",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["metrics"]:
+            self.stdout.write(json.dumps(get_webhook_stream_metrics(), indent=2))
+            return
+        root_logger = logging.getLogger("")
+        root_logger.setLevel(logging.INFO)
+        shard = kwargs["shard"]
+        consume_webhook_stream(
+            shard=shard,
+            consumer=kwargs["consumer"] or f"{socket.gethostname()}-{shard}",
+            batch_size=kwargs["batch_size"],
+            block_ms=kwargs["block_ms"],
+        )
@@ -0,0 +1,94 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from alert.tasks import update_demand_distribution_estimate
+from courses.util import get_current_semester
+from PennCourses.settings.base import DEMAND_CHANGE_COALESCE_SECONDS
+
+
+def count_coalesced_recomputations(change_times, window):
+    """
+    Returns the number of demand distribution recomputations that
+    `schedule_demand_distribution_update` would run for demand changes at the given
+    (sorted) times, in seconds: the first change schedules a recomputation `window`
+    seconds later, which covers every change made before it runs.
+    """
+    if not window:
+        return len(change_times)
+    num_recomputations = 0
+    scheduled_at = None
+    for t in change_times:
+        if scheduled_at is None or t >= scheduled_at:
+            num_recomputations += 1
+            scheduled_at = t + window
+    return num_recomputations
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the time sections are locked by demand distribution recomputations during "
+        "a burst of demand changes (e.g. registrations created after a popular section "
+        "opens), comparing one recomputation per change with coalesced recomputations "
+        "(see schedule_demand_distribution_update). Runs against the current semester's "
+        "sections; all changes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--num-changes",
+            type=int,
+            default=200,
+            help="The number of demand changes in the simulated burst.",
+        )
+        parser.add_argument(
+            "--burst-seconds",
+            type=float,
+            default=60,
+            help="The length of the simulated burst, in seconds (changes are evenly spaced).",
+        )
+        parser.add_argument(
+            "--window",
+            type=float,
+            default=DEMAND_CHANGE_COALESCE_SECONDS,
+            help="The coalescing window, in seconds "
+            "(defaults to settings.DEMAND_CHANGE_COALESCE_SECONDS).",
+        )
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester to recompute (defaults to the current semester).",
+        )
+
+    def run_recomputations(self, semester, num_recomputations):
+        durations = []
+        with transaction.atomic():
+            for _ in range(num_recomputations):
+                start = time.perf_counter()
+                update_demand_distribution_estimate(semester, timezone.now())
+                durations.append(time.perf_counter() - start)
+            transaction.set_rollback(True)
+        return durations
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        num_changes = kwargs["num_changes"]
+        spacing = kwargs["burst_seconds"] / num_changes
+        change_times = [i * spacing for i in range(num_changes)]
+        num_coalesced = count_coalesced_recomputations(change_times, kwargs["window"])
+
+        for label, num_recomputations in [
+            ("per change", num_changes),
+            (f"coalesced ({kwargs['window']}s window)", num_coalesced),
+        ]:
+            durations = self.run_recomputations(semester, num_recomputations)
+            total = sum(durations)
+            self.stdout.write(
+                f"{label}: {num_recomputations} recomputations, sections locked for "
+                f"{total:.2f}s total ({total / len(durations) * 1000:.1f}ms each, "
+                f"{timedelta(seconds=kwargs['burst_seconds'])} burst)"
+            )
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import requests
+from aiohttp import web
+from django.core.management.base import BaseCommand
+
+from alert.alerts import dispatch_push_notifications
+
+
+class MockPushServer:
+    """
+    A local stand-in for the Penn Labs notifications API, which responds to every POST
+    with a 200 after `latency` seconds. Runs its own event loop in a background thread;
+    use it as a context manager, and send notifications to `server.url`.
+    """
+
+    def __init__(self, latency=0.05, status=200, port=0):
+        self.latency = latency
+        self.status = status
+        self.port = port
+        self.received = []
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    async def handle(self, request):
+        self.received.append(dict(await request.post()))
+        await asyncio.sleep(self.latency)
+        return web.Response(status=self.status)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        app = web.Application()
+        app.router.add_post("/notifications/send/internal", self.handle)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", self.port)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/notifications/send/internal"
+
+    def __enter__(self):
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def __exit__(self, *args):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark push notification throughput against a local mock notifications API, "
+        "comparing sequential requests (one blocking request per registration, as in "
+        "PushNotification.send_alert) with the concurrent dispatch_push_notifications."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--num-pushes", type=int, default=500, help="The number of notifications to send."
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="Simulated response latency of the mock server, in seconds.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Max in-flight requests (defaults to settings.PUSH_NOTIFICATION_CONCURRENCY).",
+        )
+        parser.add_argument(
+            "--skip-sequential",
+            action="store_true",
+            help="Don't run the (slow) sequential baseline.",
+        )
+
+    def handle(self, *args, **kwargs):
+        num_pushes = kwargs["num_pushes"]
+        notifications = [
+            (f"pennkey{i}", "CIS-1200-001 is now open!", "Register on Path@Penn")
+            for i in range(num_pushes)
+        ]
+
+        with MockPushServer(latency=kwargs["latency"]) as server:
+            if not kwargs["skip_sequential"]:
+                start = time.perf_counter()
+                for pennkey, title, body in notifications:
+                    requests.post(
+                        server.url, data={"title": title, "body": body, "pennkey": pennkey}
+                    )
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"sequential: {num_pushes} pushes in {elapsed:.2f}s "
+                    f"({num_pushes / elapsed:.1f} pushes/sec)"
+                )
+
+            start = time.perf_counter()
+            results = dispatch_push_notifications(
+                notifications, concurrency=kwargs["concurrency"], url=server.url
+            )
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"concurrent: {sum(bool(r) for r in results)}/{num_pushes} pushes in "
+                f"{elapsed:.2f}s ({num_pushes / elapsed:.1f} pushes/sec)"
+            )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from alert.status_cache import rebuild_status_cache
+from courses.util import get_current_semester
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the Redis section status cache used to reject duplicate status update "
+        "webhooks (see alert/status_cache.py) from the last status update of each section."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester to rebuild (defaults to the current semester).",
+        )
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        num_sections = rebuild_status_cache(semester)
+        self.stdout.write(f"Cached the last status of {num_sections} sections in {semester}.")
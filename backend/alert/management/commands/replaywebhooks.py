@@ -0,0 +1,431 @@
+import ast
+import base64
+import json
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from celery.app.task import Task
+from dateutil.parser import isoparse
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from options.models import Option
+
+from alert import alerts
+from alert.management.commands.pushbenchmark import MockPushServer
+from alert.models import Registration
+from alert.queues import DEFAULT_QUEUE, QUEUE_PRIORITY_ORDER, get_task_queue
+from alert.views import accept_webhook
+from courses.models import Section, StatusUpdate
+from courses.util import get_current_semester, percentile, update_open_activities
+
+
+# Options that make the webhook path write to Redis, which the replay's rollback can't undo
+REDIS_OPTIONS = ["WEBHOOK_INGEST_MODE", "SECTION_DEMAND_INDEX"]
+# The module-level Redis clients of the alert path (replaced with an in-memory Redis)
+REDIS_CLIENTS = [
+    "alert.demand_index.r",
+    "alert.latency.r",
+    "alert.models.r",
+    "alert.queues.r",
+    "alert.status_cache.r",
+    "alert.tasks.r",
+    "alert.webhook_stream.r",
+    "courses.code_index.r",
+]
+
+
+class MockSMTP:
+    """
+    A local stand-in for `smtplib.SMTP` (used by `SMTPConnectionPool`), which accepts every
+    message after `latency` seconds. Sent messages are appended to `sent`.
+    """
+
+    def __init__(self, sent, latency):
+        self.sent = sent
+        self.latency = latency
+
+    def __call__(self, host, port, timeout=None):
+        return self  # stands in for the SMTP constructor
+
+    def ehlo(self):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def send_message(self, msg):
+        time.sleep(self.latency)
+        self.sent.append(msg["To"])
+
+    def quit(self):
+        pass
+
+
+class MockTwilioClient:
+    """
+    A local stand-in for the Twilio client, which accepts every text after `latency` seconds.
+    Sent texts are appended to `sent`.
+    """
+
+    def __init__(self, sent, latency):
+        self.sent = sent
+        self.latency = latency
+        self.messages = self
+
+    def create(self, to, from_, body):
+        time.sleep(self.latency)
+        self.sent.append(to)
+        return SimpleNamespace(sid=f"SM{len(self.sent)}")
+
+
+class LocalBroker:
+    """
+    A local stand-in for the Celery broker: while active (as a context manager), tasks sent
+    with `delay` / `apply_async` are queued in memory, and run by `run_next`. Tasks are routed
+    to queues as they would be by Celery (see alert/queues.py), and `run_next` runs the next
+    task from the first non-empty queue in `queue_order` (as a worker consuming its queues in
+    priority order would); if `queue_order` is None, all tasks are run in the order they
+    were sent.
+    """
+
+    def __init__(self, queue_order=QUEUE_PRIORITY_ORDER):
+        self.queue_order = queue_order
+        self.queues = defaultdict(deque)
+        self.tasks_run = 0
+        self.task_errors = 0
+
+    def apply_async(self, task, args=None, kwargs=None, **options):
+        args, kwargs = args or (), kwargs or {}
+        queue = None
+        if self.queue_order is not None:
+            queue = options.get("queue") or get_task_queue(task.name, args, kwargs)
+        self.queues[queue or DEFAULT_QUEUE].append((task, args, kwargs))
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def run_next(self):
+        order = self.queue_order or []
+        queue = next(
+            queue
+            for queue in order + [q for q in self.queues if q not in order]
+            if self.queues[queue]
+        )
+        task, args, kwargs = self.queues[queue].popleft()
+        try:
+            task(*args, **kwargs)
+        except Exception:
+            self.task_errors += 1
+        self.tasks_run += 1
+
+    def __enter__(self):
+        broker = self
+        self.patcher = patch.object(
+            Task,
+            "apply_async",
+            lambda task, args=None, kwargs=None, **options: broker.apply_async(
+                task, args, kwargs, **options
+            ),
+        )
+        self.patcher.start()
+        return self
+
+    def __exit__(self, *args):
+        self.patcher.stop()
+
+
+class QueryCounter:
+    """
+    Counts the DB queries executed while installed (via `connection.execute_wrapper`).
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the alert path by replaying a semester's status update webhooks (from the "
+        "request bodies stored on its StatusUpdates) against accept_webhook, at real or "
+        "accelerated speed. Celery tasks are queued in memory and run between webhooks, and "
+        "emails, texts and push notifications are sent to local stand-ins. Reports webhook "
+        "latency percentiles, DB queries per webhook, Celery queue depth and alerts/sec. "
+        "Section statuses and registrations are reset to their state at the start of the "
+        "replayed window (approximately), and all changes are rolled back. Redis is replaced "
+        "with an in-memory fake (requires fakeredis), and the Redis-backed status cache, latency "
+        "metrics, webhook ingest mode and section demand index are turned off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester to replay (defaults to the current semester).",
+        )
+        parser.add_argument(
+            "--start",
+            type=isoparse,
+            default=None,
+            help="Only replay webhooks received at or after this ISO datetime.",
+        )
+        parser.add_argument(
+            "--end",
+            type=isoparse,
+            default=None,
+            help="Only replay webhooks received before this ISO datetime.",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=None, help="The max number of webhooks to replay."
+        )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=0,
+            help=(
+                "How many times faster than real time to replay webhooks (e.g. 1 for real "
+                "time, 60 for an hour per minute); 0 (the default) replays as fast as possible."
+            ),
+        )
+        parser.add_argument(
+            "--no-alerts",
+            action="store_true",
+            help="Don't send alerts (by default, alerts are sent for every opening/closing).",
+        )
+        parser.add_argument(
+            "--email-latency",
+            type=float,
+            default=0.05,
+            help="Simulated latency of the SMTP stand-in, in seconds.",
+        )
+        parser.add_argument(
+            "--text-latency",
+            type=float,
+            default=0.1,
+            help="Simulated latency of the Twilio stand-in, in seconds.",
+        )
+        parser.add_argument(
+            "--text-rate",
+            type=float,
+            default=settings.TWILIO_SENDS_PER_SECOND,
+            help="Texts sent per second (defaults to settings.TWILIO_SENDS_PER_SECOND).",
+        )
+        parser.add_argument(
+            "--push-latency",
+            type=float,
+            default=0.05,
+            help="Simulated latency of the push notification API stand-in, in seconds.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def get_request_body(self, status_update):
+        """
+        Returns the raw webhook body for the given status update. `request_body` is stored as
+        the `str` of the webhook's body (so bytes bodies look like "b'{...}'"); if it can't be
+        parsed, the body is reconstructed from the status update's fields.
+        """
+        body = status_update.request_body
+        if body[:2] in ("b'", 'b"'):
+            try:
+                body = ast.literal_eval(body)
+            except (ValueError, SyntaxError):
+                pass
+        if isinstance(body, str):
+            body = body.encode()
+        try:
+            if "section_id_normalized" in json.loads(body):
+                return body
+        except (json.JSONDecodeError, TypeError, UnicodeDecodeError):
+            pass
+        return json.dumps(
+            {
+                "section_id_normalized": status_update.section.full_code,
+                "previous_status": status_update.old_status,
+                "status": status_update.new_status,
+                "term": status_update.section.semester,
+            }
+        ).encode()
+
+    def reset_to(self, semester, status_updates):
+        """
+        Resets the DB to (approximately) its state when the first of the given status updates
+        was received: status updates from then on are deleted, each section's status is set
+        to the previous status of its first replayed update, and registrations alerted since
+        are marked as not yet alerted (registrations created since are left as they are).
+        The options in REDIS_OPTIONS are turned off.
+        """
+        for key in REDIS_OPTIONS:
+            Option.objects.update_or_create(
+                key=key, defaults={"value": "false", "value_type": Option.TYPE_BOOL}
+            )
+        start = status_updates[0].created_at
+        first_updates = dict()
+        for u in status_updates:
+            first_updates.setdefault(u.section_id, u)
+        StatusUpdate.objects.filter(
+            section__course__semester=semester, created_at__gte=start
+        ).delete()
+        sections = Section.objects.filter(id__in=first_updates.keys())
+        for section in sections:
+            section.status = first_updates[section.id].old_status
+        Section.objects.bulk_update(sections, ["status"])
+        update_open_activities({section.course_id for section in sections})
+        registrations = Registration.objects.filter(section__course__semester=semester)
+        registrations.filter(notification_sent_at__gte=start).update(
+            notification_sent=False, notification_sent_at=None, notification_sent_by=""
+        )
+        registrations.filter(close_notification_sent_at__gte=start).update(
+            close_notification_sent=False,
+            close_notification_sent_at=None,
+            close_notification_sent_by="",
+        )
+
+    def replay(self, status_updates, speed, broker):
+        factory = RequestFactory()
+        auth = base64.standard_b64encode(
+            f"{settings.WEBHOOK_USERNAME}:{settings.WEBHOOK_PASSWORD}".encode()
+        ).decode()
+        request_counter = QueryCounter()
+        latencies, queries, queue_depths = [], [], []
+        first_received_at = status_updates[0].created_at
+        start = time.perf_counter()
+        for u in status_updates:
+            due = start + (
+                (u.created_at - first_received_at).total_seconds() / speed if speed else 0
+            )
+            # Run queued tasks until the next webhook is due (as a worker would)
+            while broker and time.perf_counter() < due:
+                broker.run_next()
+            if time.perf_counter() < due:
+                time.sleep(due - time.perf_counter())
+
+            request = factory.post(
+                "/api/alert/webhook",
+                data=self.get_request_body(u),
+                content_type="application/json",
+                HTTP_AUTHORIZATION=f"Basic {auth}",
+            )
+            queries_before = request_counter.count
+            request_start = time.perf_counter()
+            with connection.execute_wrapper(request_counter):
+                accept_webhook(request)
+            latencies.append(time.perf_counter() - request_start)
+            queries.append(request_counter.count - queries_before)
+            queue_depths.append(len(broker))
+            if not speed:
+                while broker:
+                    broker.run_next()
+        while broker:
+            broker.run_next()
+        return time.perf_counter() - start, latencies, queries, queue_depths
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        status_updates = StatusUpdate.objects.filter(
+            section__course__semester=semester
+        ).select_related("section")
+        if kwargs["start"]:
+            status_updates = status_updates.filter(created_at__gte=kwargs["start"])
+        if kwargs["end"]:
+            status_updates = status_updates.filter(created_at__lt=kwargs["end"])
+        status_updates = list(status_updates.order_by("created_at")[: kwargs["limit"]])
+        if not status_updates:
+            raise CommandError(f"No status updates to replay for semester {semester}.")
+        try:
+            import fakeredis
+        except ImportError:
+            raise CommandError("replaywebhooks requires fakeredis (pip install fakeredis).")
+
+        emails, texts = [], []
+        twilio_client = MockTwilioClient(texts, kwargs["text_latency"])
+        sms_queue = alerts.SMSQueue(
+            client_factory=lambda: twilio_client,
+            rate=kwargs["text_rate"],
+            burst=settings.TWILIO_SEND_BURST,
+        )
+        task_counter = QueryCounter()
+        with ExitStack() as stack:
+            server = stack.enter_context(MockPushServer(latency=kwargs["push_latency"]))
+            stack.enter_context(
+                override_settings(
+                    PUSH_NOTIFICATION_URL=server.url,
+                    WEBHOOK_STATUS_CACHE=False,
+                    ALERT_LATENCY_METRICS=False,
+                )
+            )
+            fake_redis = fakeredis.FakeRedis()
+            for client in REDIS_CLIENTS:
+                stack.enter_context(patch(client, fake_redis))
+            stack.enter_context(
+                patch("alert.alerts.SMTP", MockSMTP(emails, kwargs["email_latency"]))
+            )
+            stack.enter_context(patch("alert.alerts._smtp_pool", None))
+            stack.enter_context(patch("alert.alerts._sms_queue", sms_queue))
+            stack.enter_context(patch("alert.alerts._sms_queue_pid", os.getpid()))
+            stack.enter_context(
+                patch(
+                    "alert.views.should_send_pca_alert",
+                    lambda course_term, course_status: (
+                        not kwargs["no_alerts"] and course_status in ["O", "C"]
+                    ),
+                )
+            )
+            broker = stack.enter_context(LocalBroker())
+            with transaction.atomic():
+                self.reset_to(semester, status_updates)
+                replay_started_at = timezone.now()
+                with connection.execute_wrapper(task_counter):
+                    elapsed, latencies, queries, queue_depths = self.replay(
+                        status_updates, kwargs["speed"], broker
+                    )
+                alerts_sent = Registration.objects.filter(
+                    notification_sent_at__gte=replay_started_at
+                ).count()
+                transaction.set_rollback(True)
+            pushes = len(server.received)
+
+        report = {
+            "webhooks": len(status_updates),
+            "elapsed_seconds": round(elapsed, 3),
+            "webhooks_per_second": round(len(status_updates) / elapsed, 1),
+            "webhook_latency_ms": {
+                f"p{p}": round(percentile(latencies, p) * 1000, 2) for p in [50, 95, 99]
+            },
+            "queries_per_webhook": {
+                "mean": round(sum(queries) / len(queries), 1),
+                "p95": percentile(queries, 95),
+                "max": max(queries),
+            },
+            "queries_per_alert_task": (
+                round((task_counter.count - sum(queries)) / broker.tasks_run, 1)
+                if broker.tasks_run
+                else None
+            ),
+            "queue_depth": {"p50": percentile(queue_depths, 50), "max": max(queue_depths)},
+            "tasks_run": broker.tasks_run,
+            "task_errors": broker.task_errors,
+            "alerts_sent": alerts_sent,
+            "alerts_per_second": round(alerts_sent / elapsed, 1),
+            "emails": len(emails),
+            "texts": len(texts),
+            "push_notifications": pushes,
+        }
+        if kwargs["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for key, value in report.items():
+            self.stdout.write(f"{key}: {value}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from alert.models import rollup_alert_stats
+from courses.util import get_current_semester
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the DailyAlertStats rollup (read by the alertstats command and the "
+        "alert stats endpoint) for the last few days, from the Registration and StatusUpdate "
+        "tables, and add the per-channel alert counts recorded in Redis since the last run. "
+        "Run periodically to keep the rollup up to date."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=2,
+            help="The number of days (including today) to recompute.",
+        )
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester to recompute (defaults to the current semester).",
+        )
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        rollups = rollup_alert_stats(semester, days=max(kwargs["days"], 1))
+        self.stdout.write(f"Rolled up alert stats for {len(rollups)} days in {semester}.")
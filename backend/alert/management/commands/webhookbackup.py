@@ -1,5 +1,6 @@
 import logging
 
+from django.core.exceptions import ValidationError
 from django.core.management.base import BaseCommand
 from tqdm import tqdm
 
@@ -10,9 +11,9 @@ from courses import registrar
 from courses.util import (
     get_course_and_section,
     get_current_semester,
-    record_update,
+    record_updates_bulk,
     translate_semester_inv,
-    update_course_from_record,
+    validate_status,
 )
 
 
@@ -42,6 +43,8 @@ class Command(BaseCommand):
             "error": 0,
             "skipped": 0,
         }
+        status_updates = []
+        last_queued_statuses = dict()  # section id -> the new status of its last queued update
         for status in tqdm(statuses):
             data = status
             section_code = data.get("section_id_normalized")
@@ -69,9 +72,20 @@ class Command(BaseCommand):
                 stats["section_not_found"] += 1
                 continue
 
-            # Ignore duplicate updates
-            last_status_update = section.last_status_update
-            if last_status_update and last_status_update.new_status == course_status:
+            # Ignore invalid updates (before sending any alerts for them)
+            try:
+                validate_status("Old status", course_previous_status)
+                validate_status("New status", course_status)
+            except ValidationError:
+                stats["error"] += 1
+                continue
+
+            # Ignore duplicate updates (including of updates queued earlier in this run)
+            last_status = last_queued_statuses.get(section.id)
+            if last_status is None:
+                last_status_update = section.last_status_update
+                last_status = last_status_update and last_status_update.new_status
+            if last_status == course_status:
                 stats["duplicate_updates"] += 1
                 continue
 
@@ -90,14 +104,17 @@ class Command(BaseCommand):
                     stats["parse_error"] += 1
             else:
                 stats["skipped"] += 1
-            u = record_update(
-                section,
-                course_term,
-                course_previous_status,
-                course_status,
-                alert_for_course_called,
-                data,
+            last_queued_statuses[section.id] = course_status
+            status_updates.append(
+                (
+                    section,
+                    course_previous_status,
+                    course_status,
+                    None,
+                    data,
+                    alert_for_course_called,
+                )
             )
-            update_course_from_record(u)
 
+        record_updates_bulk(status_updates, semester)
         print(stats)
@@ -0,0 +1,108 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("alert", "0017_alter_registration_head_registration"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyAlertStats",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "date",
+                    models.DateField(help_text="The day (in the local time zone) of these stats."),
+                ),
+                (
+                    "semester",
+                    models.CharField(
+                        db_index=True,
+                        help_text="\nThe semester of these stats (of the form YYYYx where x is A [for spring],\nB [summer], or C [fall]), e.g. `2019C` for fall 2019.\n",
+                        max_length=5,
+                    ),
+                ),
+                (
+                    "new_registrations",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of new (not resubscribed) registrations created.",
+                    ),
+                ),
+                (
+                    "alerts_sent",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of registrations an opening alert was sent for.",
+                    ),
+                ),
+                (
+                    "resubscribes",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of manual (not auto-resubscribe) resubscribes.",
+                    ),
+                ),
+                (
+                    "status_updates",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of status updates received for the semester's sections.",
+                    ),
+                ),
+                (
+                    "active_auto_resubscribe",
+                    models.IntegerField(
+                        default=0,
+                        help_text="\nThe number of active auto-resubscribe requests, as of the last time these stats\nwere rolled up on this day.\n",
+                    ),
+                ),
+                (
+                    "cancelled_auto_resubscribe",
+                    models.IntegerField(
+                        default=0,
+                        help_text="\nThe number of cancelled (or deleted) auto-resubscribe requests, as of the last time\nthese stats were rolled up on this day.\n",
+                    ),
+                ),
+                (
+                    "emails_sent",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of alert emails (including close notifications) sent.",
+                    ),
+                ),
+                (
+                    "texts_sent",
+                    models.IntegerField(default=0, help_text="The number of alert texts sent."),
+                ),
+                (
+                    "push_notifications_sent",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of alert push notifications (including close notifications) sent.",
+                    ),
+                ),
+                (
+                    "close_notifications_sent",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The number of registrations a close notification was sent for.",
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name_plural": "daily alert stats",
+                "unique_together": {("date", "semester")},
+            },
+        ),
+    ]
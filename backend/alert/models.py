@@ -1,20 +1,24 @@
 import logging
+import time
 from datetime import datetime
 from enum import Enum, auto
 from textwrap import dedent
 
 import phonenumbers  # library for parsing and formatting phone numbers.
+import redis
 from dateutil.tz import gettz
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import Case, F, Max, Q, Value, When
-from django.db.models.functions import Extract
+from django.db.models import Case, Count, F, Max, Q, Sum, Value, When
+from django.db.models.functions import Extract, TruncDate
 from django.utils import timezone
 from django.utils.timezone import make_aware
 
 from alert.alerts import Email, PushNotification, Text
+from alert.latency import record_channel_latency
 from courses.models import Course, Section, StatusUpdate, UserProfile, string_dict_to_html
 from courses.util import (
     does_object_pass_filter,
@@ -25,6 +29,9 @@ from courses.util import (
 from PennCourses.settings.base import TIME_ZONE
 
 
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+
 class RegStatus(Enum):
     SUCCESS = auto()
     OPEN_REG_EXISTS = auto()
@@ -490,7 +497,8 @@ class Registration(models.Model):
         and `current_demand_distribution_estimate` cache are asynchronously updated
         (via a celery task) to reflect the resulting section demand change.
         """
-        from alert.tasks import section_demand_change
+        from alert.demand_index import update_section_demand_index
+        from alert.tasks import schedule_demand_distribution_update
         from courses.util import get_set_id, is_fk_set
 
         # ^ imported here to avoid circular imports
@@ -542,11 +550,29 @@ class Registration(models.Model):
                 if volume_change > 0 or section.registration_volume >= 1:
                     section.registration_volume += volume_change
                     section.save()
-                section_demand_change.delay(section.id, self.updated_at)
-
-    def alert(self, forced=False, sent_by="", close_notification=False):
+                    update_section_demand_index(section)
+                schedule_demand_distribution_update(section.semester, self.updated_at)
+
+    def alert(
+        self,
+        forced=False,
+        sent_by="",
+        close_notification=False,
+        rendered_templates=None,
+        push_results=None,
+        webhook_received_at=None,
+    ):
         """
         Returns true iff an alert was successfully sent through at least one medium to the user.
+        If `rendered_templates` is given (see `alert.alerts.render_alert_templates`), the
+        pre-rendered alert texts are used rather than rendering the templates again.
+        If `push_results` is given, it should map registration ids to the results of push
+        notifications already sent for those registrations (e.g. by
+        `alert.alerts.dispatch_push_notifications`); a push notification is not sent again
+        for registrations with a result in this dict.
+        If `webhook_received_at` is given (the datetime or ISO string at which the webhook
+        triggering this alert was received), end-to-end latencies are recorded for each channel
+        (see alert/latency.py).
         """
 
         if not forced:
@@ -561,21 +587,37 @@ class Registration(models.Model):
         text_result = False
         if not push_notification and not close_notification:
             # never send close notifications by text
-            text_result = Text(self).send_alert(close_notification=close_notification)
+            started = time.monotonic()
+            text_result = Text(self, rendered_templates=rendered_templates).send_alert(
+                close_notification=close_notification
+            )
+            if text_result:
+                record_channel_latency("text", started, webhook_received_at)
             if text_result is None:
                 logging.debug(
                     "ERROR OCCURRED WHILE ATTEMPTING TEXT NOTIFICATION FOR " + self.__str__()
                 )
-        email_result = Email(self).send_alert(close_notification=close_notification)
+        started = time.monotonic()
+        email_result = Email(self, rendered_templates=rendered_templates).send_alert(
+            close_notification=close_notification
+        )
+        if email_result:
+            record_channel_latency("email", started, webhook_received_at)
         if email_result is None:
             logging.debug(
                 "ERROR OCCURRED WHILE ATTEMPTING EMAIL NOTIFICATION FOR " + self.__str__()
             )
         push_notif_result = False
-        if push_notification:
-            push_notif_result = PushNotification(self).send_alert(
-                close_notification=close_notification
-            )
+        if push_notification and push_results is not None and self.id in push_results:
+            # already sent (and its latency recorded) by dispatch_batch_push_notifications
+            push_notif_result = push_results[self.id]
+        elif push_notification:
+            started = time.monotonic()
+            push_notif_result = PushNotification(
+                self, rendered_templates=rendered_templates
+            ).send_alert(close_notification=close_notification)
+            if push_notif_result:
+                record_channel_latency("push", started, webhook_received_at)
             if push_notif_result is None:
                 logging.debug(
                     "ERROR OCCURRED WHILE ATTEMPTING PUSH NOTIFICATION FOR " + self.__str__()
@@ -583,6 +625,13 @@ class Registration(models.Model):
         if not email_result and not text_result and not push_notif_result:
             logging.debug("ALERT CALLED BUT NOTIFICATION NOT SENT FOR " + self.__str__())
             return False
+        record_alerts_sent(
+            self.section.semester,
+            emails_sent=int(bool(email_result)),
+            texts_sent=int(bool(text_result)),
+            push_notifications_sent=int(bool(push_notif_result)),
+            close_notifications_sent=int(close_notification),
+        )
         if not close_notification:
             logging.debug("NOTIFICATION SENT FOR " + self.__str__())
             self.notification_sent = True
@@ -883,6 +932,259 @@ class PcaDemandDistributionEstimate(models.Model):
         return f"PcaDemandDistributionEstimate {self.semester} @ {self.created_at}"
 
 
+class DailyAlertStats(models.Model):
+    """
+    Pre-aggregated PCA statistics for one day (in the local time zone) and semester, so that
+    stats over any date range (e.g. for the alertstats command) can be read from a few rows,
+    rather than by counting over the Registration and StatusUpdate tables.
+    Counters that can be derived from those tables are (re)computed by `rollup_alert_stats`
+    (run periodically by the rollupalertstats command). Per-channel alert counts can't be, so
+    they are counted in Redis by `Registration.alert` as alerts are sent (see
+    `record_alerts_sent`), and added to these stats by `rollup_alert_stats`.
+    """
+
+    date = models.DateField(help_text="The day (in the local time zone) of these stats.")
+    semester = models.CharField(
+        max_length=5,
+        db_index=True,
+        help_text=dedent(
+            """
+        The semester of these stats (of the form YYYYx where x is A [for spring],
+        B [summer], or C [fall]), e.g. `2019C` for fall 2019.
+        """
+        ),
+    )
+
+    new_registrations = models.IntegerField(
+        default=0, help_text="The number of new (not resubscribed) registrations created."
+    )
+    alerts_sent = models.IntegerField(
+        default=0, help_text="The number of registrations an opening alert was sent for."
+    )
+    resubscribes = models.IntegerField(
+        default=0, help_text="The number of manual (not auto-resubscribe) resubscribes."
+    )
+    status_updates = models.IntegerField(
+        default=0, help_text="The number of status updates received for the semester's sections."
+    )
+    active_auto_resubscribe = models.IntegerField(
+        default=0,
+        help_text=dedent(
+            """
+        The number of active auto-resubscribe requests, as of the last time these stats
+        were rolled up on this day.
+        """
+        ),
+    )
+    cancelled_auto_resubscribe = models.IntegerField(
+        default=0,
+        help_text=dedent(
+            """
+        The number of cancelled (or deleted) auto-resubscribe requests, as of the last time
+        these stats were rolled up on this day.
+        """
+        ),
+    )
+    emails_sent = models.IntegerField(
+        default=0, help_text="The number of alert emails (including close notifications) sent."
+    )
+    texts_sent = models.IntegerField(default=0, help_text="The number of alert texts sent.")
+    push_notifications_sent = models.IntegerField(
+        default=0,
+        help_text="The number of alert push notifications (including close notifications) sent.",
+    )
+    close_notifications_sent = models.IntegerField(
+        default=0, help_text="The number of registrations a close notification was sent for."
+    )
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (("date", "semester"),)
+        verbose_name_plural = "daily alert stats"
+
+    def __str__(self):
+        return f"DailyAlertStats {self.semester} @ {self.date}"
+
+
+DAILY_ALERT_STATS_COUNTERS = [
+    "new_registrations",
+    "alerts_sent",
+    "resubscribes",
+    "status_updates",
+    "active_auto_resubscribe",
+    "cancelled_auto_resubscribe",
+    "emails_sent",
+    "texts_sent",
+    "push_notifications_sent",
+    "close_notifications_sent",
+]
+# Counters reflecting the state at rollup time, rather than counts of events on each day
+DAILY_ALERT_STATS_SNAPSHOTS = ["active_auto_resubscribe", "cancelled_auto_resubscribe"]
+
+
+# Per-channel alert counts not yet added to DailyAlertStats expire after this many seconds
+# (if rollup_alert_stats isn't run for that long)
+ALERT_STATS_COUNTS_TTL = 60 * 60 * 24 * 7
+
+
+def alert_stats_counts_key(semester, date):
+    return f"daily_alert_stats:{semester}:{date.isoformat()}"
+
+
+def record_alerts_sent(semester, **counts):
+    """
+    Increments the given per-channel counters (e.g. `emails_sent=1`) of today's alert stats
+    for the given semester, in a Redis hash (so concurrent alert workers don't contend for
+    the same DailyAlertStats row). The counts are added to DailyAlertStats by
+    `rollup_alert_stats`. If Redis is unreachable, the DailyAlertStats row is updated directly.
+    """
+    counts = {field: count for field, count in counts.items() if count}
+    if not counts:
+        return
+    key = alert_stats_counts_key(semester, timezone.localdate())
+    pipeline = r.pipeline()
+    for field, count in counts.items():
+        pipeline.hincrby(key, field, count)
+    pipeline.expire(key, ALERT_STATS_COUNTS_TTL)
+    try:
+        pipeline.execute()
+        return
+    except redis.exceptions.RedisError:
+        logging.exception("Error recording alert stats in Redis")
+    stats, _ = DailyAlertStats.objects.get_or_create(date=timezone.localdate(), semester=semester)
+    DailyAlertStats.objects.filter(id=stats.id).update(
+        **{field: F(field) + count for field, count in counts.items()}
+    )
+
+
+def fold_alert_stats_counts(semester, date):
+    """
+    Adds the per-channel counts recorded in Redis by `record_alerts_sent` for the given semester
+    and date to its DailyAlertStats (which must exist), and subtracts them from Redis once the
+    current transaction commits (so counts recorded in the meantime are kept).
+    """
+    key = alert_stats_counts_key(semester, date)
+    counts = {field.decode(): int(count) for field, count in r.hgetall(key).items() if int(count)}
+    if not counts:
+        return
+    DailyAlertStats.objects.filter(date=date, semester=semester).update(
+        **{field: F(field) + count for field, count in counts.items()}
+    )
+
+    def subtract_folded_counts():
+        pipeline = r.pipeline()
+        for field, count in counts.items():
+            pipeline.hincrby(key, field, -count)
+        try:
+            pipeline.execute()
+        except redis.exceptions.RedisError:
+            logging.exception(f"Error subtracting folded alert stats for {date} from Redis")
+
+    transaction.on_commit(subtract_folded_counts)
+
+
+def rollup_alert_stats(semester, days=2):
+    """
+    (Re)computes the counters of the given semester's DailyAlertStats derived from the
+    Registration and StatusUpdate tables, for the last `days` days (including today), in one
+    grouped query per counter. Snapshot counters (`DAILY_ALERT_STATS_SNAPSHOTS`) are only set
+    for today. Per-channel counts recorded in Redis since the last rollup are then added (see
+    `fold_alert_stats_counts`). Returns the updated DailyAlertStats objects (without the
+    per-channel counters).
+    """
+    today = timezone.localdate()
+    dates = [today - timezone.timedelta(days=i) for i in range(days)]
+    start = make_aware(datetime.combine(dates[-1], datetime.min.time()))
+    registrations = Registration.objects.filter(section__course__semester=semester)
+
+    def count_by_day(qs, field):
+        return dict(
+            qs.filter(**{f"{field}__gte": start})
+            .annotate(day=TruncDate(field))
+            .values("day")
+            .annotate(count=Count("id"))
+            .values_list("day", "count")
+        )
+
+    counts = {
+        "new_registrations": count_by_day(
+            registrations.filter(resubscribed_from__isnull=True), "created_at"
+        ),
+        "alerts_sent": count_by_day(
+            registrations.filter(notification_sent=True), "notification_sent_at"
+        ),
+        "resubscribes": count_by_day(
+            registrations.filter(resubscribed_from__isnull=False, auto_resubscribe=False),
+            "created_at",
+        ),
+        "status_updates": count_by_day(
+            StatusUpdate.objects.filter(section__course__semester=semester), "created_at"
+        ),
+    }
+    perpetual = registrations.filter(resubscribed_to__isnull=True, auto_resubscribe=True)
+    snapshots = perpetual.aggregate(
+        active_auto_resubscribe=Count(
+            "id", filter=Q(deleted=False, cancelled=False, notification_sent=False)
+        ),
+        cancelled_auto_resubscribe=Count("id", filter=Q(deleted=True) | Q(cancelled=True)),
+    )
+
+    rollups = []
+    for date in dates:
+        stats = DailyAlertStats(date=date, semester=semester)
+        for field, counts_by_day in counts.items():
+            setattr(stats, field, counts_by_day.get(date, 0))
+        if date == today:
+            for field, count in snapshots.items():
+                setattr(stats, field, count)
+        rollups.append(stats)
+    with transaction.atomic():
+        # Per-channel counters are left out of the upsert, so previously folded counts are kept
+        # (and snapshot counters of past days aren't overwritten with today's values)
+        DailyAlertStats.objects.bulk_create(
+            [stats for stats in rollups if stats.date != today],
+            update_conflicts=True,
+            unique_fields=["date", "semester"],
+            update_fields=list(counts),
+        )
+        DailyAlertStats.objects.bulk_create(
+            [stats for stats in rollups if stats.date == today],
+            update_conflicts=True,
+            unique_fields=["date", "semester"],
+            update_fields=list(counts) + DAILY_ALERT_STATS_SNAPSHOTS,
+        )
+        for date in dates:
+            try:
+                fold_alert_stats_counts(semester, date)
+            except redis.exceptions.RedisError:
+                # The counts stay in Redis, to be folded by the next rollup
+                logging.exception(f"Error reading alert stats for {date} from Redis")
+    return rollups
+
+
+def get_alert_stats(semester, start_date, end_date):
+    """
+    Returns a dict of the given semester's DailyAlertStats counters summed over the given date
+    range (inclusive), with snapshot counters taken from the latest day in the range.
+    """
+    stats = DailyAlertStats.objects.filter(
+        semester=semester, date__gte=start_date, date__lte=end_date
+    )
+    totals = stats.aggregate(
+        **{
+            field: Sum(field)
+            for field in DAILY_ALERT_STATS_COUNTERS
+            if field not in DAILY_ALERT_STATS_SNAPSHOTS
+        }
+    )
+    latest = stats.order_by("-date").values(*DAILY_ALERT_STATS_SNAPSHOTS).first() or dict()
+    return {
+        field: (latest if field in DAILY_ALERT_STATS_SNAPSHOTS else totals).get(field) or 0
+        for field in DAILY_ALERT_STATS_COUNTERS
+    }
+
+
 def validate_add_drop_semester(semester):
     """
     Validate the passed-in string as a fall or spring semester, such as 2020A or 2021C.
@@ -983,6 +1285,7 @@ class AddDropPeriod(models.Model):
         fields of StatusUpdates and PcaDemandDistributionEstimates from this semester, and then
         calls the overridden save method.
         """
+        from alert.queues import enqueue_background_task
         from alert.tasks import recompute_percent_open_async  # avoid circular import
 
         with transaction.atomic():
@@ -1021,7 +1324,7 @@ class AddDropPeriod(models.Model):
                     ),
                 )
             super().save()
-            recompute_percent_open_async.delay(self.semester)
+            enqueue_background_task(recompute_percent_open_async, (self.semester,))
 
     def estimate_start(self):
         """
@@ -0,0 +1,116 @@
+"""
+Celery queues and routing for PCA tasks.
+
+Time-critical alert tasks are routed to their own queues, ahead of background recomputations:
+- `OPEN_ALERTS_QUEUE`: alerts for sections that have opened
+- `CLOSE_ALERTS_QUEUE`: close notifications
+- `BACKGROUND_QUEUE`: demand distribution and percent open recomputations (and other bulk
+  updates), which can safely run late
+Tasks not listed in `TASK_QUEUES` go to Celery's default queue.
+
+Workers consume their queues in `QUEUE_PRIORITY_ORDER` (see the `queue_order_strategy` broker
+transport option in settings), so an alert is never stuck behind background work on the same
+queue. Background tasks should run on their own worker (see k8s/main.ts), so they can't take up
+the alert worker's concurrency either.
+
+Background tasks should be enqueued with `enqueue_background_task`, which applies an admission
+policy: while the alert backlog exceeds ALERT_BACKLOG_THRESHOLD, background tasks are deferred
+by BACKGROUND_TASK_DEFER_SECONDS, and identical background tasks already deferred are shed.
+"""
+
+import logging
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+OPEN_ALERTS_QUEUE = "alerts"
+CLOSE_ALERTS_QUEUE = "alerts_close"
+DEFAULT_QUEUE = "celery"
+BACKGROUND_QUEUE = "background"
+ALERT_QUEUES = [OPEN_ALERTS_QUEUE, CLOSE_ALERTS_QUEUE]
+QUEUE_PRIORITY_ORDER = [OPEN_ALERTS_QUEUE, CLOSE_ALERTS_QUEUE, DEFAULT_QUEUE, BACKGROUND_QUEUE]
+
+# Maps each task name to its queue, or to a function of the task's args and kwargs returning
+# its queue (for tasks sending both open alerts and close notifications)
+TASK_QUEUES = {
+    "pca.tasks.send_alert": lambda args, kwargs: alert_queue(
+        kwargs.get("close_notification", args[1] if len(args) > 1 else False)
+    ),
+    "pca.tasks.send_alert_batch": lambda args, kwargs: alert_queue(
+        kwargs.get("close_notification", args[1] if len(args) > 1 else False)
+    ),
+    "pca.tasks.send_course_alerts": lambda args, kwargs: alert_queue(
+        kwargs.get("course_status", args[1] if len(args) > 1 else None) == "C"
+    ),
+    "pca.tasks.send_course_alerts_batched": lambda args, kwargs: alert_queue(
+        kwargs.get("course_status", args[1] if len(args) > 1 else None) == "C"
+    ),
+    "pca.tasks.recompute_percent_open": BACKGROUND_QUEUE,
+    "pca.tasks.recompute_demand_distribution_estimate": BACKGROUND_QUEUE,
+    "pca.tasks.registration_update": BACKGROUND_QUEUE,
+    "pca.tasks.run_course_updates": BACKGROUND_QUEUE,
+}
+
+
+def alert_queue(close_notification):
+    return CLOSE_ALERTS_QUEUE if close_notification else OPEN_ALERTS_QUEUE
+
+
+def get_task_queue(name, args=(), kwargs=None):
+    """
+    Returns the queue the given task (by name) should be sent to, or None for the default queue.
+    """
+    queue = TASK_QUEUES.get(name)
+    if callable(queue):
+        return queue(args or (), kwargs or {})
+    return queue
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    A Celery task router (see the CELERY_TASK_ROUTES setting), routing tasks by `TASK_QUEUES`.
+    """
+    queue = get_task_queue(name, args, kwargs)
+    return {"queue": queue} if queue is not None else None
+
+
+def get_alert_backlog():
+    """
+    Returns the number of alert tasks waiting in the broker's alert queues,
+    or 0 if the broker can't be reached.
+    """
+    try:
+        pipeline = r.pipeline(transaction=False)
+        for queue in ALERT_QUEUES:
+            pipeline.llen(queue)
+        return sum(pipeline.execute())
+    except redis.exceptions.RedisError:
+        logger.exception("Error reading alert backlog")
+        return 0
+
+
+def enqueue_background_task(task, args=(), countdown=None, coalesce_args=None):
+    """
+    Enqueues the given background task (with the given args), unless the admission policy sheds
+    it. Does nothing special unless the ALERT_BACKLOG_THRESHOLD setting is set; if it is, and
+    more than that many alert tasks are waiting, the task is deferred by
+    BACKGROUND_TASK_DEFER_SECONDS, and dropped if a task with the same name and `coalesce_args`
+    was already deferred within that time (since it will do the same work). `coalesce_args`
+    should be the args which determine the task's work (e.g. excluding per-event timestamps),
+    and defaults to all the args. Returns the task's AsyncResult, or None if the task was shed.
+    """
+    threshold = settings.ALERT_BACKLOG_THRESHOLD
+    if threshold is not None and get_alert_backlog() > threshold:
+        defer = settings.BACKGROUND_TASK_DEFER_SECONDS
+        if coalesce_args is None:
+            coalesce_args = args
+        if not cache.add(f"deferred_task:{task.name}:{coalesce_args}", True, timeout=defer):
+            logger.info(f"Alert backlog over {threshold}, shed {task.name}{args}")
+            return None
+        countdown = max(countdown or 0, defer)
+    return task.apply_async(args=args, countdown=countdown)
@@ -0,0 +1,115 @@
+"""
+A Redis cache of the last known status of each section, used by `process_webhook_data` to
+reject duplicate status update webhooks (e.g. registrar retries, or Path@Penn resync storms)
+without querying the DB. Enabled by the WEBHOOK_STATUS_CACHE setting.
+
+For each section, the cache stores the section's status as of its last recorded status update,
+and a hash of that update's request body. A webhook whose body hash matches is a retry of the
+update that set the current status, and is ignored; a webhook whose status matches (but whose
+body doesn't) is rejected as a duplicate, as it would be by the `last_status_update` check.
+Since only the last update's body hash is stored, a payload identical to an earlier update
+(e.g. after the section flip-flops back to a previous status) is not mistaken for a retry.
+
+The cache is written when the transaction recording a status update commits (see
+`record_update` and `record_updates_bulk`), entries expire after WEBHOOK_STATUS_CACHE_TTL
+seconds (bounding staleness if a write is ever lost), and the cache can be rebuilt from the DB
+with `rebuild_status_cache` (or the `rebuildstatuscache` management command). A section with
+no cache entry falls back to the DB check.
+"""
+
+import hashlib
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from courses.models import StatusUpdate
+
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+
+def status_cache_key(semester, section_code):
+    return f"section_status:{semester}:{section_code}"
+
+
+def payload_hash(request_body):
+    """
+    Hashes a status update's request body, as it is stored in `StatusUpdate.request_body`
+    (a TextField, so e.g. a raw bytes request body is stored as its `str`), so that hashes
+    computed from incoming webhooks match those rebuilt from the DB.
+    """
+    return hashlib.sha256(str(request_body).encode()).hexdigest()
+
+
+def get_cached_status(semester, section_code):
+    """
+    Returns a tuple `(status, payload_hash)` for the last recorded status update of the given
+    section, or None if the section isn't cached (or the cache is unreachable).
+    """
+    try:
+        cached = r.hgetall(status_cache_key(semester, section_code))
+    except redis.exceptions.RedisError:
+        logger.exception("Error reading section status cache")
+        return None
+    if not cached or b"status" not in cached:
+        return None
+    return cached[b"status"].decode(), cached.get(b"payload", b"").decode()
+
+
+def set_cached_statuses(entries):
+    """
+    Caches the given `(semester, section_code, status, request_body)` entries, each of which
+    should correspond to the last recorded status update of its section.
+    If the cache can't be written, the entries are deleted instead (so they aren't left stale).
+    """
+    pipeline = r.pipeline()
+    for semester, section_code, status, request_body in entries:
+        key = status_cache_key(semester, section_code)
+        pipeline.hset(key, mapping={"status": status, "payload": payload_hash(request_body)})
+        pipeline.expire(key, settings.WEBHOOK_STATUS_CACHE_TTL)
+    try:
+        pipeline.execute()
+    except redis.exceptions.RedisError:
+        logger.exception("Error writing section status cache")
+        try:
+            r.delete(*[status_cache_key(semester, code) for semester, code, _, _ in entries])
+        except redis.exceptions.RedisError:
+            logger.exception("Error invalidating section status cache")
+
+
+def cache_statuses_on_commit(status_updates):
+    """
+    Caches the statuses set by the given StatusUpdate objects (in order, so later updates to
+    the same section win) once the current transaction commits. Does nothing unless the
+    WEBHOOK_STATUS_CACHE setting is enabled.
+    """
+    if not settings.WEBHOOK_STATUS_CACHE or not status_updates:
+        return
+    entries = {
+        u.section.full_code: (u.section.semester, u.section.full_code, u.new_status, u.request_body)
+        for u in status_updates
+    }
+    transaction.on_commit(lambda: set_cached_statuses(list(entries.values())))
+
+
+def rebuild_status_cache(semester):
+    """
+    Rebuilds the cache for the given semester from the last status update of each section.
+    Returns the number of sections cached.
+    """
+    last_status_updates = (
+        StatusUpdate.objects.filter(section__course__semester=semester)
+        .order_by("section_id", "-created_at")
+        .distinct("section_id")
+        .values_list("section__full_code", "new_status", "request_body")
+    )
+    entries = [
+        (semester, section_code, status, request_body)
+        for section_code, status, request_body in last_status_updates
+    ]
+    if entries:
+        set_cached_statuses(entries)
+    return len(entries)
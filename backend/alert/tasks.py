@@ -1,4 +1,6 @@
 import logging
+import time
+import uuid
 from datetime import datetime
 
 import numpy as np
@@ -10,8 +12,19 @@ from django.core.cache import cache
 from django.db import models, transaction
 from django.db.models import Case, Q, When
 from django.db.models.functions import Cast
+from django.utils import timezone
 
+from alert.alerts import PushNotification, dispatch_push_notifications, render_alert_templates
+from alert.demand_index import (
+    demand_index_enabled,
+    demand_index_is_stale,
+    get_closed_section_demands,
+    get_demand_extremes,
+    rebuild_section_demand_index,
+)
+from alert.latency import flush_latencies, record_channel_latency, record_latency_since
 from alert.models import PcaDemandDistributionEstimate, Registration
+from alert.queues import enqueue_background_task
 from courses.management.commands.recompute_soft_state import recompute_percent_open
 from courses.models import Section, StatusUpdate
 from courses.util import (
@@ -20,7 +33,11 @@ from courses.util import (
     get_or_create_add_drop_period,
     update_course_from_record,
 )
-from PennCourses.settings.base import ROUGH_MINIMUM_DEMAND_DISTRIBUTION_ESTIMATES
+from PennCourses.settings.base import (
+    ALERT_FANOUT_CHUNK_SIZE,
+    DEMAND_CHANGE_COALESCE_SECONDS,
+    ROUGH_MINIMUM_DEMAND_DISTRIBUTION_ESTIMATES,
+)
 from review.views import extra_metrics_section_filters
 
 
@@ -40,30 +57,244 @@ def run_course_updates(semester=None):
 
 
 @shared_task(name="pca.tasks.send_alert")
-def send_alert(reg_id, close_notification, sent_by=""):
+def send_alert(reg_id, close_notification, sent_by="", webhook_received_at=None, enqueued_at=None):
+    record_latency_since("queue_wait:send_alert", enqueued_at)
     result = Registration.objects.get(id=reg_id).alert(
-        sent_by=sent_by, close_notification=close_notification
+        sent_by=sent_by,
+        close_notification=close_notification,
+        webhook_received_at=webhook_received_at,
     )
+    flush_latencies()
     return {"result": result, "task": "pca.tasks.send_alert"}
 
 
-def get_registrations_for_alerts(course_code, semester, course_status="O"):
-    _, section = get_course_and_section(course_code, semester)
+def registrations_for_alerts_queryset(section, course_status="O"):
     if course_status == "O":
-        return list(section.registrations.filter(**Registration.is_active_filter()))
+        return section.registrations.filter(**Registration.is_active_filter())
     elif course_status == "C":
-        return list(section.registrations.filter(**Registration.is_waiting_for_close_filter()))
+        return section.registrations.filter(**Registration.is_waiting_for_close_filter())
     else:
-        return []
+        return Registration.objects.none()
+
+
+def get_registrations_for_alerts(course_code, semester, course_status="O"):
+    _, section = get_course_and_section(course_code, semester)
+    return list(registrations_for_alerts_queryset(section, course_status=course_status))
 
 
 @shared_task(name="pca.tasks.send_course_alerts")
-def send_course_alerts(course_code, course_status, semester=None, sent_by=""):
+def send_course_alerts(
+    course_code, course_status, semester=None, sent_by="", webhook_received_at=None
+):
+    record_latency_since("queue_wait:send_course_alerts", webhook_received_at)
     if semester is None:
         semester = get_current_semester()
 
     for reg in get_registrations_for_alerts(course_code, semester, course_status=course_status):
-        send_alert.delay(reg.id, close_notification=(course_status == "C"), sent_by=sent_by)
+        send_alert.delay(
+            reg.id,
+            close_notification=(course_status == "C"),
+            sent_by=sent_by,
+            webhook_received_at=webhook_received_at,
+            enqueued_at=timezone.now().isoformat(),
+        )
+    flush_latencies()
+
+
+def alert_fanout_cache_key(fanout_id, stat=""):
+    return f"alert_fanout_{fanout_id}" + (f"_{stat}" if stat else "")
+
+
+@shared_task(name="pca.tasks.send_course_alerts_batched")
+def send_course_alerts_batched(
+    course_code, course_status, semester=None, sent_by="", webhook_received_at=None
+):
+    """
+    A batched alternative to `send_course_alerts` (used by `alert_for_course` in alert/views.py
+    when the BATCH_ALERT_FANOUT Option is True). Rather than enqueueing one `send_alert` task
+    per registration (each of which re-fetches its registration and re-renders the same alert
+    templates), this task renders each alert template once for the section, and dispatches
+    `send_alert_batch` tasks over chunks of `ALERT_FANOUT_CHUNK_SIZE` registrations.
+    Each chunk loads its registrations (with sections, users and profiles) in a single query.
+
+    Throughput stats for the fan-out are recorded in cache, and can be retrieved with
+    `get_alert_fanout_stats` (they are also logged once the last chunk finishes).
+
+    :param webhook_received_at: the datetime (or ISO string) at which the webhook triggering
+        these alerts was received, used to report the time from webhook to last alert.
+    """
+    record_latency_since("queue_wait:send_course_alerts", webhook_received_at)
+    if semester is None:
+        semester = get_current_semester()
+    if isinstance(webhook_received_at, datetime):
+        webhook_received_at = webhook_received_at.isoformat()
+
+    _, section = get_course_and_section(course_code, semester)
+    reg_ids = list(
+        registrations_for_alerts_queryset(section, course_status=course_status)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    if not reg_ids:
+        return {"result": 0, "task": "pca.tasks.send_course_alerts_batched"}
+
+    rendered_templates = render_alert_templates(section)
+    fanout_id = uuid.uuid4().hex
+    cache.set(
+        alert_fanout_cache_key(fanout_id),
+        {
+            "section": section.full_code,
+            "course_status": course_status,
+            "total": len(reg_ids),
+            "webhook_received_at": webhook_received_at,
+            "started_at": timezone.now().isoformat(),
+        },
+        timeout=60 * 60 * 24,
+    )
+    for stat in ["processed", "sent"]:
+        cache.set(alert_fanout_cache_key(fanout_id, stat), 0, timeout=60 * 60 * 24)
+
+    for chunk_start in range(0, len(reg_ids), ALERT_FANOUT_CHUNK_SIZE):
+        chunk_end = chunk_start + ALERT_FANOUT_CHUNK_SIZE
+        send_alert_batch.delay(
+            reg_ids[chunk_start:chunk_end],
+            close_notification=(course_status == "C"),
+            sent_by=sent_by,
+            rendered_templates=rendered_templates,
+            fanout_id=fanout_id,
+            webhook_received_at=webhook_received_at,
+            enqueued_at=timezone.now().isoformat(),
+        )
+    flush_latencies()
+    return {
+        "result": len(reg_ids),
+        "fanout_id": fanout_id,
+        "task": "pca.tasks.send_course_alerts_batched",
+    }
+
+
+@shared_task(name="pca.tasks.send_alert_batch")
+def send_alert_batch(
+    reg_ids,
+    close_notification,
+    sent_by="",
+    rendered_templates=None,
+    fanout_id=None,
+    webhook_received_at=None,
+    enqueued_at=None,
+):
+    """
+    Sends alerts for the given registrations (a chunk dispatched by `send_course_alerts_batched`),
+    loading all of them in one query. Push notifications for the chunk are sent concurrently
+    (see `dispatch_batch_push_notifications`) before the other channels.
+    """
+    record_latency_since("queue_wait:send_alert", enqueued_at)
+    registrations = list(
+        Registration.objects.filter(id__in=reg_ids).select_related(
+            "section__course", "user__profile", "head_registration"
+        )
+    )
+    push_results = dispatch_batch_push_notifications(
+        registrations,
+        close_notification,
+        rendered_templates=rendered_templates,
+        webhook_received_at=webhook_received_at,
+    )
+    sent_ids = []
+    for reg in registrations:
+        if reg.alert(
+            sent_by=sent_by,
+            close_notification=close_notification,
+            rendered_templates=rendered_templates,
+            push_results=push_results,
+            webhook_received_at=webhook_received_at,
+        ):
+            sent_ids.append(reg.id)
+    if fanout_id is not None:
+        record_alert_fanout_progress(fanout_id, processed=len(reg_ids), sent=len(sent_ids))
+    flush_latencies()
+    return {"result": sent_ids, "task": "pca.tasks.send_alert_batch"}
+
+
+def dispatch_batch_push_notifications(
+    registrations, close_notification, rendered_templates=None, webhook_received_at=None
+):
+    """
+    Concurrently sends push notifications to all of the given registrations that would send
+    a push notification from `Registration.alert`, and returns a dict mapping registration id
+    to push notification result (which can be passed to `Registration.alert` as `push_results`).
+    The latency of each successful push notification is recorded as that of the whole dispatch.
+    """
+    payloads = dict()
+    for reg in registrations:
+        if not (reg.is_waiting_for_close if close_notification else reg.is_active):
+            continue
+        payload = PushNotification(reg, rendered_templates=rendered_templates).get_payload(
+            close_notification=close_notification
+        )
+        if payload is not None:
+            payloads[reg.id] = payload
+    started = time.monotonic()
+    results = dispatch_push_notifications(list(payloads.values()))
+    for result in results:
+        if result:
+            record_channel_latency("push", started, webhook_received_at)
+    return dict(zip(payloads.keys(), results))
+
+
+def record_alert_fanout_progress(fanout_id, processed, sent):
+    """
+    Updates the cached stats of the given alert fan-out after a chunk of alerts has been sent,
+    and logs the fan-out's throughput once all of its chunks have been processed.
+    """
+    cache.set(
+        alert_fanout_cache_key(fanout_id, "last_alert_at"),
+        timezone.now().isoformat(),
+        timeout=60 * 60 * 24,
+    )
+    try:
+        cache.incr(alert_fanout_cache_key(fanout_id, "sent"), sent)
+        total_processed = cache.incr(alert_fanout_cache_key(fanout_id, "processed"), processed)
+    except ValueError:
+        return  # Fan-out stats expired (or the cache backend doesn't store values)
+    stats = get_alert_fanout_stats(fanout_id)
+    if stats is not None and total_processed >= stats["total"]:
+        logger.info(
+            f"Alert fan-out for {stats['section']} finished: {stats['sent']}/{stats['total']} "
+            f"alerts sent ({stats['alerts_per_second']} alerts/sec, "
+            f"{stats['seconds_webhook_to_last_alert']}s from webhook to last alert)"
+        )
+
+
+def get_alert_fanout_stats(fanout_id):
+    """
+    Returns a dict of stats for the given alert fan-out (see `send_course_alerts_batched`),
+    or None if no stats are cached for that fan-out. In addition to the values stored when the
+    fan-out started, the dict includes the number of `processed` / `sent` alerts so far,
+    `alerts_per_second` (from the start of the fan-out to the last alert sent),
+    and `seconds_webhook_to_last_alert` (None if the webhook receipt time is unknown).
+    """
+    stats = cache.get(alert_fanout_cache_key(fanout_id))
+    if stats is None:
+        return None
+    stats["processed"] = cache.get(alert_fanout_cache_key(fanout_id, "processed"), 0)
+    stats["sent"] = cache.get(alert_fanout_cache_key(fanout_id, "sent"), 0)
+    stats["alerts_per_second"] = None
+    stats["seconds_webhook_to_last_alert"] = None
+    last_alert_at = cache.get(alert_fanout_cache_key(fanout_id, "last_alert_at"))
+    if last_alert_at is not None:
+        last_alert_at = datetime.fromisoformat(last_alert_at)
+        elapsed = (last_alert_at - datetime.fromisoformat(stats["started_at"])).total_seconds()
+        if elapsed > 0:
+            stats["alerts_per_second"] = round(stats["sent"] / elapsed, 2)
+        if stats["webhook_received_at"] is not None:
+            stats["seconds_webhook_to_last_alert"] = round(
+                (
+                    last_alert_at - datetime.fromisoformat(stats["webhook_received_at"])
+                ).total_seconds(),
+                3,
+            )
+    return stats
 
 
 @shared_task(name="pca.tasks.recompute_percent_open")
@@ -71,27 +302,204 @@ def recompute_percent_open_async(semester):
     recompute_percent_open(semesters=[semester])
 
 
+def demand_change_cache_key(semester, suffix):
+    return f"demand_change_{suffix}_{semester}"
+
+
+def enqueue_demand_distribution_recompute(semester, updated_at, countdown=None):
+    # Under an alert backlog, a recompute is shed if one for the same semester is already
+    # deferred (regardless of updated_at), since it will recompute from the same demand.
+    enqueue_background_task(
+        recompute_demand_distribution_estimate,
+        (semester, updated_at),
+        countdown=countdown,
+        coalesce_args=(semester,),
+    )
+
+
+def schedule_demand_distribution_update(semester, updated_at):
+    """
+    This function should be called when a section's demand changes (i.e. the number of
+    active registrations changes, or the section's status is updated). Rather than
+    recomputing the demand distribution estimate for every such change (each recomputation
+    locks every section in the semester), changes are coalesced: the first change in a
+    semester schedules a `recompute_demand_distribution_estimate` task to run
+    `DEMAND_CHANGE_COALESCE_SECONDS` later, and subsequent changes before that task runs
+    only record their `updated_at` in Redis (the task uses the latest one). If Redis can't be
+    reached, the recomputation is enqueued immediately instead.
+
+    :param: semester: the semester of the section involved in the demand change
+    :param: updated_at: the datetime at which the demand change occurred
+    """
+    if semester != get_current_semester():
+        return
+    window = DEMAND_CHANGE_COALESCE_SECONDS
+    if not window:
+        enqueue_demand_distribution_recompute(semester, updated_at)
+        return
+
+    latest_key = demand_change_cache_key(semester, "latest_updated_at")
+    try:
+        pipeline = r.pipeline()
+        # ZADD GT only ever raises the score, so concurrent changes keep the latest updated_at
+        pipeline.zadd(latest_key, {"updated_at": updated_at.timestamp()}, gt=True)
+        pipeline.expire(latest_key, window * 10)
+        # SET NX is atomic, so only one recomputation is scheduled per window. The key expires
+        # (in case the scheduled task is lost) well after the task should have run.
+        pipeline.set(demand_change_cache_key(semester, "scheduled"), 1, nx=True, ex=window * 10)
+        scheduled = pipeline.execute()[-1]
+    except redis.exceptions.RedisError:
+        logger.exception("Error coalescing demand change, recomputing without coalescing")
+        enqueue_demand_distribution_recompute(semester, updated_at)
+        return
+    if scheduled:
+        enqueue_demand_distribution_recompute(semester, updated_at, countdown=window)
+
+
+@shared_task(name="pca.tasks.recompute_demand_distribution_estimate")
+def recompute_demand_distribution_estimate(semester, updated_at):
+    """
+    Recomputes the demand distribution estimate for the given semester, on behalf of all the
+    demand changes coalesced since this task was scheduled
+    (see `schedule_demand_distribution_update`).
+
+    :param: semester: the semester for which to recompute the demand distribution estimate
+    :param: updated_at: the datetime of the demand change that scheduled this task
+    """
+    updated_at = parse_updated_at(updated_at)
+    if updated_at is None:
+        return
+    # Clear the scheduled flag as the latest change is read (atomically), so any change made
+    # after this point schedules another recomputation, rather than being missed.
+    latest_key = demand_change_cache_key(semester, "latest_updated_at")
+    try:
+        pipeline = r.pipeline()
+        pipeline.delete(demand_change_cache_key(semester, "scheduled"))
+        pipeline.zscore(latest_key, "updated_at")
+        pipeline.delete(latest_key)
+        _, latest_timestamp, _ = pipeline.execute()
+    except redis.exceptions.RedisError:
+        logger.exception("Error reading coalesced demand changes")
+        latest_timestamp = None
+    if latest_timestamp is not None:
+        updated_at = max(updated_at, datetime.fromtimestamp(latest_timestamp, tz=updated_at.tzinfo))
+    if semester != get_current_semester():
+        return
+    update_demand_distribution_estimate(semester, updated_at)
+
+
 @shared_task(name="pca.tasks.registration_update")
 def section_demand_change(section_id, updated_at):
     """
-    This function should be called when a section's demand changes (i.e. the number of
-    active registrations changes, or the section's status is updated). It updates the
-    `PcaDemandDistributionEstimate` model and `current_demand_distribution_estimate`
-    cache to reflect the demand change.
+    Immediately updates the `PcaDemandDistributionEstimate` model and
+    `current_demand_distribution_estimate` cache to reflect a demand change in the given
+    section. Superseded by `schedule_demand_distribution_update` (which coalesces demand
+    changes); kept so that already-queued tasks can still run.
 
     :param: section_id: the id of the section involved in the demand change
     :param: updated_at: the datetime at which the demand change occurred
     """
-    if type(updated_at) is str:
-        updated_at = datetime.fromisoformat(updated_at.replace("Z", "+00:00"))
-    elif type(updated_at) is not datetime:
+    updated_at = parse_updated_at(updated_at)
+    if updated_at is None:
         return
 
     section = Section.objects.get(id=section_id)
     semester = section.semester
     if semester != get_current_semester():
         return
+    update_demand_distribution_estimate(semester, updated_at)
+
+
+def parse_updated_at(updated_at):
+    if type(updated_at) is str:
+        return datetime.fromisoformat(updated_at.replace("Z", "+00:00"))
+    elif type(updated_at) is not datetime:
+        return None
+    return updated_at
+
+
+def get_locked_demand_stats(semester):
+    """
+    Returns a tuple `(lowest_demand_section, highest_demand_section, get_closed_demand_values)`
+    for the given semester (each section annotated with its `raw_demand`, and the last element
+    a function returning a numpy array of closed sections' raw demand values), computed from
+    the DB while locking the semester's sections. Returns None if there are no valid sections.
+    Must be called inside a transaction.
+    """
+    sections_qs = (
+        Section.objects.filter(extra_metrics_section_filters, course__semester=semester)
+        .select_for_update()
+        .annotate(
+            raw_demand=Case(
+                When(
+                    Q(capacity__gt=0),
+                    then=(
+                        Cast(
+                            "registration_volume",
+                            models.FloatField(),
+                        )
+                        / Cast("capacity", models.FloatField())
+                    ),
+                ),
+                default=None,
+                output_field=models.FloatField(),
+            ),
+        )
+    )
+
+    try:
+        lowest_demand_section = sections_qs.order_by("raw_demand")[:1].get()
+        highest_demand_section = sections_qs.order_by("-raw_demand")[:1].get()
+    except Section.DoesNotExist:
+        return None
+
+    def get_closed_demand_values():
+        return np.asarray(sections_qs.filter(status="C").values_list("raw_demand", flat=True))
 
+    return lowest_demand_section, highest_demand_section, get_closed_demand_values
+
+
+def get_indexed_demand_stats(semester):
+    """
+    Same as `get_locked_demand_stats`, but reads raw demand from the Redis section demand index
+    (see `alert.demand_index`), without locking any sections. Returns None if the index is
+    empty, unreachable, or references sections that no longer exist (in which case the caller
+    should fall back to `get_locked_demand_stats`). If the index is marked stale (see
+    `demand_index_is_stale`), it is rebuilt first.
+    """
+    try:
+        if demand_index_is_stale(semester):
+            rebuild_section_demand_index(semester)
+        demand_extremes = get_demand_extremes(semester)
+    except redis.exceptions.RedisError:
+        logger.exception("Error reading section demand index")
+        return None
+    if demand_extremes is None:
+        return None
+    (lowest_id, lowest_demand), (highest_id, highest_demand) = demand_extremes
+    sections = Section.objects.in_bulk([lowest_id, highest_id])
+    if lowest_id not in sections or highest_id not in sections:
+        return None
+    lowest_demand_section, highest_demand_section = sections[lowest_id], sections[highest_id]
+    lowest_demand_section.raw_demand = lowest_demand
+    highest_demand_section.raw_demand = highest_demand
+    return (
+        lowest_demand_section,
+        highest_demand_section,
+        lambda: get_closed_section_demands(semester),
+    )
+
+
+def update_demand_distribution_estimate(semester, updated_at):
+    """
+    Updates the `PcaDemandDistributionEstimate` model and `current_demand_distribution_estimate`
+    cache to reflect the current demand of sections in the given semester. Raw demand is read
+    from the section demand index if the SECTION_DEMAND_INDEX Option is enabled, and otherwise
+    computed from the DB, locking the semester's sections for the duration of the update.
+
+    :param: semester: the semester for which to update the demand distribution estimate
+    :param: updated_at: the datetime at which the (latest) demand change occurred
+    """
     with transaction.atomic():
         create_new_distribution_estimate = False
         sentinel = object()
@@ -104,32 +512,12 @@ def section_demand_change(section_id, updated_at):
         ):
             create_new_distribution_estimate = True
 
-        sections_qs = (
-            Section.objects.filter(extra_metrics_section_filters, course__semester=semester)
-            .select_for_update()
-            .annotate(
-                raw_demand=Case(
-                    When(
-                        Q(capacity__gt=0),
-                        then=(
-                            Cast(
-                                "registration_volume",
-                                models.FloatField(),
-                            )
-                            / Cast("capacity", models.FloatField())
-                        ),
-                    ),
-                    default=None,
-                    output_field=models.FloatField(),
-                ),
-            )
-        )
-
-        try:
-            lowest_demand_section = sections_qs.order_by("raw_demand")[:1].get()
-            highest_demand_section = sections_qs.order_by("-raw_demand")[:1].get()
-        except Section.DoesNotExist:
+        demand_stats = get_indexed_demand_stats(semester) if demand_index_enabled() else None
+        if demand_stats is None:
+            demand_stats = get_locked_demand_stats(semester)
+        if demand_stats is None:
             return  # Don't add a PcaDemandDistributionEstimate -- there are no valid sections yet
+        lowest_demand_section, highest_demand_section, get_closed_demand_values = demand_stats
 
         if (
             create_new_distribution_estimate
@@ -138,9 +526,7 @@ def section_demand_change(section_id, updated_at):
             or lowest_demand_section.raw_demand
             < current_demand_distribution_estimate.lowest_raw_demand
         ):
-            closed_sections_demand_values = np.asarray(
-                sections_qs.filter(status="C").values_list("raw_demand", flat=True)
-            )
+            closed_sections_demand_values = get_closed_demand_values()
             # "The term 'closed sections positive raw demand values' is
             # sometimes abbreviated as 'csprdv'
             csrdv_frac_zero, fit_shape, fit_loc, fit_scale = (None, None, None, None)
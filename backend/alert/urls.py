@@ -11,5 +11,7 @@ router.register(r"registrationhistory", RegistrationHistoryViewSet, basename="re
 
 urlpatterns = [
     path("webhook", views.accept_webhook, name="webhook"),
+    path("latency", views.alert_latency, name="alert-latency"),
+    path("stats", views.alert_stats, name="alert-stats"),
     path("", include(router.urls)),
 ]
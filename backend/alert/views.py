@@ -1,6 +1,8 @@
 import base64
 import json
 import logging
+from datetime import date
+from functools import partial
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
@@ -10,22 +12,36 @@ from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django_auto_prefetching import AutoPrefetchViewSetMixin
+from options.models import get_bool
+from redis.exceptions import RedisError
 from rest_framework import status, viewsets
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, permission_classes, schema
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
-from alert.models import Registration, RegStatus, register_for_course
+from alert.latency import get_latency_stats
+from alert.models import (
+    DAILY_ALERT_STATS_COUNTERS,
+    DailyAlertStats,
+    Registration,
+    RegStatus,
+    get_alert_stats,
+    register_for_course,
+)
 from alert.serializers import (
     RegistrationCreateSerializer,
     RegistrationSerializer,
     RegistrationUpdateSerializer,
 )
-from alert.tasks import send_course_alerts
+from alert.status_cache import get_cached_status, payload_hash
+from alert.tasks import send_course_alerts, send_course_alerts_batched
 from alert.util import pca_registration_open, should_send_pca_alert
+from alert.webhook_stream import enqueue_webhook
 from courses.util import (
     get_current_semester,
     get_or_create_course_and_section,
     record_update,
+    separate_course_code,
     translate_semester_inv,
     update_course_from_record,
 )
@@ -35,8 +51,23 @@ from PennCourses.docs_settings import PcxAutoSchema
 logger = logging.getLogger(__name__)
 
 
-def alert_for_course(c_id, semester, sent_by, course_status):
-    send_course_alerts.delay(c_id, course_status=course_status, semester=semester, sent_by=sent_by)
+def alert_for_course(c_id, semester, sent_by, course_status, webhook_received_at=None):
+    if get_bool("BATCH_ALERT_FANOUT", False):
+        send_course_alerts_batched.delay(
+            c_id,
+            course_status=course_status,
+            semester=semester,
+            sent_by=sent_by,
+            webhook_received_at=webhook_received_at and webhook_received_at.isoformat(),
+        )
+    else:
+        send_course_alerts.delay(
+            c_id,
+            course_status=course_status,
+            semester=semester,
+            sent_by=sent_by,
+            webhook_received_at=webhook_received_at and webhook_received_at.isoformat(),
+        )
 
 
 def extract_basic_auth(auth_header):
@@ -57,6 +88,7 @@ def extract_basic_auth(auth_header):
 
 @csrf_exempt
 def accept_webhook(request):
+    received_at = timezone.now()
     auth_header = request.META.get("Authorization", request.META.get("HTTP_AUTHORIZATION", ""))
 
     username, password = extract_basic_auth(auth_header)
@@ -83,6 +115,24 @@ def accept_webhook(request):
         logger.error("Error decoding JSON body")
         return HttpResponse("Error decoding JSON body", status=400)
 
+    if get_bool("WEBHOOK_INGEST_MODE", False):
+        try:
+            enqueue_webhook(data, request.body, received_at)
+            return JsonResponse({"message": "webhook queued"})
+        except RedisError:
+            logger.exception("Could not queue webhook, processing synchronously")
+
+    return process_webhook_data(data, request.body, received_at, request=request)
+
+
+def process_webhook_data(data, request_body, received_at, request=None, alert_on_commit=False):
+    """
+    Processes a (decoded) status update webhook payload, and returns the HTTP response
+    for the webhook. This is called by `accept_webhook`, or by the webhook stream consumer
+    (see alert/webhook_stream.py) when the WEBHOOK_INGEST_MODE Option is enabled.
+    If `alert_on_commit` is True, alerts are only sent once the current transaction commits
+    (so they aren't sent again if the transaction rolls back and the payload is retried).
+    """
     course_id = data.get("section_id_normalized", None)
     if course_id is None:
         logger.error("Course ID could not be extracted from response")
@@ -106,6 +156,21 @@ def accept_webhook(request):
             logger.error("webhook ignored (summer class)")
             return JsonResponse({"message": "webhook ignored (summer class)"})
 
+        if settings.WEBHOOK_STATUS_CACHE:
+            # Reject duplicates without querying the DB, if this section's status is cached
+            section_code = "-".join(separate_course_code(course_id))
+            cached_status = get_cached_status(course_term, section_code)
+            if cached_status is not None:
+                last_status, last_payload_hash = cached_status
+                if last_payload_hash == payload_hash(request_body):
+                    return JsonResponse({"message": "duplicate webhook ignored"})
+                if last_status == course_status:
+                    raise ValidationError(
+                        f"Status update received changing section {section_code} from "
+                        f"{prev_status} to {course_status}, after previous status update "
+                        f"to {last_status} (duplicate or erroneous).",
+                    )
+
         _, section, _, _ = get_or_create_course_and_section(course_id, course_term)
 
         # Ignore duplicate updates
@@ -129,12 +194,18 @@ def accept_webhook(request):
         alert_for_course_called = False
         if should_send_pca_alert(course_term, course_status):
             try:
-                alert_for_course(
+                send_alerts = partial(
+                    alert_for_course,
                     course_id,
                     semester=course_term,
                     sent_by="WEB",
                     course_status=course_status,
+                    webhook_received_at=received_at,
                 )
+                if alert_on_commit:
+                    transaction.on_commit(send_alerts)
+                else:
+                    send_alerts()
                 alert_for_course_called = True
                 response = JsonResponse({"message": "webhook recieved, alerts sent"})
             except ValueError:
@@ -150,7 +221,7 @@ def accept_webhook(request):
                 prev_status,
                 course_status,
                 alert_for_course_called,
-                request.body,
+                request_body,
             )
             update_course_from_record(u)
     except (ValidationError, ValueError) as e:
@@ -629,3 +700,139 @@ class RegistrationHistoryViewSet(AutoPrefetchViewSetMixin, viewsets.ReadOnlyMode
         return Registration.objects.filter(
             user=self.request.user, section__course__semester=get_current_semester()
         ).prefetch_related("section")
+
+
+@api_view(["GET"])
+@schema(
+    PcxAutoSchema(
+        response_codes={
+            "alert-latency": {
+                "GET": {
+                    200: "[DESCRIBE_RESPONSE_SCHEMA]Alert latency stats retrieved successfully.",
+                    400: "Invalid days query parameter.",
+                    403: "Staff access required.",
+                    503: "Alert latency stats are unavailable.",
+                },
+            },
+        },
+        custom_parameters={
+            "alert-latency": {
+                "GET": [
+                    {
+                        "name": "days",
+                        "in": "query",
+                        "description": "The number of days (including today) to aggregate latencies over (defaults to 1).",  # noqa E501
+                        "schema": {"type": "integer"},
+                        "required": False,
+                    },
+                ]
+            },
+        },
+    )
+)
+@permission_classes([IsAdminUser])
+def alert_latency(request):
+    """
+    Get histograms of end-to-end alert latencies (see alert/latency.py), mapping each metric
+    (e.g. `end_to_end:email` or `queue_wait:send_alert`) to its count, mean and p50/p95/p99
+    latencies (in seconds). Only accessible by staff.
+    """
+    try:
+        days = int(request.query_params.get("days", 1))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= 30:
+        return Response(
+            {"detail": "days must be an integer between 1 and 30."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        return Response(get_latency_stats(days=days))
+    except RedisError:
+        logger.exception("Error reading alert latency stats")
+        return Response(
+            {"detail": "Alert latency stats are unavailable."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
+@api_view(["GET"])
+@schema(
+    PcxAutoSchema(
+        response_codes={
+            "alert-stats": {
+                "GET": {
+                    200: "[DESCRIBE_RESPONSE_SCHEMA]Alert stats retrieved successfully.",
+                    400: "Invalid start_date or end_date query parameter.",
+                    403: "Staff access required.",
+                },
+            },
+        },
+        custom_parameters={
+            "alert-stats": {
+                "GET": [
+                    {
+                        "name": "start_date",
+                        "in": "query",
+                        "description": "The first day (YYYY-MM-DD) of the date range to get stats for (defaults to end_date).",  # noqa E501
+                        "schema": {"type": "string"},
+                        "required": False,
+                    },
+                    {
+                        "name": "end_date",
+                        "in": "query",
+                        "description": "The last day (YYYY-MM-DD) of the date range to get stats for (defaults to today).",  # noqa E501
+                        "schema": {"type": "string"},
+                        "required": False,
+                    },
+                    {
+                        "name": "semester",
+                        "in": "query",
+                        "description": "The semester to get stats for (defaults to the current semester).",  # noqa E501
+                        "schema": {"type": "string"},
+                        "required": False,
+                    },
+                ]
+            },
+        },
+    )
+)
+@permission_classes([IsAdminUser])
+def alert_stats(request):
+    """
+    Get PCA stats (new registrations, alerts sent per channel, resubscribes, auto-resubscribe
+    requests and status updates) for a semester, over a date range (inclusive), read from the
+    daily alert stats rollup. Returns the stats summed over the range, as well as per day.
+    Only accessible by staff.
+    """
+    semester = request.query_params.get("semester") or get_current_semester()
+    try:
+        end_date = date.fromisoformat(
+            request.query_params.get("end_date") or timezone.localdate().isoformat()
+        )
+        start_date = date.fromisoformat(
+            request.query_params.get("start_date") or end_date.isoformat()
+        )
+    except ValueError:
+        return Response(
+            {"detail": "start_date and end_date must be of the form YYYY-MM-DD."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if start_date > end_date:
+        return Response(
+            {"detail": "start_date must not be after end_date."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response(
+        {
+            "semester": semester,
+            "start_date": start_date,
+            "end_date": end_date,
+            "totals": get_alert_stats(semester, start_date, end_date),
+            "days": DailyAlertStats.objects.filter(
+                semester=semester, date__gte=start_date, date__lte=end_date
+            )
+            .order_by("date")
+            .values("date", *DAILY_ALERT_STATS_COUNTERS),
+        }
+    )
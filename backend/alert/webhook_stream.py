@@ -0,0 +1,294 @@
+"""
+Ingest-and-ack mode for the status update webhook.
+
+When the WEBHOOK_INGEST_MODE Option is enabled, `accept_webhook` only validates the request's
+auth and JSON, appends the raw payload to a Redis stream (with `enqueue_webhook`) and
+immediately returns a 200. The `consumewebhooks` management command then processes the queued
+payloads (with `consume_webhook_stream`), in the same way `accept_webhook` would have.
+
+Payloads are sharded across `WEBHOOK_STREAM_SHARDS` streams by section, so with one consumer
+per shard, all updates to a given section are processed in the order they were received.
+Each entry is processed exactly once, keyed on its stream entry id (registrar payloads carry no
+event id, so identical bodies can be distinct updates, e.g. a section reopening twice): an entry
+is only marked as processed (and acknowledged) once its database transaction has committed, and
+entries
+that were delivered but never acknowledged (e.g. because processing failed, or the consumer
+crashed) are re-processed: every WEBHOOK_STREAM_RECLAIM_INTERVAL seconds, each consumer claims
+(with XAUTOCLAIM) entries left pending by other consumers for WEBHOOK_STREAM_CLAIM_IDLE_MS, and
+re-reads all of its own pending entries, in order. If an entry fails, the section's later
+entries are left pending too, so they are retried after it rather than processed out of order.
+In the narrow window where a consumer crashes after committing but before marking the entry
+as processed, the duplicate status update check in `process_webhook_data` rejects the
+re-processed update. Alerts are only sent once an entry's transaction commits.
+"""
+
+import json
+import logging
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from redis.exceptions import ResponseError
+
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+WEBHOOK_STREAM_GROUP = "webhook-consumers"
+WEBHOOK_STREAM_METRICS_KEY = "webhook_stream_metrics"
+
+
+def webhook_stream_key(shard):
+    return f"webhook_stream:{shard}"
+
+
+def webhook_shard(section_code):
+    """
+    Returns the stream shard to which webhooks for the given section are sent.
+    """
+    if not section_code:
+        return 0
+    return zlib.crc32(section_code.encode()) % settings.WEBHOOK_STREAM_SHARDS
+
+
+def webhook_idempotency_key(stream, entry_id):
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    return f"webhook_processed:{stream}:{entry_id}"
+
+
+def enqueue_webhook(data, request_body, received_at):
+    """
+    Appends a webhook payload to the stream shard for its section.
+    :param data: the decoded JSON payload (only used to pick a shard)
+    :param request_body: the raw request body, which is what the consumer processes
+    :param received_at: the datetime at which the webhook was received
+    """
+    return r.xadd(
+        webhook_stream_key(webhook_shard(data.get("section_id_normalized"))),
+        {"body": request_body, "received_at": received_at.isoformat()},
+        maxlen=settings.WEBHOOK_STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+def ensure_consumer_group(stream):
+    try:
+        r.xgroup_create(stream, WEBHOOK_STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def group_by_section(entries):
+    """
+    Groups stream entries (a list of (entry_id, fields) tuples, in stream order) into an
+    OrderedDict mapping section code to that section's entries, preserving order within
+    (and the first-seen order across) sections.
+    """
+    by_section = OrderedDict()
+    for entry_id, fields in entries:
+        try:
+            section_code = json.loads(fields[b"body"]).get("section_id_normalized")
+        except (json.JSONDecodeError, AttributeError, KeyError):
+            section_code = None
+        by_section.setdefault(section_code, []).append((entry_id, fields))
+    return by_section
+
+
+def process_entry(stream, entry_id, fields):
+    """
+    Processes a single stream entry (unless it has already been processed), and acknowledges
+    it once the resulting database transaction has committed.
+    Returns True if the payload was processed, False if the entry was skipped.
+    """
+    from alert.views import process_webhook_data  # imported here to avoid circular imports
+
+    if not fields:  # the entry was trimmed from the stream before being acknowledged
+        r.xack(stream, WEBHOOK_STREAM_GROUP, entry_id)
+        return False
+    request_body = fields[b"body"]
+    idempotency_key = webhook_idempotency_key(stream, entry_id)
+    if r.exists(idempotency_key):
+        r.xack(stream, WEBHOOK_STREAM_GROUP, entry_id)
+        return False
+
+    def mark_processed():
+        r.set(idempotency_key, 1, ex=settings.WEBHOOK_IDEMPOTENCY_TTL)
+        r.xack(stream, WEBHOOK_STREAM_GROUP, entry_id)
+
+    received_at = datetime.fromisoformat(fields[b"received_at"].decode())
+    try:
+        data = json.loads(request_body)
+    except json.JSONDecodeError:
+        logger.error(f"Error decoding JSON body of webhook stream entry {entry_id}")
+        mark_processed()
+        return False
+    with transaction.atomic():
+        response = process_webhook_data(data, request_body, received_at, alert_on_commit=True)
+        transaction.on_commit(mark_processed)
+    if response.status_code != 200:
+        logger.error(f"Webhook stream entry {entry_id}: {response.content}")
+    return True
+
+
+def claim_idle_entries(stream, consumer, min_idle_ms, batch_size=100):
+    """
+    Claims (with XAUTOCLAIM) the entries of the given stream that have been pending for at
+    least `min_idle_ms` milliseconds (e.g. because the consumer they were delivered to crashed),
+    so they become pending entries of the given consumer. Returns the number of entries claimed.
+    """
+    start_id, num_claimed = "0-0", 0
+    while True:
+        start_id, claimed, *_ = r.xautoclaim(
+            stream, WEBHOOK_STREAM_GROUP, consumer, min_idle_ms, start_id=start_id, count=batch_size
+        )
+        num_claimed += len(claimed)
+        if start_id in (b"0-0", "0-0"):
+            return num_claimed
+
+
+def process_entries(stream, entries, failed_sections):
+    """
+    Processes the given stream entries, grouped by section (in order). If an entry fails, it
+    and the rest of its section's entries are left pending, and its section is added to
+    `failed_sections`; entries of sections already in `failed_sections` are left pending
+    without being processed. Returns the number of payloads processed.
+    """
+    num_processed = 0
+    for section_code, section_entries in group_by_section(entries).items():
+        if section_code in failed_sections:
+            continue
+        for entry_id, fields in section_entries:
+            try:
+                num_processed += process_entry(stream, entry_id, fields)
+            except Exception:
+                logger.exception(f"Error processing webhook stream entry {entry_id}")
+                failed_sections.add(section_code)
+                break
+    return num_processed
+
+
+def consume_webhook_stream(
+    shard=0,
+    consumer="consumer",
+    batch_size=100,
+    block_ms=5000,
+    max_batches=None,
+    reclaim_interval=None,
+    claim_idle_ms=None,
+):
+    """
+    Processes webhook payloads from the given stream shard in micro-batches of up to
+    `batch_size` entries (grouped by section, in order), blocking for up to `block_ms`
+    milliseconds waiting for new entries. On startup, and then every `reclaim_interval`
+    seconds (defaults to WEBHOOK_STREAM_RECLAIM_INTERVAL), entries idle for `claim_idle_ms`
+    milliseconds (defaults to WEBHOOK_STREAM_CLAIM_IDLE_MS) are claimed from other consumers,
+    and this consumer's pending (delivered but unacknowledged) entries are processed before
+    any new ones. Runs forever, unless `max_batches` is given.
+    Consumer metrics are recorded after every batch (see `get_webhook_stream_metrics`).
+    """
+    if reclaim_interval is None:
+        reclaim_interval = settings.WEBHOOK_STREAM_RECLAIM_INTERVAL
+    if claim_idle_ms is None:
+        claim_idle_ms = settings.WEBHOOK_STREAM_CLAIM_IDLE_MS
+    stream = webhook_stream_key(shard)
+    ensure_consumer_group(stream)
+    failed_sections = set()  # sections with an entry left pending after failing
+
+    def read(last_id, block=None):
+        response = r.xreadgroup(
+            WEBHOOK_STREAM_GROUP, consumer, {stream: last_id}, count=batch_size, block=block
+        )
+        return response[0][1] if response else []
+
+    def process_batch(entries):
+        start = time.monotonic()
+        num_processed = process_entries(stream, entries, failed_sections)
+        record_batch_metrics(shard, entries, num_processed, time.monotonic() - start)
+
+    next_reclaim = time.monotonic()
+    num_batches = 0
+    while max_batches is None or num_batches < max_batches:
+        if time.monotonic() >= next_reclaim:
+            claim_idle_entries(stream, consumer, claim_idle_ms, batch_size)
+            failed_sections.clear()
+            # Retry all of our pending entries, in order, before any new ones
+            entries = read("0")
+            while entries:
+                process_batch(entries)
+                num_batches += 1
+                entries = read(entries[-1][0])
+            next_reclaim = time.monotonic() + reclaim_interval
+        entries = read(">", block=block_ms)
+        num_batches += 1
+        if entries:
+            process_batch(entries)
+
+
+def entry_timestamp(entry_id):
+    """
+    Returns the datetime encoded in a stream entry id (milliseconds since the epoch).
+    """
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    return datetime.fromtimestamp(int(entry_id.split("-")[0]) / 1000, tz=dt_timezone.utc)
+
+
+def record_batch_metrics(shard, entries, num_processed, elapsed):
+    now = timezone.now()
+    metrics_key = f"{WEBHOOK_STREAM_METRICS_KEY}:{shard}"
+    pipeline = r.pipeline()
+    pipeline.hincrby(metrics_key, "entries", len(entries))
+    pipeline.hincrby(metrics_key, "processed", num_processed)
+    pipeline.hset(
+        metrics_key,
+        mapping={
+            "last_batch_size": len(entries),
+            "last_batch_seconds": round(elapsed, 4),
+            "last_batch_entries_per_second": round(len(entries) / elapsed, 2) if elapsed else 0,
+            # time between the newest entry in the batch being queued and being processed
+            "lag_seconds": round((now - entry_timestamp(entries[-1][0])).total_seconds(), 3),
+            "last_batch_at": now.isoformat(),
+        },
+    )
+    pipeline.execute()
+
+
+def get_webhook_stream_metrics():
+    """
+    Returns a dict mapping each stream shard to its consumer metrics: the stream length,
+    the number of entries not yet delivered to the consumer (`backlog`, if supported by the
+    Redis server) or delivered but not acknowledged (`pending`), running totals of entries
+    consumed / processed (as opposed to skipped as duplicates), and the size, duration,
+    throughput and lag of the last micro-batch.
+    """
+    metrics = dict()
+    for shard in range(settings.WEBHOOK_STREAM_SHARDS):
+        stream = webhook_stream_key(shard)
+        shard_metrics = {
+            k.decode(): v.decode()
+            for k, v in r.hgetall(f"{WEBHOOK_STREAM_METRICS_KEY}:{shard}").items()
+        }
+        shard_metrics["length"] = r.xlen(stream)
+        try:
+            group = next(
+                (
+                    g
+                    for g in r.xinfo_groups(stream)
+                    if g["name"] in (WEBHOOK_STREAM_GROUP, WEBHOOK_STREAM_GROUP.encode())
+                ),
+                None,
+            )
+        except ResponseError:  # the stream doesn't exist yet
+            group = None
+        shard_metrics["pending"] = group["pending"] if group else 0
+        shard_metrics["backlog"] = group.get("lag") if group else shard_metrics["length"]
+        metrics[shard] = shard_metrics
+    return metrics
@@ -0,0 +1,93 @@
+"""
+Precompiled per-semester course catalog snapshots, served by `CourseList`
+(`/courses/{semester}/courses/`) when the COURSE_CATALOG_SNAPSHOT setting is enabled.
+
+A snapshot is the gzipped JSON body of the catalog (as rendered by `CourseList`), stored in the
+Django cache along with an ETag (a hash of the JSON), so the catalog is serialized once per
+change rather than once per request. Snapshots are keyed by the same generation tokens as the
+course search response cache (see `courses/search_cache.py`), so they are invalidated by the
+same events (registrar imports, status changes affecting the catalog, and review imports), and
+rebuilt by the first request after an invalidation (while other requests are served the
+previous snapshot; see `get_or_rebuild`).
+"""
+
+import gzip
+import hashlib
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from courses.search_cache import GLOBAL_GENERATION, get_course_search_generations, get_or_rebuild
+from PennCourses.settings.base import CACHE_PREFIX
+
+
+CATALOG_SNAPSHOT_TIMEOUT = 60 * 60 * 24
+re_accepts_gzip = re.compile(r"\bgzip\b")  # as in django.middleware.gzip
+
+
+def catalog_snapshot_key(semester):
+    """
+    Returns the cache key of the given semester's current catalog snapshot, or None if the
+    generation tokens can't be stored (see `get_course_search_generations`).
+    """
+    generations = get_course_search_generations([semester, GLOBAL_GENERATION])
+    if generations is None:
+        return None
+    return f"{CACHE_PREFIX}catalog_snapshot:{semester}:{':'.join(generations)}"
+
+
+def catalog_snapshot_stale_key(semester):
+    return f"{CACHE_PREFIX}catalog_snapshot_stale:{semester}"
+
+
+def build_catalog_snapshot(content):
+    """
+    Returns a snapshot dict of the given JSON catalog body (bytes), with keys `etag`
+    (a quoted content hash) and `gzip` (the gzipped body).
+    """
+    return {
+        "etag": f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+        "gzip": gzip.compress(content, compresslevel=6),
+    }
+
+
+def get_catalog_snapshot(semester, render):
+    """
+    Returns the current catalog snapshot of the given semester (see `build_catalog_snapshot`),
+    building it from the JSON body returned by the given `render` function (and caching it) if
+    necessary, or None if snapshots are disabled (or the cache is unavailable). While another
+    request is rebuilding the snapshot, the previous one is returned.
+    """
+    if not settings.COURSE_CATALOG_SNAPSHOT or semester == "all":
+        return None
+    key = catalog_snapshot_key(semester)
+    if key is None:
+        return None
+    return get_or_rebuild(
+        key,
+        catalog_snapshot_stale_key(semester),
+        lambda: build_catalog_snapshot(render()),
+        timeout=CATALOG_SNAPSHOT_TIMEOUT,
+    )
+
+
+def catalog_snapshot_response(request, snapshot):
+    """
+    Returns a response serving the given catalog snapshot for the given request: a 304 if the
+    request's If-None-Match matches the snapshot's ETag, and otherwise the JSON body, gzipped
+    if the request accepts gzip.
+    """
+    etag = snapshot["etag"]
+    if_none_match = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    if "*" in if_none_match or etag in [e.removeprefix("W/") for e in if_none_match]:
+        response = HttpResponseNotModified()
+    elif re_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+        response = HttpResponse(snapshot["gzip"], content_type="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(gzip.decompress(snapshot["gzip"]), content_type="application/json")
+    response.headers["ETag"] = etag
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
@@ -0,0 +1,151 @@
+"""
+An in-process prefix index of course and section codes, used by `TypedCourseSearchBackend`
+and `TypedSectionSearchBackend` to answer code (typeahead) searches without querying the DB
+for the candidate set. Enabled by the CODE_PREFIX_INDEX setting.
+
+Each web worker lazily loads, per semester, a sorted array of the (upper case) full codes of
+all courses or sections, with their ids; a code prefix search is then a binary search for the
+range of codes starting with the prefix. The index is invalidated by a per-semester version
+number stored in Redis, which `registrarimport` bumps (see `bump_code_index_version`) after
+importing a semester. Workers check the version at most every CODE_INDEX_VERSION_CHECK_SECONDS
+seconds, and reload an index older than CODE_INDEX_MAX_AGE_SECONDS regardless (bounding
+staleness for codes created outside the registrar import). If Redis can't be reached,
+lookups return None, and callers should fall back to querying the DB.
+"""
+
+import bisect
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+
+from courses.models import Course, Section
+
+
+logger = logging.getLogger(__name__)
+r = redis.Redis.from_url(settings.REDIS_URL)
+
+CODE_INDEX_VERSION_CHECK_SECONDS = 5
+CODE_INDEX_MAX_AGE_SECONDS = 60 * 60
+CODE_INDEX_MAX_SEMESTERS = 4  # per model; least recently used semesters are evicted
+
+# Maps each indexed model to the lookup of its semester
+CODE_INDEX_SEMESTER_FIELDS = {Course: "semester", Section: "course__semester"}
+
+
+def code_index_version_key(semester):
+    return f"code_index_version:{semester}"
+
+
+def bump_code_index_version(semester):
+    """
+    Invalidates the code prefix indexes of the given semester in all workers.
+    """
+    try:
+        r.incr(code_index_version_key(semester))
+    except redis.exceptions.RedisError:
+        logger.exception("Error bumping code index version")
+
+
+class CodePrefixIndex:
+    """
+    A sorted array of the full codes (upper case) of all objects of a model in a semester,
+    with their ids.
+    """
+
+    def __init__(self, model, semester, version):
+        self.version = version
+        self.loaded_at = self.checked_at = time.monotonic()
+        rows = model.objects.filter(**{CODE_INDEX_SEMESTER_FIELDS[model]: semester}).values_list(
+            "full_code", "id"
+        )
+        rows = sorted((code.upper(), id) for code, id in rows)
+        self.codes = [code for code, _ in rows]
+        self.ids = [id for _, id in rows]
+
+    def lookup(self, prefix):
+        """
+        Returns the ids of all objects whose full code starts with the given prefix
+        (case insensitive), in order of full code.
+        """
+        prefix = prefix.upper()
+        start = bisect.bisect_left(self.codes, prefix)
+        end = bisect.bisect_left(self.codes, prefix + chr(0x10FFFF), lo=start)
+        return self.ids[start:end]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_code_index_version(semester):
+    version = r.get(code_index_version_key(semester))
+    return int(version) if version is not None else 0
+
+
+def get_code_index(model, semester):
+    """
+    Returns the (up to date) code prefix index of the given model in the given semester,
+    loading it if necessary, or None if the index version can't be read from Redis.
+    """
+    key = (model, semester)
+    now = time.monotonic()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            if (
+                now - index.checked_at < CODE_INDEX_VERSION_CHECK_SECONDS
+                and now - index.loaded_at < CODE_INDEX_MAX_AGE_SECONDS
+            ):
+                return index
+    try:
+        version = get_code_index_version(semester)
+    except redis.exceptions.RedisError:
+        logger.exception("Error reading code index version")
+        return None
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if (
+            index is not None
+            and index.version == version
+            and now - index.loaded_at < CODE_INDEX_MAX_AGE_SECONDS
+        ):
+            index.checked_at = now
+            return index
+    index = CodePrefixIndex(model, semester, version)
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        semesters = [k for k in _indexes if k[0] is model]
+        for evicted in semesters[:-CODE_INDEX_MAX_SEMESTERS]:
+            del _indexes[evicted]
+    return index
+
+
+def lookup_code_prefixes(model, semester, prefixes):
+    """
+    Returns a list of the ids of all objects of the given model (Course or Section) in the given
+    semester whose full code starts with any of the given prefixes (case insensitive), or None if
+    the index is disabled (or unavailable) and the DB should be queried instead.
+    """
+    if not settings.CODE_PREFIX_INDEX or semester == "all":
+        return None
+    index = get_code_index(model, semester)
+    if index is None:
+        return None
+    ids = set()
+    for prefix in prefixes:
+        ids.update(index.lookup(prefix))
+    return list(ids)
+
+
+def clear_code_indexes():
+    """
+    Clears all code prefix indexes loaded in this process.
+    """
+    with _indexes_lock:
+        _indexes.clear()
@@ -2,15 +2,23 @@ from decimal import Decimal
 
 from django.core.exceptions import BadRequest
 from django.db.models import Count, Exists, OuterRef, Q
-from django.db.models.expressions import F, Subquery
+from django.db.models.expressions import F
 from lark import Lark, Transformer, Tree
 from lark.exceptions import UnexpectedInput
 from rest_framework import filters
 
-from courses.models import Course, Meeting, PreNGSSRequirement, Section
-from courses.util import get_current_semester
+from courses.models import (
+    MEETING_BITMAP_DAYS,
+    MEETING_BITMAP_SLOT_MINUTES,
+    MEETING_BITMAP_SLOTS_PER_DAY,
+    Course,
+    Meeting,
+    PreNGSSRequirement,
+    Section,
+)
+from courses.util import bitmap_to_string, day_slots_bitmap, get_current_semester, time_to_minutes
 from degree.models import Rule
-from plan.models import Schedule
+from plan.util import get_schedule_occupancy
 
 
 def section_ids_by_meeting_query(meeting_query):
@@ -66,16 +74,36 @@ def meeting_filter(queryset, meeting_query):
     )
 
 
+def meeting_bitmap_filter(queryset, excluded_slots):
+    """
+    Filters the given queryset of courses by the same condition as `meeting_filter`, for a
+    meeting filter excluding the given slots (a meeting bitmap int, see `courses.util`), checked
+    against each section's precomputed `meeting_bitmap`: include a course only if, for each of
+    its activities, it has a section with no meetings in the excluded slots.
+    This avoids aggregating over meetings and sections.
+    """
+    section_fits = Section.objects.filter(
+        Q(num_meetings=0) | Q(meeting_bitmap__disjoint=bitmap_to_string(excluded_slots))
+    )
+    activity_without_fitting_section = Section.objects.filter(course_id=OuterRef("id")).filter(
+        ~Exists(
+            section_fits.filter(course_id=OuterRef(OuterRef("id")), activity=OuterRef("activity"))
+        )
+    )
+    return queryset.filter(~Exists(activity_without_fitting_section))
+
+
 def is_open_filter(queryset, *args):
     """
     Filters the given queryset of courses by the following condition:
     include a course only if filtering its sections by `status="O"` does
     not does not limit the set of section activities we can participate in for the course.
     In other words, include only courses for which all activities have open sections.
+    This is answered by the precomputed `Course.all_activities_open` field.
     Note that for compatibility, this function can take additional positional
     arguments, but these are ignored.
     """
-    return queryset.filter(id__in=course_ids_by_section_query(Q(status="O")))
+    return queryset.filter(all_activities_open=True)
 
 
 def day_filter(days):
@@ -89,20 +117,71 @@ def day_filter(days):
     return Q(day__isnull=True) | Q(day__in=set(days))
 
 
-def time_filter(time_range):
+def day_bitmap_filter(days):
     """
-    Constructs a Q() query object for filtering meetings by start/end time,
-    based on the given time_range filter string.
+    Returns a meeting bitmap (as an int) of the slots excluded by the given days filter string
+    (every slot of the days not included), for `meeting_bitmap_filter`.
+    """
+    days = set(days)
+    if not days.issubset({"M", "T", "W", "R", "F", "S", "U"}):
+        return 0
+    excluded_slots = 0
+    for day_index, day in enumerate(MEETING_BITMAP_DAYS):
+        if day not in days:
+            excluded_slots |= day_slots_bitmap(day_index, 0, MEETING_BITMAP_SLOTS_PER_DAY)
+    return excluded_slots
+
+
+def parse_time_range(time_range):
+    """
+    Parses the given time_range filter string into a tuple of its start/end times
+    (each a string, possibly empty), or returns None if it is invalid.
     """
     if not time_range:
-        return Q()
+        return None
     times = time_range.split("-")
     if len(times) != 2:
-        return Q()
+        return None
     times = [t.strip() for t in times]
     for time in times:
         if time and not time.replace(".", "", 1).isdigit():
-            return Q()
+            return None
+    return tuple(times)
+
+
+def time_bitmap_filter(time_range):
+    """
+    Returns a meeting bitmap (as an int) of the slots excluded by the given time_range filter
+    string (the slots of each day before the start time or after the end time), for
+    `meeting_bitmap_filter`. Times are rounded inwards to the nearest slot boundary.
+    """
+    times = parse_time_range(time_range)
+    if times is None:
+        return 0
+    start_time, end_time = times
+    first_slot = 0
+    if start_time:
+        first_slot = -(-time_to_minutes(Decimal(start_time)) // MEETING_BITMAP_SLOT_MINUTES)
+    last_slot = MEETING_BITMAP_SLOTS_PER_DAY
+    if end_time:
+        last_slot = time_to_minutes(Decimal(end_time)) // MEETING_BITMAP_SLOT_MINUTES
+    excluded_slots = 0
+    for day_index in range(len(MEETING_BITMAP_DAYS)):
+        excluded_slots |= day_slots_bitmap(day_index, 0, min(first_slot, last_slot))
+        excluded_slots |= day_slots_bitmap(
+            day_index, max(last_slot, 0), MEETING_BITMAP_SLOTS_PER_DAY
+        )
+    return excluded_slots
+
+
+def time_filter(time_range):
+    """
+    Constructs a Q() query object for filtering meetings by start/end time,
+    based on the given time_range filter string.
+    """
+    times = parse_time_range(time_range)
+    if times is None:
+        return Q()
     start_time, end_time = times
     query = Q()
     if start_time:
@@ -112,36 +191,27 @@ def time_filter(time_range):
     return query
 
 
-def gen_schedule_filter(request):
+def gen_schedule_bitmap_filter(request):
     """
     Generates a schedule filter function that checks for proper
     authentication in the given request.
     """
 
-    def schedule_filter(schedule_id):
+    def schedule_bitmap_filter(schedule_id):
         """
-        Constructs a Q() query object for filtering meetings by
-        whether they fit into the specified schedule.
+        Returns a meeting bitmap (as an int) of the slots occupied by the specified schedule's
+        sections and checked breaks (see `plan.util.get_schedule_occupancy`),
+        for `meeting_bitmap_filter`.
         """
         if not schedule_id:
-            return Q()
+            return 0
         if not schedule_id.isdigit():
-            return Q()
+            return 0
         if not request.user.is_authenticated:
-            return Q()
-        meetings = Meeting.objects.filter(
-            section_id__in=Subquery(
-                Schedule.objects.filter(id=int(schedule_id), person_id=request.user.id).values(
-                    "sections__id"
-                )
-            )
-        )
-        query = Q()
-        for meeting in meetings:
-            query &= meeting.no_conflict_query
-        return query
+            return 0
+        return int(get_schedule_occupancy(int(schedule_id), request.user.id), 2)
 
-    return schedule_filter
+    return schedule_bitmap_filter
 
 
 def pre_ngss_requirement_filter(queryset, req_ids):
@@ -353,19 +423,19 @@ class CourseSearchFilterBackend(filters.BaseFilterBackend):
             if param is not None:
                 queryset = filter_func(queryset, param)
 
-        # Combine meeting filter queries for efficiency
+        # Meeting filters are checked against precomputed section meeting bitmaps
         meeting_filters = {
-            "days": day_filter,
-            "time": time_filter,
-            "schedule-fit": gen_schedule_filter(request),
+            "days": day_bitmap_filter,
+            "time": time_bitmap_filter,
+            "schedule-fit": gen_schedule_bitmap_filter(request),
         }
-        meeting_query = Q()
+        excluded_slots = 0
         for field, filter_func in meeting_filters.items():
             param = request.query_params.get(field)
             if param is not None:
-                meeting_query &= filter_func(param)
-        if len(meeting_query) > 0:
-            queryset = meeting_filter(queryset, meeting_query)
+                excluded_slots |= filter_func(param)
+        if excluded_slots:
+            queryset = meeting_bitmap_filter(queryset, excluded_slots)
 
         return queryset.distinct("full_code")  # TODO: THIS COULD BE A BREAKING CHANGE FOR PCX
 
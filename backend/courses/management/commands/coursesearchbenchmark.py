@@ -0,0 +1,153 @@
+import random
+import time
+from string import ascii_uppercase
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from options.models import Option
+
+from courses.models import Course, Instructor
+from courses.search import trigram_search_available, update_course_search_vectors
+from courses.util import get_current_semester, get_or_create_course_and_section, percentile
+from courses.views import CourseListSearch
+
+
+SYNTHETIC_WORDS = (
+    "introduction advanced topics programming systems theory economics history literature "
+    "analysis design data networks markets social political philosophy biology chemistry "
+    "physics calculus algebra statistics probability machine learning language culture art "
+    "music writing seminar research methods health policy law ethics engineering finance"
+).split()
+SYNTHETIC_NAMES = (
+    "Smith Chang Doman Gandhi Lee Patel Garcia Nguyen Kim Cohen Rossi Brown Silva Wang"
+).split()
+DEFAULT_QUERIES = [
+    "programming",
+    "machine learning",
+    "intro economics",
+    "political philosophy",
+    "statistics",
+    "chang",
+    "data analysis",
+    "literature seminar",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark course keyword search (as run by the courses-search route), comparing the "
+        "icontains path (filter_or_lookups_terms over titles and instructor names) with "
+        "the ranked full text search path (the COURSE_FULL_TEXT_SEARCH option). "
+        "Optionally generates a synthetic multi-semester dataset first; all changes are "
+        "rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester to search (defaults to the current semester).",
+        )
+        parser.add_argument(
+            "--synthetic-semesters",
+            type=int,
+            default=0,
+            help=(
+                "The number of synthetic semesters of courses to generate before benchmarking "
+                "(including the searched semester)."
+            ),
+        )
+        parser.add_argument(
+            "--courses-per-semester",
+            type=int,
+            default=1000,
+            help="The number of synthetic courses to generate per synthetic semester.",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=10,
+            help="The number of times to run each query with each search path.",
+        )
+        parser.add_argument(
+            "--queries",
+            type=str,
+            default=None,
+            help="A comma-separated list of search queries (defaults to a fixed set).",
+        )
+
+    def generate_courses(self, semesters, courses_per_semester):
+        rng = random.Random(0)
+        instructors = [
+            Instructor.objects.get_or_create(name=f"{first} {last}")[0]
+            for first in ("Alex", "Sam", "Jordan")
+            for last in SYNTHETIC_NAMES
+        ]
+        for semester in semesters:
+            for i in range(courses_per_semester):
+                _, section, _, _ = get_or_create_course_and_section(
+                    f"BN{ascii_uppercase[i // 26000]}{ascii_uppercase[i // 1000 % 26]}"
+                    f"-{i % 1000:04d}-001",
+                    semester,
+                    course_defaults={
+                        "title": " ".join(rng.sample(SYNTHETIC_WORDS, 4)).title(),
+                        "description": " ".join(rng.choices(SYNTHETIC_WORDS, k=8)),
+                    },
+                    section_defaults={"credits": 1, "status": "O", "activity": "LEC"},
+                )
+                section.instructors.add(*rng.sample(instructors, 2))
+        self.stdout.write(
+            f"Generated {courses_per_semester} courses in each of {len(semesters)} semesters."
+        )
+
+    def search(self, semester, query):
+        request = RequestFactory().get("/", {"search": query, "type": "keyword"})
+        view = CourseListSearch()
+        view.setup(request, semester=semester)
+        view.request = view.initialize_request(request)
+        view.format_kwarg = None
+        return list(view.filter_queryset(view.get_queryset()).values_list("id", flat=True))
+
+    def run(self, label, semester, queries, iterations):
+        latencies = []
+        results = 0
+        for query in queries:
+            for _ in range(iterations):
+                start = time.perf_counter()
+                results = len(self.search(semester, query))
+                latencies.append(time.perf_counter() - start)
+        self.stdout.write(
+            f"{label}: p50 {percentile(latencies, 50) * 1000:.1f}ms, "
+            f"p95 {percentile(latencies, 95) * 1000:.1f}ms "
+            f"({len(latencies)} searches, {results} results for the last query)"
+        )
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        queries = kwargs["queries"].split(",") if kwargs["queries"] else DEFAULT_QUERIES
+        # The searched semester, plus (far future) semesters that can't collide with real data
+        synthetic_semesters = [semester] + [
+            f"{3000 + i // 3}{'ABC'[i % 3]}" for i in range(kwargs["synthetic_semesters"] - 1)
+        ]
+
+        with transaction.atomic():
+            if kwargs["synthetic_semesters"]:
+                self.generate_courses(synthetic_semesters, kwargs["courses_per_semester"])
+            if not Course.objects.filter(semester=semester).exists():
+                raise CommandError(f"No courses found for semester {semester}.")
+            update_course_search_vectors(Course.objects.all())
+            self.stdout.write(
+                f"Searching {Course.objects.filter(semester=semester).count()} courses in "
+                f"{semester} ({Course.objects.count()} courses in total); "
+                f"trigram matching {'en' if trigram_search_available() else 'dis'}abled."
+            )
+
+            for label, enabled in [("icontains", "FALSE"), ("full text", "TRUE")]:
+                Option.objects.update_or_create(
+                    key="COURSE_FULL_TEXT_SEARCH",
+                    defaults={"value": enabled, "value_type": "BOOL"},
+                )
+                self.run(label, semester, queries, kwargs["iterations"])
+            transaction.set_rollback(True)
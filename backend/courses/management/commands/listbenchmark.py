@@ -0,0 +1,128 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+
+from courses.models import Course, Section
+from courses.util import get_current_semester, get_or_create_course_and_section
+from courses.views import CourseList, CourseListSearch, SectionList
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the course and section list routes, comparing the buffered path (serializing "
+        "the whole list before writing it) with the streaming path (the STREAM_LIST_RESPONSES "
+        "setting) by peak Python heap usage and time to first byte, and comparing deep page "
+        "fetches by page number (OFFSET) and by cursor (keyset). Optionally generates "
+        "synthetic courses first; all changes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester to list (defaults to the current semester).",
+        )
+        parser.add_argument(
+            "--synthetic-courses",
+            type=int,
+            default=0,
+            help="The number of synthetic courses (with 3 sections each) to generate first.",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=100,
+            help="The page size for the deep page comparison.",
+        )
+
+    def generate_courses(self, semester, num_courses):
+        for i in range(num_courses):
+            for section_code in ["001", "002", "201"]:
+                get_or_create_course_and_section(
+                    f"BN{chr(ord('A') + i // 1000 % 26)}{chr(ord('A') + i // 26000)}"
+                    f"-{i % 1000:04d}-{section_code}",
+                    semester,
+                    course_defaults={"title": f"Synthetic Course {i}"},
+                    section_defaults={
+                        "credits": 1,
+                        "status": "O",
+                        "activity": "LEC" if section_code < "100" else "REC",
+                    },
+                )
+        self.stdout.write(f"Generated {num_courses} courses.")
+
+    def get(self, view_class, semester, params=None):
+        """
+        Runs a GET request to the given list view, consuming the response body.
+        Returns the time to the first byte of the body, the total time, and the body size.
+        """
+        request = RequestFactory().get("/", params or {}, HTTP_ACCEPT="application/json")
+        start = time.perf_counter()
+        response = view_class.as_view()(request, semester=semester)
+        if response.streaming:
+            chunks = iter(response.streaming_content)
+            first = next(chunks, b"")
+            ttfb = time.perf_counter() - start
+            size = len(first) + sum(len(chunk) for chunk in chunks)
+        else:
+            response.render()
+            ttfb = time.perf_counter() - start
+            size = len(response.content)
+        return ttfb, time.perf_counter() - start, size
+
+    def compare_streaming(self, label, view_class, semester):
+        for path, stream in [("buffered", False), ("streaming", True)]:
+            with override_settings(STREAM_LIST_RESPONSES=stream, COURSE_CATALOG_SNAPSHOT=False):
+                tracemalloc.start()
+                ttfb, total, size = self.get(view_class, semester)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            self.stdout.write(
+                f"{label} ({path}): TTFB {ttfb * 1000:.0f}ms, total {total * 1000:.0f}ms, "
+                f"peak heap {peak / 2**20:.1f}MiB, {size / 2**20:.1f}MiB body"
+            )
+
+    def compare_deep_pages(self, semester, page_size):
+        num_courses = Course.objects.filter(semester=semester).count()
+        last_page = max(num_courses // page_size, 1)
+        _, by_page, _ = self.get(
+            CourseListSearch, semester, {"page": last_page, "page_size": page_size}
+        )
+        # Fetch the same page by cursor, starting from the last course of the previous page
+        offset = (last_page - 1) * page_size
+        cursor = ""
+        if offset:
+            previous = (
+                Course.objects.filter(semester=semester, sections__isnull=False)
+                .order_by("full_code", "id")
+                .values_list("full_code", "id")
+                .distinct()[offset - 1]
+            )
+            cursor = CourseListSearch.pagination_class.encode_cursor(*previous)
+        _, by_cursor, _ = self.get(
+            CourseListSearch, semester, {"cursor": cursor, "page_size": page_size}
+        )
+        self.stdout.write(
+            f"Page {last_page} of {page_size} courses: by page number {by_page * 1000:.0f}ms, "
+            f"by cursor {by_cursor * 1000:.0f}ms"
+        )
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        with transaction.atomic():
+            if kwargs["synthetic_courses"]:
+                self.generate_courses(semester, kwargs["synthetic_courses"])
+            num_courses = Course.objects.filter(semester=semester).count()
+            if not num_courses:
+                raise CommandError(f"No courses found for semester {semester}.")
+            num_sections = Section.objects.filter(course__semester=semester).count()
+            self.stdout.write(f"Listing {num_courses} courses / {num_sections} sections.")
+
+            self.compare_streaming("courses", CourseList, semester)
+            self.compare_streaming("sections", SectionList, semester)
+            self.compare_deep_pages(semester, kwargs["page_size"])
+            transaction.set_rollback(True)
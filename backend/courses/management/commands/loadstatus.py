@@ -2,20 +2,26 @@ import asyncio
 import json
 import logging
 
+from django.core.exceptions import ValidationError
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from tqdm import tqdm
 
+from alert.demand_index import demand_index_enabled, rebuild_section_demand_index
 from courses import registrar
 from courses.management.commands.sync_path_status import (
     get_all_course_status_path,
     get_department_codes,
 )
 from courses.models import Course, Section
+from courses.search_cache import bump_course_search_generation
 from courses.util import (
     get_course_and_section,
     get_current_semester,
-    record_update,
+    record_updates_bulk,
     translate_semester_inv,
+    update_open_activities,
+    validate_status,
 )
 
 
@@ -27,6 +33,7 @@ def set_all_status(semester=None, add_status_update=False, verbose=False):
         return
 
     sections_to_update = []
+    status_updates = []
     statuses_out_of_sync = []
     status_updates_out_of_sync = []
 
@@ -67,37 +74,32 @@ def set_all_status(semester=None, add_status_update=False, verbose=False):
 
         if add_status_update:
             if not last_status_update and course_status:
-                try:
-                    # If there is no last status update, the course was previously unlisted
-                    record_update(
-                        section,
-                        course_term,
-                        old_status="",
-                        new_status=course_status,
-                        alerted=False,
-                        req=json.dumps(status),
-                    )
-                    status_updates_out_of_sync.append(section_code)
-                except Exception as e:
-                    if verbose:
-                        print(f"Error recording status update for {section_code}: {e}")
+                # If there is no last status update, the course was previously unlisted
+                old_status = ""
             elif last_status_update.new_status != course_status:
-                try:
-                    record_update(
-                        section,
-                        course_term,
-                        old_status=last_status_update.new_status,
-                        new_status=course_status,
-                        alerted=False,
-                        req=json.dumps(status),
-                    )
-                    status_updates_out_of_sync.append(section_code)
-                except Exception as e:
-                    if verbose:
-                        print(f"Error recording status update for {section_code}: {e}")
+                old_status = last_status_update.new_status
+            else:
+                continue
+            try:
+                validate_status("Old status", old_status)
+                validate_status("New status", course_status)
+            except ValidationError as e:
+                if verbose:
+                    print(f"Error recording status update for {section_code}: {e}")
+                continue
+            status_updates.append((section, old_status, course_status, None, json.dumps(status)))
+            status_updates_out_of_sync.append(section_code)
 
     if sections_to_update:
-        Section.objects.bulk_update(sections_to_update, ["status"])
+        with transaction.atomic():
+            Section.objects.bulk_update(sections_to_update, ["status"])
+            update_open_activities({section.course_id for section in sections_to_update})
+            bump_course_search_generation(semester)
+    if status_updates:
+        # This also rebuilds the section demand index (if enabled)
+        record_updates_bulk(status_updates, semester)
+    elif sections_to_update and semester == get_current_semester() and demand_index_enabled():
+        rebuild_section_demand_index(semester)
 
     if verbose:
         print(f"{len(statuses_out_of_sync)} statuses were out of sync.")
@@ -0,0 +1,97 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from courses.filters import (
+    day_bitmap_filter,
+    day_filter,
+    meeting_bitmap_filter,
+    meeting_filter,
+    time_bitmap_filter,
+    time_filter,
+)
+from courses.models import Course
+from courses.util import get_current_semester, percentile
+
+
+DEFAULT_FILTERS = [
+    {"days": "MWF"},
+    {"days": "TR"},
+    {"days": "MTWRF", "time": "10-16"},
+    {"time": "9.30-"},
+    {"time": "-13.30"},
+    {"days": "MTW", "time": "12-18.30"},
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the days/time course search filters on a full semester, comparing the "
+        "meeting_filter path (aggregating over meetings and sections) with the precomputed "
+        "section meeting bitmap path (meeting_bitmap_filter). Also checks that both paths "
+        "return the same courses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester to filter (defaults to the current semester).",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=10,
+            help="The number of times to run each filter with each path.",
+        )
+
+    def filter_by_meetings(self, queryset, params):
+        meeting_query = Q()
+        if "days" in params:
+            meeting_query &= day_filter(params["days"])
+        if "time" in params:
+            meeting_query &= time_filter(params["time"])
+        return meeting_filter(queryset, meeting_query)
+
+    def filter_by_bitmaps(self, queryset, params):
+        excluded_slots = 0
+        if "days" in params:
+            excluded_slots |= day_bitmap_filter(params["days"])
+        if "time" in params:
+            excluded_slots |= time_bitmap_filter(params["time"])
+        return meeting_bitmap_filter(queryset, excluded_slots)
+
+    def run(self, label, filter_func, semester, iterations):
+        latencies = []
+        results = []
+        for params in DEFAULT_FILTERS:
+            for _ in range(iterations):
+                queryset = Course.objects.filter(semester=semester, sections__isnull=False)
+                start = time.perf_counter()
+                ids = set(filter_func(queryset, params).values_list("id", flat=True))
+                latencies.append(time.perf_counter() - start)
+            results.append(ids)
+        self.stdout.write(
+            f"{label}: p50 {percentile(latencies, 50) * 1000:.1f}ms, "
+            f"p95 {percentile(latencies, 95) * 1000:.1f}ms ({len(latencies)} filters)"
+        )
+        return results
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        num_courses = Course.objects.filter(semester=semester).count()
+        if not num_courses:
+            raise CommandError(f"No courses found for semester {semester}.")
+        self.stdout.write(f"Filtering {num_courses} courses in {semester}.")
+
+        by_meetings = self.run("meetings", self.filter_by_meetings, semester, kwargs["iterations"])
+        by_bitmaps = self.run("bitmaps", self.filter_by_bitmaps, semester, kwargs["iterations"])
+        for params, expected, actual in zip(DEFAULT_FILTERS, by_meetings, by_bitmaps):
+            if expected != actual:
+                self.stdout.write(
+                    f"Mismatch for {params}: {len(expected - actual)} courses missing, "
+                    f"{len(actual - expected)} extra courses with bitmaps "
+                    "(meetings not aligned to 5 minute slots?)"
+                )
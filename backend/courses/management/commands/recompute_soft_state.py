@@ -12,6 +12,7 @@ from django.db.models.functions import Coalesce
 from django.utils import timezone
 from tqdm import tqdm
 
+from alert.demand_index import demand_index_enabled, rebuild_section_demand_index
 from alert.models import (
     PcaDemandDistributionEstimate,
     Registration,
@@ -24,12 +25,23 @@ from courses.management.commands.load_add_drop_dates import (
     load_add_drop_dates,
 )
 from courses.management.commands.recompute_topics import recompute_topics
-from courses.models import Course, Meeting, StatusUpdate
+from courses.models import (
+    MEETING_BITMAP_DAYS,
+    MEETING_BITMAP_LENGTH,
+    MEETING_BITMAP_SLOT_MINUTES,
+    MEETING_BITMAP_SLOTS_PER_DAY,
+    Course,
+    Meeting,
+    StatusUpdate,
+)
+from courses.search import update_course_search_vectors
+from courses.search_cache import bump_course_search_generation
 from courses.util import (
     get_current_semester,
     get_or_create_add_drop_period,
     get_semesters,
     subquery_count_distinct,
+    update_open_activities,
 )
 from PennCourses.settings.base import ROUGH_MINIMUM_DEMAND_DISTRIBUTION_ESTIMATES
 from review.views import extra_metrics_section_filters
@@ -43,6 +55,11 @@ def recompute_num_activities():
     ).update(num_activities=F("activity_count"))
 
 
+def recompute_open_activities():
+    if update_open_activities():
+        bump_course_search_generation()
+
+
 def recompute_meeting_count():
     Section.objects.all().annotate(
         meeting_count=subquery_count_distinct(
@@ -51,6 +68,54 @@ def recompute_meeting_count():
     ).update(num_meetings=F("meeting_count"))
 
 
+def recompute_meeting_bitmaps():
+    """
+    Recomputes `Section.meeting_bitmap` for all sections, in a single query (only writing the
+    sections whose bitmap changed).
+    Should be kept consistent with `courses.util.meeting_slots_bitmap`.
+    """
+    minutes = "(FLOOR({time}) * 60 + ROUND(({time} - FLOOR({time})) * 100))"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+        UPDATE "courses_section" AS U0
+        SET "meeting_bitmap" = B."bitmap"
+        FROM (SELECT U2."id", COALESCE(
+            (SELECT BIT_OR(
+                (REPEAT('0', S.first_index) || REPEAT('1', S.last_index - S.first_index)
+                    || REPEAT('0', {MEETING_BITMAP_LENGTH} - S.last_index)
+                )::bit({MEETING_BITMAP_LENGTH})
+            )
+            FROM (
+                SELECT
+                    S0.day_offset + S0.first_slot AS first_index,
+                    S0.day_offset + LEAST(
+                        GREATEST(S0.end_slot, S0.first_slot + 1), {MEETING_BITMAP_SLOTS_PER_DAY}
+                    ) AS last_index
+                FROM (
+                    SELECT
+                        (POSITION(U1."day" IN '{MEETING_BITMAP_DAYS}') - 1)
+                            * {MEETING_BITMAP_SLOTS_PER_DAY} AS day_offset,
+                        LEAST(
+                            FLOOR({minutes.format(time='U1."start"')}
+                                / {MEETING_BITMAP_SLOT_MINUTES}),
+                            {MEETING_BITMAP_SLOTS_PER_DAY - 1}
+                        )::int AS first_slot,
+                        CEIL({minutes.format(time='U1."end"')}
+                            / {MEETING_BITMAP_SLOT_MINUTES})::int AS end_slot
+                    FROM "courses_meeting" AS U1
+                    WHERE U1."section_id" = U2."id"
+                        AND U1."day" <> ''
+                        AND POSITION(U1."day" IN '{MEETING_BITMAP_DAYS}') > 0
+                ) AS S0
+            ) AS S),
+            REPEAT('0', {MEETING_BITMAP_LENGTH})::bit({MEETING_BITMAP_LENGTH})
+        ) AS "bitmap" FROM "courses_section" AS U2) AS B
+        WHERE U0."id" = B."id" AND U0."meeting_bitmap" IS DISTINCT FROM B."bitmap"
+        """
+        )
+
+
 def recompute_has_reviews():
     with connection.cursor() as cursor:
         cursor.execute(
@@ -136,8 +201,10 @@ def recompute_precomputed_fields(verbose=False):
     """
     Recomputes the following precomputed fields:
         - Course.num_activities
+        - Course.num_open_activities / Course.all_activities_open
         - Course.credits
         - Section.num_meetings
+        - Section.meeting_bitmap
         - Section.has_reviews
         - Section.has_status_updates
 
@@ -149,12 +216,18 @@ def recompute_precomputed_fields(verbose=False):
     if verbose:
         print("\tRecomputing Course.num_activities")
     recompute_num_activities()
+    if verbose:
+        print("\tRecomputing Course.num_open_activities / Course.all_activities_open")
+    recompute_open_activities()
     if verbose:
         print("\tRecomputing Course.credits")
     recompute_course_credits()
     if verbose:
         print("\tRecomputing Section.num_meetings")
     recompute_meeting_count()
+    if verbose:
+        print("\tRecomputing Section.meeting_bitmap")
+    recompute_meeting_bitmaps()
     if verbose:
         print("\tRecomputing Section.has_reviews")
     recompute_has_reviews()
@@ -507,12 +580,48 @@ def recompute_demand_distribution_estimates(semesters: list[str], verbose=False)
         )
 
 
+def rebuild_section_demand_indexes(semesters: list[str], verbose=False):
+    """
+    Rebuilds the Redis section demand index (see `alert.demand_index`) from the DB,
+    if the SECTION_DEMAND_INDEX Option is enabled and the current semester is in the given
+    semesters (the index only covers the current semester).
+
+    :param semesters: Semesters for which you want to rebuild the section demand index.
+    :param verbose: Set to True if you want this script to print its status as it goes.
+    """
+    current_semester = get_current_semester()
+    if current_semester not in semesters or not demand_index_enabled():
+        return
+    num_sections = rebuild_section_demand_index(current_semester)
+    if verbose:
+        print(f"Rebuilt section demand index for {current_semester} ({num_sections} sections).")
+
+
+def recompute_course_search_vectors(semesters: list[str] = None, verbose=False):
+    """
+    Recomputes the `search_vector` field of all courses in the given semesters
+    (or of all courses, if `semesters` is None). Course search vectors include instructor names
+    and crosslisted codes, so they should be recomputed whenever sections are imported.
+
+    :param semesters: Semesters for which you want to recompute course search vectors.
+    :param verbose: Set to True if you want this script to print its status as it goes.
+    """
+    courses = Course.objects.all()
+    if semesters is not None:
+        courses = courses.filter(semester__in=semesters)
+    num_courses = update_course_search_vectors(courses)
+    if verbose:
+        print(f"Recomputed search vectors of {num_courses} courses.")
+
+
 def recompute_soft_state(semesters: list[str], verbose=False):
     recompute_topics(min_semester=min(semesters), verbose=verbose)
     adp_semesters = fill_in_add_drop_periods(verbose=verbose).intersection(semesters)
     load_add_drop_dates(verbose=verbose)
     deduplicate_status_updates(semesters=adp_semesters, verbose=verbose)
     recompute_demand_distribution_estimates(semesters=adp_semesters, verbose=verbose)
+    rebuild_section_demand_indexes(semesters=semesters, verbose=verbose)
+    recompute_course_search_vectors(semesters=semesters, verbose=verbose)
 
 
 class Command(BaseCommand):
@@ -1,14 +1,17 @@
 import logging
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from tqdm import tqdm
 
 from courses import registrar
+from courses.code_index import bump_code_index_version
 from courses.management.commands.loadstatus import set_all_status
 from courses.management.commands.recompute_parent_courses import recompute_parent_courses
 from courses.management.commands.recompute_soft_state import recompute_soft_state
 from courses.models import Department, Section
-from courses.util import get_current_semester, upsert_course_from_opendata
+from courses.search_cache import bump_course_search_generation
+from courses.util import get_current_semester, update_open_activities, upsert_course_from_opendata
 from review.management.commands.clearcache import clear_cache
 from review.management.commands.precompute_pcr_views import precompute_pcr_views
 
@@ -26,7 +29,9 @@ def registrar_import(semester=None, query=""):
     )
     for info in tqdm(results):
         upsert_course_from_opendata(info, semester, missing_sections)
-    Section.objects.filter(id__in=missing_sections).update(status="X")
+    with transaction.atomic():
+        Section.objects.filter(id__in=missing_sections).update(status="X")
+        update_open_activities(Section.objects.filter(id__in=missing_sections).values("course_id"))
 
     print("Updating department names...")
     departments = registrar.get_departments()
@@ -40,6 +45,8 @@ def registrar_import(semester=None, query=""):
 
     recompute_parent_courses(semesters=[semester], verbose=True)
     recompute_soft_state(semesters=[semester], verbose=True)
+    bump_code_index_version(semester)
+    bump_course_search_generation(semester)
 
     if semester.endswith("C"):
         # Make sure to load in summer course data as well
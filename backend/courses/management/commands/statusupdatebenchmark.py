@@ -0,0 +1,88 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from courses.models import Section
+from courses.util import (
+    get_current_semester,
+    get_or_create_add_drop_period,
+    record_update,
+    record_updates_bulk,
+    update_course_from_record,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ingesting a batch of status updates (as loadstatus and webhookbackup do), "
+        "comparing one record_update / update_course_from_record call per update with a "
+        "single record_updates_bulk call. Runs against existing sections in the given "
+        "semester; all changes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--num-updates",
+            type=int,
+            default=1000,
+            help="The number of status updates to ingest (at most one per section).",
+        )
+        parser.add_argument(
+            "--semester",
+            type=str,
+            default=None,
+            help="The semester of the sections to update (defaults to the current semester).",
+        )
+
+    def get_updates(self, sections):
+        now = timezone.now()
+        return [
+            (
+                section,
+                section.status,
+                "C" if section.status == "O" else "O",
+                now + timedelta(seconds=i),
+                json.dumps({"section_id_normalized": section.full_code}),
+            )
+            for i, section in enumerate(sections)
+        ]
+
+    def run(self, label, ingest, semester, num_updates):
+        with transaction.atomic():
+            sections = list(
+                Section.objects.filter(course__semester=semester)
+                .select_related("course")
+                .order_by("id")[:num_updates]
+            )
+            updates = self.get_updates(sections)
+            get_or_create_add_drop_period(semester)  # so neither path pays to create it
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                ingest(updates, semester)
+                elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f"{label}: {len(updates)} updates in {elapsed:.2f}s "
+            f"({len(updates) / elapsed:.1f} updates/sec, {len(queries)} queries)"
+        )
+
+    def handle(self, *args, **kwargs):
+        semester = kwargs["semester"] or get_current_semester()
+        if not Section.objects.filter(course__semester=semester).exists():
+            raise CommandError(f"No sections found for semester {semester}.")
+
+        def ingest_per_row(updates, semester):
+            for section, old_status, new_status, created_at, request_body in updates:
+                u = record_update(
+                    section, semester, old_status, new_status, False, request_body, created_at
+                )
+                update_course_from_record(u)
+
+        self.run("per row", ingest_per_row, semester, kwargs["num_updates"])
+        self.run("bulk", record_updates_bulk, semester, kwargs["num_updates"])
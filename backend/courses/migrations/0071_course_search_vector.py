@@ -0,0 +1,48 @@
+# Generated by Django 5.0.2 on 2026-10-17 02:41
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+from courses.management.commands.recompute_soft_state import recompute_course_search_vectors
+from courses.search import create_title_trigram_index, drop_title_trigram_index
+
+
+def compute_search_vectors(apps, schema_editor):
+    recompute_course_search_vectors()
+
+
+def create_trigram_index(apps, schema_editor):
+    create_title_trigram_index(schema_editor.connection)
+
+
+def drop_trigram_index(apps, schema_editor):
+    drop_title_trigram_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0070_rename_difficulty_course_precompute_difficulty_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True,
+                editable=False,
+                help_text="\nA weighted full text search vector of this course's title and crosslisted codes (A),\ninstructor names (B) and description (C), used by course keyword search\n(see `backend/courses/search.py`). Updated whenever the course is saved, and\nrecomputed by the registrar import / recompute_soft_state script (to reflect\ninstructor changes).\n",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="course_search_vector_idx"
+            ),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        migrations.RunPython(compute_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.2 on 2026-10-17 03:28
+
+from django.db import migrations
+
+import courses.models
+from courses.management.commands.recompute_soft_state import recompute_meeting_bitmaps
+
+
+def compute_meeting_bitmaps(apps, schema_editor):
+    recompute_meeting_bitmaps()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0071_course_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="section",
+            name="meeting_bitmap",
+            field=courses.models.BitStringField(
+                blank=True,
+                editable=False,
+                help_text="\nA bitmap of the weekly time slots occupied by this section's meetings, with one bit\nper 5 minute slot of each day (M, T, W, R, F, S, U, each from midnight), used by the\ndays/time search filters (precomputed for efficiency). A meeting occupies every slot\noverlapping its start-end interval.\nMaintained by the registrar import / recompute_soft_state script.\n",
+                length=2016,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(compute_meeting_bitmaps, migrations.RunPython.noop),
+    ]
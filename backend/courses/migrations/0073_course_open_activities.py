@@ -0,0 +1,37 @@
+# Generated by Django 5.0.2 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+from courses.management.commands.recompute_soft_state import recompute_open_activities
+
+
+def compute_open_activities(apps, schema_editor):
+    recompute_open_activities()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0072_section_meeting_bitmap"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="all_activities_open",
+            field=models.BooleanField(
+                db_index=True,
+                default=False,
+                help_text="\nTrue if every activity of this course has at least one open section, i.e.\n`num_open_activities` equals `num_activities` (and the course has sections);\nused by the `is_open` search filter. Precomputed for efficiency, see\n`num_open_activities`.\n",
+            ),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="num_open_activities",
+            field=models.IntegerField(
+                default=0,
+                help_text="\nThe number of distinct activities of this course with at least one open section\n(precomputed for efficiency). Updated (along with `all_activities_open`) with every\nsection status change, and reconciled by the recompute_soft_state script.\n",
+            ),
+        ),
+        migrations.RunPython(compute_open_activities, migrations.RunPython.noop),
+    ]
@@ -4,6 +4,8 @@ from textwrap import dedent
 
 import phonenumbers
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models, transaction
@@ -12,6 +14,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
 
+from courses.search_cache import bump_course_search_generation
 from PennCourses.settings.base import FIRST_BANNER_SEM, PRE_NGSS_PERMIT_REQ_RESTRICTION_CODES
 from review.annotations import review_averages
 
@@ -30,6 +33,56 @@ def string_dict_to_html(dictionary):
     return "".join(html)
 
 
+# Weekly meeting bitmaps (see `Section.meeting_bitmap`) have one bit per 5 minute slot of the week
+MEETING_BITMAP_DAYS = "MTWRFSU"
+MEETING_BITMAP_SLOT_MINUTES = 5
+MEETING_BITMAP_SLOTS_PER_DAY = 24 * 60 // MEETING_BITMAP_SLOT_MINUTES
+MEETING_BITMAP_LENGTH = len(MEETING_BITMAP_DAYS) * MEETING_BITMAP_SLOTS_PER_DAY
+
+
+class BitStringField(models.Field):
+    """
+    A fixed length Postgres bit string (`bit(n)`), represented in Python as a string
+    of 0s and 1s. Supports the `disjoint` lookup (see `BitStringDisjoint`).
+    """
+
+    description = "Fixed length bit string"
+
+    def __init__(self, *args, length, **kwargs):
+        self.length = length
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["length"] = self.length
+        return name, path, args, kwargs
+
+    def db_type(self, connection):
+        return f"bit({self.length})"
+
+    def get_placeholder(self, value, compiler, connection):
+        return f"%s::bit({self.length})"
+
+
+@BitStringField.register_lookup
+class BitStringDisjoint(models.Lookup):
+    """
+    `field__disjoint=bits` matches rows where the field has no bits set in common with `bits`
+    (a string of 0s and 1s of the field's length).
+    """
+
+    lookup_name = "disjoint"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        length = self.lhs.output_field.length
+        return (
+            f"({lhs} & {rhs}::bit({length})) = B'0'::bit({length})",
+            lhs_params + rhs_params,
+        )
+
+
 """
 Core Course Models
 ==================
@@ -300,6 +353,28 @@ class Course(models.Model):
             """
         ),
     )
+    num_open_activities = models.IntegerField(
+        default=0,
+        help_text=dedent(
+            """
+            The number of distinct activities of this course with at least one open section
+            (precomputed for efficiency). Updated (along with `all_activities_open`) with every
+            section status change, and reconciled by the recompute_soft_state script.
+            """
+        ),
+    )
+    all_activities_open = models.BooleanField(
+        default=False,
+        db_index=True,
+        help_text=dedent(
+            """
+            True if every activity of this course has at least one open section, i.e.
+            `num_open_activities` equals `num_activities` (and the course has sections);
+            used by the `is_open` search filter. Precomputed for efficiency, see
+            `num_open_activities`.
+            """
+        ),
+    )
 
     annotation_expiration = models.DateTimeField(
         default=timezone.now,
@@ -326,12 +401,31 @@ class Course(models.Model):
         max_digits=4, decimal_places=3, null=True, blank=True
     )
 
+    search_vector = SearchVectorField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=dedent(
+            """
+            A weighted full text search vector of this course's title and crosslisted codes (A),
+            instructor names (B) and description (C), used by course keyword search
+            (see `backend/courses/search.py`). Updated whenever the course is saved, and
+            recomputed by the registrar import / recompute_soft_state script (to reflect
+            instructor changes).
+            """
+        ),
+    )
+
+    # Fields which the search vector is computed from, and which trigger its update when saved
+    SEARCH_VECTOR_FIELDS = {"title", "description", "department", "code", "primary_listing"}
+
     class Meta:
         unique_together = (
             ("department", "code", "semester"),
             ("full_code", "semester"),
             ("topic", "semester"),
         )
+        indexes = [GinIndex(fields=["search_vector"], name="course_search_vector_idx")]
 
     def __str__(self):
         return "%s %s" % (self.full_code, self.semester)
@@ -388,8 +482,11 @@ class Course(models.Model):
         This overridden `.save()` method enforces the following invariants on the course:
           - The course's full code equals the dash-joined department and code
           - If a course doesn't have crosslistings, its `primary_listing` is a self-reference
+          - The `search_vector` of the course (and its crosslistings, which include its code
+            in theirs) reflects its title, description and code
         """
-        from courses.util import get_set_id, is_fk_set  # avoid circular imports
+        from courses.search import update_course_search_vectors  # avoid circular imports
+        from courses.util import get_set_id, is_fk_set
 
         self.full_code = f"{self.department.code}-{self.code}"
 
@@ -400,6 +497,12 @@ class Course(models.Model):
 
             super().save(*args, **kwargs)
 
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None or not self.SEARCH_VECTOR_FIELDS.isdisjoint(update_fields):
+                update_course_search_vectors(
+                    Course.objects.filter(primary_listing_id=self.primary_listing_id)
+                )
+
 
 class Topic(models.Model):
     """
@@ -824,6 +927,21 @@ class Section(models.Model):
             """
         ),
     )
+    meeting_bitmap = BitStringField(
+        length=MEETING_BITMAP_LENGTH,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=dedent(
+            """
+            A bitmap of the weekly time slots occupied by this section's meetings, with one bit
+            per 5 minute slot of each day (M, T, W, R, F, S, U, each from midnight), used by the
+            days/time search filters (precomputed for efficiency). A meeting occupies every slot
+            overlapping its start-end interval.
+            Maintained by the registrar import / recompute_soft_state script.
+            """
+        ),
+    )
 
     instructors = models.ManyToManyField(
         Instructor,
@@ -1003,9 +1121,31 @@ class Section(models.Model):
         except StatusUpdate.DoesNotExist:
             return None
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        section = super().from_db(db, field_names, values)
+        section._loaded_status = section.__dict__.get("status")
+        return section
+
     def save(self, *args, **kwargs):
+        """
+        This overridden `.save()` method sets the section's full code, and (if the section's status
+        changed since it was loaded) updates its course's `num_open_activities` and
+        `all_activities_open` fields in the same transaction.
+        """
+        from courses.util import update_open_activities  # avoid circular imports
+
         self.full_code = f"{self.course.full_code}-{self.code}"
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        status_changed = (update_fields is None or "status" in update_fields) and (
+            self._state.adding or self.status != getattr(self, "_loaded_status", None)
+        )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if status_changed and update_open_activities([self.course_id]):
+                # Search results filter on all_activities_open
+                bump_course_search_generation(self.course.semester)
+        self._loaded_status = self.status
 
 
 class StatusUpdate(models.Model):
@@ -1065,6 +1205,24 @@ class StatusUpdate(models.Model):
             f"@ {str(self.created_at)}"
         )
 
+    def set_add_drop_fields(self, add_drop_period):
+        """
+        Sets the in_add_drop_period and percent_through_add_drop_period fields (without saving),
+        given the add/drop period object for the semester of this StatusUpdate object.
+        """
+        created_at = self.created_at
+        start = add_drop_period.estimated_start
+        end = add_drop_period.estimated_end
+        if created_at < start:
+            self.in_add_drop_period = False
+            self.percent_through_add_drop_period = 0
+        elif created_at > end:
+            self.in_add_drop_period = False
+            self.percent_through_add_drop_period = 1
+        else:
+            self.in_add_drop_period = True
+            self.percent_through_add_drop_period = (created_at - start) / (end - start)
+
     def save(self, *args, **kwargs):
         """
         This overridden save method first gets the add/drop period object for the semester of this
@@ -1074,7 +1232,7 @@ class StatusUpdate(models.Model):
         it sets the percent_through_add_drop_period field.
         """
         from alert.models import validate_add_drop_semester
-        from alert.tasks import section_demand_change
+        from alert.tasks import schedule_demand_distribution_update
         from courses.util import get_or_create_add_drop_period
 
         # ^ imported here to avoid circular imports
@@ -1095,24 +1253,13 @@ class StatusUpdate(models.Model):
         if add_drop_period is None:
             add_drop_period = get_or_create_add_drop_period(self.section.semester)
 
-        created_at = self.created_at
-        start = add_drop_period.estimated_start
-        end = add_drop_period.estimated_end
-        if created_at < start:
-            self.in_add_drop_period = False
-            self.percent_through_add_drop_period = 0
-        elif created_at > end:
-            self.in_add_drop_period = False
-            self.percent_through_add_drop_period = 1
-        else:
-            self.in_add_drop_period = True
-            self.percent_through_add_drop_period = (created_at - start) / (end - start)
+        self.set_add_drop_fields(add_drop_period)
         super().save()
 
         self.section.has_status_updates = True
         self.section.save()
 
-        section_demand_change.delay(self.section.id, self.created_at)
+        schedule_demand_distribution_update(self.section.semester, self.created_at)
 
 
 """
@@ -1,10 +1,30 @@
+import logging
 import operator
 import re
-from functools import reduce
+from functools import lru_cache, reduce
 
-from django.db.models import Q
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import connection
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, TextField, Value, When
+from django.db.models.functions import Coalesce
+from options.models import get_bool
 from rest_framework import filters
 
+from courses.code_index import lookup_code_prefixes
+from courses.models import Course, Instructor, Section
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = "english"
+TITLE_TRIGRAM_INDEX = "course_title_trgm_idx"
+
 
 def filter_or_lookups_terms(queryset, orm_lookups, search_terms):
     """
@@ -17,6 +37,102 @@ def filter_or_lookups_terms(queryset, orm_lookups, search_terms):
     return queryset.filter(reduce(operator.or_, conditions))
 
 
+def update_course_search_vectors(courses):
+    """
+    Recomputes the `search_vector` field of the given Course queryset, in a single query.
+    Titles and crosslisted codes are weighted highest (A), then instructor names (B),
+    then descriptions (C). Returns the number of courses updated.
+    """
+    instructor_names = Subquery(
+        Instructor.objects.filter(section__course_id=OuterRef("id"))
+        .values("section__course_id")
+        .annotate(names=StringAgg("name", " ", distinct=True))
+        .values("names")
+    )
+    crosslisted_codes = Subquery(
+        Course.objects.filter(primary_listing_id=OuterRef("primary_listing_id"))
+        .values("primary_listing_id")
+        .annotate(codes=StringAgg("full_code", " "))
+        .values("codes")
+    )
+    return courses.update(
+        search_vector=(
+            SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector(
+                Coalesce(crosslisted_codes, Value(""), output_field=TextField()),
+                weight="A",
+                config=SEARCH_CONFIG,
+            )
+            + SearchVector(
+                Coalesce(instructor_names, Value(""), output_field=TextField()),
+                weight="B",
+                config=SEARCH_CONFIG,
+            )
+            + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+        )
+    )
+
+
+def pg_trgm_available(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def create_title_trigram_index(connection):
+    """
+    Creates the pg_trgm extension and a trigram index on course titles (used for typo-tolerant
+    keyword search), if the extension is available on the database server.
+    """
+    if not pg_trgm_available(connection):
+        logger.warning("pg_trgm is not available; course search will not match typos.")
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TITLE_TRIGRAM_INDEX} "
+            "ON courses_course USING gin (title gin_trgm_ops)"
+        )
+
+
+def drop_title_trigram_index(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP INDEX IF EXISTS {TITLE_TRIGRAM_INDEX}")
+
+
+@lru_cache(maxsize=None)
+def trigram_search_available():
+    """
+    Returns whether the pg_trgm extension is installed (see `create_title_trigram_index`).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def full_text_search(queryset, query, code_prefixes=()):
+    """
+    Filters the given Course queryset to courses matching the given keyword query, using the
+    `search_vector` full text search index (and trigram similarity to course titles, if pg_trgm
+    is installed, so typos still match), or starting with any of the given code prefixes.
+    Returns a tuple `(queryset, rank)`, where `rank` is an expression ranking each course's
+    relevance to the query (courses matching a code prefix first).
+    """
+    search_query = SearchQuery(query, search_type="websearch", config=SEARCH_CONFIG)
+    condition = Q(search_vector=search_query)
+    rank = SearchRank(F("search_vector"), search_query)
+    if trigram_search_available():
+        condition |= Q(title__trigram_word_similar=query)
+        rank = rank + TrigramWordSimilarity(query, "title")
+    if code_prefixes:
+        code_match = reduce(operator.or_, [Q(full_code__istartswith=p) for p in code_prefixes])
+        condition |= code_match
+        rank = rank + Case(
+            When(code_match, then=Value(1.0)), default=Value(0.0), output_field=FloatField()
+        )
+    return queryset.filter(condition), rank
+
+
 class TypedCourseSearchBackend(filters.SearchFilter):
     code_res = [
         re.compile(r"^([A-Za-z]{" + str(dept_len) + r"})\s*-?\s*(\d{1,4}[A-Za-z]?|[A-Za-z]{1,3})?$")
@@ -88,6 +204,14 @@ class TypedCourseSearchBackend(filters.SearchFilter):
         if not self.get_query(request):
             return queryset
 
+        if self.get_search_type(request) != "course" and get_bool("COURSE_FULL_TEXT_SEARCH", False):
+            # The last search term is the keyword query, any others are code prefixes
+            *code_prefixes, query = self.get_search_terms(request)
+            queryset, rank = full_text_search(queryset, query, code_prefixes)
+            # Results are ordered by rank by the view (see `CourseListSearch.filter_queryset`)
+            view.search_rank = rank
+            return queryset
+
         search_fields = self.get_search_fields(view, request)
         orm_lookups = [
             self.construct_search(str(search_field), queryset) for search_field in search_fields
@@ -96,6 +220,11 @@ class TypedCourseSearchBackend(filters.SearchFilter):
         if not search_terms:
             return queryset.none()
 
+        if self.get_search_type(request) == "course":
+            ids = lookup_code_prefixes(Course, view.get_semester(), search_terms)
+            if ids is not None:
+                return queryset.filter(id__in=ids)
+
         return filter_or_lookups_terms(queryset, orm_lookups, search_terms)
 
 
@@ -132,4 +261,8 @@ class TypedSectionSearchBackend(filters.SearchFilter):
         if not search_terms:
             return queryset.none()
 
+        ids = lookup_code_prefixes(Section, view.get_semester(), search_terms)
+        if ids is not None:
+            return queryset.filter(id__in=ids)
+
         return filter_or_lookups_terms(queryset, orm_lookups, search_terms)
@@ -0,0 +1,124 @@
+"""
+A response cache for the course search route (`CourseListSearch`), enabled by the
+COURSE_SEARCH_CACHE setting.
+
+Responses are cached (in the Django cache) under the semester and the normalized query
+params, with the recommendation scores left out; the scores of authenticated users are
+overlaid on the cached body (see `CourseListSearch.list`). Schedule-fit searches depend on
+the user's schedule, so they are never cached.
+
+Rather than deleting entries, we invalidate them with generation tokens: each key includes
+the current generation of its semester and a global generation, so bumping a generation
+(see `bump_course_search_generation`) orphans every entry keyed on it (orphaned entries
+expire after COURSE_SEARCH_CACHE_TIMEOUT). Semester generations are bumped after each
+registrar import, and whenever section status changes could change search results (e.g.
+when a course's `all_activities_open` flips). The global generation is bumped after each
+review import, since review averages span semesters.
+
+To avoid a stampede of rebuilds after a bump, each entry is rebuilt by one request at a time
+(see `get_or_rebuild`); meanwhile, other requests are served the entry's previous value, which
+is also cached under a key without generations.
+"""
+
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from PennCourses.settings.base import CACHE_PREFIX
+
+
+COURSE_SEARCH_CACHE_TIMEOUT = 60 * 60 * 24
+CACHE_REBUILD_LOCK_TIMEOUT = 60  # the max time a rebuild can hold its lock, in seconds
+GLOBAL_GENERATION = "global"
+UNCACHED_SEARCH_PARAMS = {"schedule-fit"}  # results depend on the user
+
+
+def course_search_generation_key(semester):
+    return f"{CACHE_PREFIX}course_search_generation:{semester}"
+
+
+def get_course_search_generations(semesters):
+    """
+    Returns a list of the current generation tokens of the given semesters (or
+    GLOBAL_GENERATION), creating tokens for semesters without one, or None if a token can't
+    be stored (e.g. the cache is unreachable), in which case nothing should be cached.
+    """
+    keys = [course_search_generation_key(semester) for semester in semesters]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # A new random token (rather than a counter), so a lost token can't repeat
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            generations[key] = cache.get(key)
+            if generations[key] is None:
+                return None
+    return [generations[key] for key in keys]
+
+
+def bump_course_search_generation(semester=GLOBAL_GENERATION):
+    """
+    Invalidates the cached course search responses of the given semester (or of all semesters,
+    by default), once the current transaction commits (if any).
+    """
+    transaction.on_commit(
+        lambda: cache.set(course_search_generation_key(semester), uuid.uuid4().hex, timeout=None)
+    )
+
+
+def course_search_digest(query_params, variants):
+    params = sorted((key, sorted(query_params.getlist(key))) for key in query_params)
+    return hashlib.md5(repr((params, variants)).encode()).hexdigest()
+
+
+def course_search_cache_key(semester, query_params, *variants):
+    """
+    Returns the cache key of the course search response for the given semester, query params
+    (a QueryDict) and any other values the response depends on, or None if the response
+    shouldn't be cached.
+    """
+    if not settings.COURSE_SEARCH_CACHE or semester == "all":
+        return None
+    if UNCACHED_SEARCH_PARAMS.intersection(query_params):
+        return None
+    generations = get_course_search_generations([semester, GLOBAL_GENERATION])
+    if generations is None:
+        return None
+    digest = course_search_digest(query_params, variants)
+    return f"{CACHE_PREFIX}course_search:{semester}:{':'.join(generations)}:{digest}"
+
+
+def course_search_stale_key(semester, query_params, *variants):
+    """
+    Returns the key (without generations) under which the last response built for the given
+    search is cached, to be served while it is rebuilt (see `get_or_rebuild`).
+    """
+    digest = course_search_digest(query_params, variants)
+    return f"{CACHE_PREFIX}course_search_stale:{semester}:{digest}"
+
+
+def get_or_rebuild(key, stale_key, build, timeout):
+    """
+    Returns the value cached under `key`, or builds it with the given `build` function and
+    caches it under both `key` and `stale_key`. Only one caller rebuilds a given key at a time
+    (guarded by a `cache.add` lock); other callers get the value cached under `stale_key`
+    (i.e. the value from before the last generation bump), or build it without caching it if
+    there is none.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock_key = f"{key}:rebuilding"
+    if cache.add(lock_key, True, timeout=CACHE_REBUILD_LOCK_TIMEOUT):
+        try:
+            value = build()
+            cache.set_many({key: value, stale_key: value}, timeout=timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+    value = cache.get(stale_key)
+    if value is not None:
+        return value
+    return build()
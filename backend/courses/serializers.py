@@ -15,7 +15,6 @@ from courses.models import (
     StatusUpdate,
     UserProfile,
 )
-from plan.management.commands.recommendcourses import cosine_similarity
 
 
 class MeetingSerializer(serializers.ModelSerializer):
@@ -294,23 +293,19 @@ class CourseListSerializer(serializers.ModelSerializer):
         return obj.sections.count()
 
     def get_recommendation_score(self, obj):
-        user_vector = self.context.get("user_vector")
-        curr_course_vectors_dict = self.context.get("curr_course_vectors_dict")
-
-        if user_vector is None or curr_course_vectors_dict is None:
-            # NOTE: there should be no case in which user_vector is None
-            # but curr_course_vectors_dict is not None. However, for
-            # stability in production, recommendation_score is None when
-            # either is None
-            return None
+        return self.compute_recommendation_score(obj.full_code, self.context)
 
-        course_vector = curr_course_vectors_dict.get(obj.full_code)
-        if course_vector is None:
-            # Fires when the curr_course_vectors_dict is defined (ie, the user is authenticated)
-            # but the course code is not in the model
+    @staticmethod
+    def compute_recommendation_score(full_code, context):
+        """
+        Returns the recommendation score of the course with the given full code, given a
+        serializer context (see `CourseListSearch.get_serializer_context`).
+        """
+        recommendation_scores = context.get("recommendation_scores")
+        if recommendation_scores is None:
             return None
-
-        return cosine_similarity(course_vector, user_vector)
+        # None if the course is not in the model
+        return recommendation_scores.get(full_code)
 
     course_quality = serializers.DecimalField(
         max_digits=4, decimal_places=3, read_only=True, help_text=course_quality_help
@@ -1,5 +1,6 @@
 import json
 import logging
+import math
 import os
 import re
 import uuid
@@ -7,16 +8,21 @@ from decimal import Decimal
 
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db import connection
+from django.db import connection, transaction
 from django.db.models.aggregates import Count
-from django.db.models.expressions import Subquery, Value
+from django.db.models.expressions import Case, F, OuterRef, Subquery, Value, When
 from django.db.models.functions.comparison import Coalesce
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from options.models import Option, get_value
 from rest_framework.exceptions import APIException
 
 from courses.models import (
+    MEETING_BITMAP_DAYS,
+    MEETING_BITMAP_LENGTH,
+    MEETING_BITMAP_SLOT_MINUTES,
+    MEETING_BITMAP_SLOTS_PER_DAY,
     Attribute,
     Building,
     Course,
@@ -29,6 +35,7 @@ from courses.models import (
     StatusUpdate,
     User,
 )
+from courses.search_cache import bump_course_search_generation
 from plan.models import Break
 from review.management.commands.mergeinstructors import resolve_duplicates
 
@@ -312,15 +319,23 @@ def update_percent_open(section, new_status_update):
     This function updates a section's percent_open field when a new status update is processed.
     """
     add_drop = get_or_create_add_drop_period(section.semester)
-    last_status_update = section.last_status_update
+    if set_percent_open(section, section.last_status_update, new_status_update, add_drop):
+        section.save()
+
+
+def set_percent_open(section, last_status_update, new_status_update, add_drop):
+    """
+    Sets (without saving) a section's percent_open field to account for a new status update,
+    given the section's last status update before it (or None) and the add/drop period object
+    for the section's semester. Returns True if percent_open was changed, False otherwise.
+    """
     if new_status_update.created_at < add_drop.estimated_start:
-        return
+        return False
     if last_status_update is None:
         section.percent_open = Decimal(int(new_status_update.old_status == "O"))
-        section.save()
     else:
         if last_status_update.created_at >= add_drop.estimated_end:
-            return
+            return False
         seconds_before_last = Decimal(
             max(
                 (last_status_update.created_at - add_drop.estimated_start).total_seconds(),
@@ -340,11 +355,12 @@ def update_percent_open(section, new_status_update):
             Decimal(section.percent_open) * seconds_before_last
             + int(new_status_update.old_status == "O") * seconds_since_last
         ) / (seconds_before_last + seconds_since_last)
-        section.save()
+    return True
 
 
 def record_update(section, semester, old_status, new_status, alerted, req, created_at=None):
     from alert.models import validate_add_drop_semester  # avoid circular imports
+    from alert.status_cache import cache_statuses_on_commit
 
     u = StatusUpdate(
         section=section,
@@ -357,16 +373,9 @@ def record_update(section, semester, old_status, new_status, alerted, req, creat
         u.created_at = created_at
     u.save()
 
-    valid_status_choices = dict(Section.STATUS_CHOICES).keys()
-
-    def validate_status(name, status):
-        if status not in valid_status_choices:
-            raise ValidationError(
-                f"{name} is invalid; expected a value in {valid_status_choices}, but got {status}"
-            )
-
     validate_status("Old status", old_status)
     validate_status("New status", new_status)
+    cache_statuses_on_commit([u])
 
     # Raises ValidationError if semester is not fall or spring (and correctly formatted)
     validate_add_drop_semester(semester)
@@ -375,6 +384,95 @@ def record_update(section, semester, old_status, new_status, alerted, req, creat
     return u
 
 
+def validate_status(name, status):
+    valid_status_choices = dict(Section.STATUS_CHOICES).keys()
+    if status not in valid_status_choices:
+        raise ValidationError(
+            f"{name} is invalid; expected a value in {valid_status_choices}, but got {status}"
+        )
+
+
+def record_updates_bulk(updates, semester):
+    """
+    Records many status updates at once, with the same effect as calling `record_update`
+    followed by `update_course_from_record` for each update (in order of created_at), but in a
+    constant number of queries: the add/drop period is looked up once, the StatusUpdate
+    fields set by `StatusUpdate.save` are computed in memory, the status updates are
+    bulk-created, the sections are bulk-updated, and a single demand distribution update is
+    scheduled (rather than one per update).
+
+    :param updates: a list of `(section, old_status, new_status, created_at, request_body)`
+        tuples, optionally followed by an `alert_sent` bool (defaults to False); `created_at`
+        can be None, in which case it defaults to now. All sections must be in the given
+        semester.
+    :param semester: the semester of the status updates
+    :return: a list of the created StatusUpdate objects
+    """
+    from alert.demand_index import demand_index_enabled, rebuild_section_demand_index
+    from alert.models import validate_add_drop_semester
+    from alert.status_cache import cache_statuses_on_commit
+    from alert.tasks import schedule_demand_distribution_update
+
+    # ^ imported here to avoid circular imports
+
+    status_updates = []
+    for section, old_status, new_status, created_at, request_body, *alert_sent in updates:
+        validate_status("Old status", old_status)
+        validate_status("New status", new_status)
+        status_updates.append(
+            StatusUpdate(
+                section=section,
+                old_status=old_status,
+                new_status=new_status,
+                alert_sent=bool(alert_sent and alert_sent[0]),
+                request_body=request_body,
+                created_at=created_at or timezone.now(),
+            )
+        )
+    if not status_updates:
+        return []
+    status_updates.sort(key=lambda u: u.created_at)
+
+    try:
+        validate_add_drop_semester(semester)
+        add_drop = get_or_create_add_drop_period(semester)
+    except ValidationError:
+        add_drop = None  # StatusUpdate.save only sets add/drop fields for fall / spring
+
+    sections = {u.section.id: u.section for u in status_updates}
+    last_status_updates = {
+        u.section_id: u
+        for u in StatusUpdate.objects.filter(section_id__in=sections.keys())
+        .order_by("section_id", "-created_at")
+        .distinct("section_id")
+    }
+    for u in status_updates:
+        section = sections[u.section_id]
+        if add_drop is not None:
+            u.set_add_drop_fields(add_drop)
+            set_percent_open(section, last_status_updates.get(section.id), u, add_drop)
+            section.has_status_updates = True
+        section.status = u.new_status
+        last_status_updates[section.id] = u
+
+    with transaction.atomic():
+        StatusUpdate.objects.bulk_create(status_updates)
+        cache_statuses_on_commit(status_updates)
+        Section.objects.bulk_update(
+            sections.values(), ["status", "percent_open", "has_status_updates"]
+        )
+        if update_open_activities({section.course_id for section in sections.values()}) or any(
+            not {u.old_status, u.new_status} <= {"O", "C"} for u in status_updates
+        ):
+            bump_course_search_generation(semester)
+
+    if add_drop is not None:
+        if semester == get_current_semester() and demand_index_enabled():
+            rebuild_section_demand_index(semester)
+        schedule_demand_distribution_update(semester, status_updates[-1].created_at)
+    return status_updates
+
+
 def import_instructor(pennid, name, stat=None):
     if not stat:
         stat = lambda key, amt=1, element=None: None  # noqa E731
@@ -466,6 +564,61 @@ def clean_meetings(meetings):
     }.values()
 
 
+def time_to_minutes(time):
+    """
+    Converts a time of the form hh.mm = h+mm/100 (as stored in `Meeting.start`/`Meeting.end`)
+    to minutes since midnight.
+    """
+    hours = math.floor(time)
+    return hours * 60 + round((time - hours) * 100)
+
+
+def day_slots_bitmap(day_index, first_slot, last_slot):
+    """
+    Returns a meeting bitmap (as an int, see `bitmap_to_string`) with the slots
+    `[first_slot, last_slot)` of the given day (an index into MEETING_BITMAP_DAYS) set.
+    """
+    if last_slot <= first_slot:
+        return 0
+    last_index = day_index * MEETING_BITMAP_SLOTS_PER_DAY + last_slot
+    return ((1 << (last_slot - first_slot)) - 1) << (MEETING_BITMAP_LENGTH - last_index)
+
+
+def meeting_slots_bitmap(day, start, end):
+    """
+    Returns a meeting bitmap (as an int) with the slots occupied by a meeting on the given day
+    from the given start time to the given end time (hh.mm) set, i.e. every slot overlapping the
+    meeting (and at least one slot). Meetings on days not in MEETING_BITMAP_DAYS occupy no slots.
+    Should be kept consistent with `recompute_meeting_bitmaps`.
+    """
+    if not day or day not in MEETING_BITMAP_DAYS:
+        return 0
+    first_slot = min(
+        time_to_minutes(start) // MEETING_BITMAP_SLOT_MINUTES, MEETING_BITMAP_SLOTS_PER_DAY - 1
+    )
+    last_slot = -(-time_to_minutes(end) // MEETING_BITMAP_SLOT_MINUTES)  # ceiling division
+    last_slot = min(max(last_slot, first_slot + 1), MEETING_BITMAP_SLOTS_PER_DAY)
+    return day_slots_bitmap(MEETING_BITMAP_DAYS.index(day), first_slot, last_slot)
+
+
+def bitmap_to_string(bitmap):
+    """
+    Converts a meeting bitmap represented as an int (with slot 0 of the first day as the most
+    significant bit) to the string of 0s and 1s stored in `Section.meeting_bitmap`.
+    """
+    return format(bitmap, f"0{MEETING_BITMAP_LENGTH}b")
+
+
+def get_meeting_bitmap(meetings):
+    """
+    Returns the meeting bitmap string of the given `(day, start, end)` meeting tuples.
+    """
+    bitmap = 0
+    for day, start, end in meetings:
+        bitmap |= meeting_slots_bitmap(day, start, end)
+    return bitmap_to_string(bitmap)
+
+
 def set_meetings(obj, meetings):
     meetings = clean_meetings(meetings)
 
@@ -477,6 +630,7 @@ def set_meetings(obj, meetings):
     obj.meeting_times = json.dumps(meeting_times)
 
     obj.meetings.all().delete()
+    meeting_slots = []
     for meeting in meetings:
         online = (
             not meeting["building_code"]
@@ -493,6 +647,7 @@ def set_meetings(obj, meetings):
         start_date = extract_date(meeting.get("start_date"))
         end_date = extract_date(meeting.get("end_date"))
         for day in list(meeting["days"]):
+            meeting_slots.append((day, start_time, end_time))
             meeting = Meeting.objects.update_or_create(
                 section=obj if isinstance(obj, Section) else None,
                 associated_break=obj if isinstance(obj, Break) else None,
@@ -505,6 +660,8 @@ def set_meetings(obj, meetings):
                     "end_date": end_date,
                 },
             )
+    if isinstance(obj, Section):
+        obj.meeting_bitmap = get_meeting_bitmap(meeting_slots)
 
 
 def add_associated_sections(section, linked_sections):
@@ -637,9 +794,16 @@ def add_restrictions(section, restrictions):
 
 
 def update_course_from_record(update):
+    from alert.demand_index import update_section_demand_index  # avoid circular imports
+
     section = update.section
     section.status = update.new_status
-    section.save()
+    with transaction.atomic():
+        section.save()  # also updates the course's all_activities_open
+        if not {update.old_status, update.new_status} <= {"O", "C"}:
+            # Search results list open/closed sections
+            bump_course_search_generation(section.semester)
+    update_section_demand_index(section)
 
 
 # averages review data for a given field, given a list of Review objects
@@ -680,6 +844,31 @@ def subquery_count_distinct(subquery, column):
     )
 
 
+def update_open_activities(course_ids=None):
+    """
+    Recomputes the `num_open_activities` and `all_activities_open` fields of the courses with
+    the given ids (or of all courses, if course_ids is None), in a single query.
+    This should be called (in the same transaction) whenever section statuses change.
+    Returns the number of courses whose fields changed.
+    """
+    courses = (
+        Course.objects.all() if course_ids is None else Course.objects.filter(id__in=course_ids)
+    )
+    return (
+        courses.annotate(
+            open_activity_count=subquery_count_distinct(
+                Section.objects.filter(course_id=OuterRef("id"), status="O"), column="activity"
+            ),
+            open=Case(
+                When(num_activities__gt=0, num_activities=F("open_activity_count"), then=True),
+                default=False,
+            ),
+        )
+        .exclude(num_open_activities=F("open_activity_count"), all_activities_open=F("open"))
+        .update(num_open_activities=F("open_activity_count"), all_activities_open=F("open"))
+    )
+
+
 def does_object_pass_filter(obj, filter):
     """
     Returns True iff the given obj satisfies the given filter dictionary.
@@ -777,3 +966,13 @@ def historical_semester_probability(current_semester: str, semesters: list[str])
             ],
         )
     )
+
+
+def percentile(values, p):
+    """
+    Returns the `p`th percentile (0-100) of the given values (nearest rank), or None if empty.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(int(p / 100 * len(values)), len(values) - 1)]
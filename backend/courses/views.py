@@ -1,17 +1,27 @@
+import binascii
+import json
+import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from itertools import islice
 from textwrap import dedent
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models import Prefetch, Q
-from django.http import Http404, JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_auto_prefetching import AutoPrefetchViewSetMixin
+from options.models import get_bool
 from rest_framework import generics, status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
+from courses.catalog_snapshot import catalog_snapshot_response, get_catalog_snapshot
 from courses.filters import CourseSearchFilterBackend
 from courses.models import (
     Attribute,
@@ -24,6 +34,12 @@ from courses.models import (
     User,
 )
 from courses.search import TypedCourseSearchBackend, TypedSectionSearchBackend
+from courses.search_cache import (
+    COURSE_SEARCH_CACHE_TIMEOUT,
+    course_search_cache_key,
+    course_search_stale_key,
+    get_or_rebuild,
+)
 from courses.serializers import (
     AttributeListSerializer,
     CourseDetailSerializer,
@@ -38,8 +54,15 @@ from courses.serializers import (
 )
 from courses.util import get_current_semester
 from PennCourses.docs_settings import PcxAutoSchema
-from plan.management.commands.recommendcourses import retrieve_course_clusters, vectorize_user
+from plan.management.commands.recommendcourses import (
+    get_course_vector_matrix,
+    retrieve_course_clusters,
+    vectorize_user,
+)
+from plan.recommender_model import ModelUnavailable
+
 
+logger = logging.getLogger(__name__)
 
 SEMESTER_PARAM_DESCRIPTION = (
     "The semester of the course (of the form YYYYx where x is A [for spring], "
@@ -88,7 +111,152 @@ class BaseCourseMixin(AutoPrefetchViewSetMixin, generics.GenericAPIView):
         return queryset
 
 
-class SectionList(generics.ListAPIView, BaseCourseMixin):
+class OptionalPageNumberPagination(PageNumberPagination):
+    """
+    Pagination that only activates when `page` or `page_size` is present in the request.
+    When neither is provided, the full result set is returned unpaginated.
+    """
+
+    page_size_query_param = "page_size"
+    page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if "page" not in request.query_params and "page_size" not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class OptionalCursorPagination(OptionalPageNumberPagination):
+    """
+    Extends `OptionalPageNumberPagination` with a keyset (cursor) pagination mode for
+    querysets of objects with a `full_code`, which activates when `cursor` is present in the
+    request (pass an empty `cursor` for the first page). Pages are ordered by
+    `(full_code, id)`, and fetched with a `(full_code, id) > cursor` condition rather than an
+    OFFSET, so deep pages are as fast as the first. The response is of the form
+    `{"next": <url of the next page, or null>, "results": [...]}`.
+    For querysets with `DISTINCT ON full_code` (e.g. course searches), pages are keyed on
+    `full_code` alone, keeping the queryset's ordering within each full code.
+    """
+
+    cursor_query_param = "cursor"
+    cursor = None
+
+    @staticmethod
+    def encode_cursor(full_code, id):
+        return urlsafe_b64encode(json.dumps([full_code, id]).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            full_code, id = json.loads(urlsafe_b64decode(cursor.encode()))
+            return str(full_code), int(id)
+        except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+            raise NotFound("Invalid cursor.")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.cursor = request.query_params[self.cursor_query_param]
+        page_size = self.get_page_size(request)
+        distinct_on_full_code = queryset.query.distinct_fields == ("full_code",)
+        if distinct_on_full_code:
+            ordering = queryset.query.order_by or ("full_code",)
+            queryset = queryset.order_by(*ordering)
+        else:
+            queryset = queryset.order_by("full_code", "id")
+        if self.cursor:
+            full_code, id = self.decode_cursor(self.cursor)
+            if distinct_on_full_code:
+                queryset = queryset.filter(full_code__gt=full_code)
+            else:
+                queryset = queryset.filter(
+                    Q(full_code__gt=full_code) | Q(full_code=full_code, id__gt=id)
+                )
+
+        results = list(queryset[: page_size + 1])
+        self.next_cursor = (
+            self.encode_cursor(results[page_size - 1].full_code, results[page_size - 1].id)
+            if len(results) > page_size
+            else None
+        )
+        return results[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.cursor is None:
+            return super().get_paginated_response(data)
+        next_link = (
+            replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+            )
+            if self.next_cursor
+            else None
+        )
+        return Response({"next": next_link, "results": data})
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": (
+                    "Paginate by cursor (ordered by full code): pass an empty cursor for the "
+                    "first page, then follow the `next` link of each page."
+                ),
+                "schema": {"type": "string"},
+            }
+        ]
+
+
+class StreamingListMixin:
+    """
+    A mixin for list views, streaming unpaginated JSON responses (if the STREAM_LIST_RESPONSES
+    setting is enabled): the queryset is read from a server-side cursor and serialized
+    `stream_chunk_size` objects at a time, so memory usage doesn't grow with the size of the
+    list, and the first bytes are sent before the whole list is serialized.
+    Paginated and non-JSON responses (and responses of views with `stream_responses` set to
+    False) are rendered as usual.
+    """
+
+    stream_chunk_size = 500
+    stream_responses = True
+
+    def list(self, request, *args, **kwargs):
+        if (
+            not settings.STREAM_LIST_RESPONSES
+            or not self.stream_responses
+            or not isinstance(request.accepted_renderer, JSONRenderer)
+        ):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return StreamingHttpResponse(
+            self.stream_json(queryset.iterator(chunk_size=self.stream_chunk_size)),
+            content_type="application/json",
+        )
+
+    def stream_json(self, objects):
+        """
+        Yields the JSON list of the given objects (serialized by the view's serializer),
+        in chunks of `stream_chunk_size` objects.
+        """
+        renderer = JSONRenderer()
+        yield b"["
+        first = True
+        while chunk := list(islice(objects, self.stream_chunk_size)):
+            rendered = renderer.render(self.get_serializer(chunk, many=True).data)
+            yield (b"" if first else b",") + rendered[1:-1]  # strip the list's brackets
+            first = False
+        yield b"]"
+
+
+class SectionList(StreamingListMixin, generics.ListAPIView, BaseCourseMixin):
     """
     Retrieve a list of sections (less detailed than [PCx] Section, or SectionDetail on the
     backend).  The sections are filtered by the search term (assumed to be a prefix of a
@@ -110,6 +278,7 @@ class SectionList(generics.ListAPIView, BaseCourseMixin):
     queryset = Section.objects.none()  # Default for documentation; overridden in get_queryset
     filter_backends = [TypedSectionSearchBackend]
     search_fields = ["^full_code"]
+    pagination_class = OptionalCursorPagination
 
     def get_queryset(self):
         queryset = Section.with_reviews.all().exclude(activity="")
@@ -148,22 +317,7 @@ class SectionDetail(generics.RetrieveAPIView, BaseCourseMixin):
         return "course__semester"
 
 
-class OptionalPageNumberPagination(PageNumberPagination):
-    """
-    Pagination that only activates when `page` or `page_size` is present in the request.
-    When neither is provided, the full result set is returned unpaginated.
-    """
-
-    page_size_query_param = "page_size"
-    page_size = 100
-
-    def paginate_queryset(self, queryset, request, view=None):
-        if "page" not in request.query_params and "page_size" not in request.query_params:
-            return None
-        return super().paginate_queryset(queryset, request, view)
-
-
-class CourseList(generics.ListAPIView, BaseCourseMixin):
+class CourseList(StreamingListMixin, generics.ListAPIView, BaseCourseMixin):
     """
     Retrieve a list of (all) courses for the provided semester.
     """
@@ -179,10 +333,34 @@ class CourseList(generics.ListAPIView, BaseCourseMixin):
 
     serializer_class = CourseListSerializer
     queryset = Course.objects.none()  # included redundantly for docs
+    pagination_class = OptionalCursorPagination
+    serve_catalog_snapshot = True  # see list
 
-    def get_queryset(self):
-        queryset = Course.with_reviews.filter(sections__isnull=False)
-        queryset = queryset.prefetch_related(
+    def list(self, request, *args, **kwargs):
+        """
+        Lists the semester's courses, serving a precompiled catalog snapshot if enabled (see
+        `courses/catalog_snapshot.py`), with ETag / If-None-Match and gzip support.
+        """
+        if (
+            not self.serve_catalog_snapshot
+            or request.query_params
+            or not isinstance(request.accepted_renderer, JSONRenderer)
+        ):
+            return super().list(request, *args, **kwargs)
+
+        def render():
+            # Serialized directly, since super().list may stream (see StreamingListMixin)
+            queryset = self.filter_queryset(self.get_queryset())
+            return JSONRenderer().render(self.get_serializer(queryset, many=True).data)
+
+        snapshot = get_catalog_snapshot(self.get_semester(), render)
+        if snapshot is None:
+            return super().list(request, *args, **kwargs)
+        return catalog_snapshot_response(request, snapshot)
+
+    @staticmethod
+    def prefetch_sections(queryset):
+        return queryset.prefetch_related(
             Prefetch(
                 "sections",
                 Section.with_reviews.all()
@@ -192,6 +370,10 @@ class CourseList(generics.ListAPIView, BaseCourseMixin):
                 .prefetch_related("course", "meetings__room"),
             )
         )
+
+    def get_queryset(self):
+        queryset = Course.with_reviews.filter(sections__isnull=False)
+        queryset = self.prefetch_sections(queryset)
         queryset = self.filter_by_semester(queryset)
         return queryset
 
@@ -226,41 +408,103 @@ class CourseListSearch(CourseList):
     def get_serializer_context(self):
         """
         This method overrides the default `get_serializer_context` (from super class)
-        in order to add the `user_vector` and `curr_course_vectors_dict`
-        key/value pairs to the serializer context dictionary. If there is no authenticated user
-        (ie `self.request.user.is_authenticated` is `False`) or `self.request` is `None`,
-        the value associated with the `user_vector` and `curr_course_vectors_dict`key are not set.
+        in order to add the `recommendation_scores` key to the serializer context dictionary.
+        If there is no authenticated user (ie `self.request.user.is_authenticated` is `False`)
+        or `self.request` is `None`, the `recommendation_scores` key is not set.
         All other key/value pairs that would have been returned by the default
         `get_serializer_context` (which is `CourseList.get_serializer_context`) are in the
-        dictionary returned in this method. `user_vector` and `curr_course_vectors_dict` encode the
-        vectors used to calculate the recommendation score for a course for a user (see
+        dictionary returned in this method. `recommendation_scores` maps the full code of each
+        current course in the model to its recommendation score for the user (the cosine
+        similarity of the course and user vectors), computed with a single matrix-vector product
+        over the model's `CourseVectorMatrix` (see
         `backend/plan/management/commands/recommendcourses.py` for details on the vectors).
         Note that for testing purposes, this implementation of get_serializer_context is replaced
         with simply `CourseList.get_serializer_context` to reduce the costly process of training the
         model in unrelated tests. You can see how this is done and how to override that behavior in
         in `backend/tests/__init__.py`.
+        The scores are also left out while computing a response to cache (when `personalize`
+        is False; see `list`), or if the model is unavailable (see `ModelUnavailable`).
         """
         context = super().get_serializer_context()
 
-        if self.request is None or not self.request.user or not self.request.user.is_authenticated:
+        if (
+            self.request is None
+            or not self.request.user
+            or not self.request.user.is_authenticated
+            or not self.personalize
+        ):
             return context
 
-        _, _, curr_course_vectors_dict, past_course_vectors_dict = retrieve_course_clusters()
+        try:
+            _, _, curr_course_vectors_dict, past_course_vectors_dict = retrieve_course_clusters()
+        except ModelUnavailable as e:
+            logger.warning(f"Not scoring course search: {e}")
+            return context
         user_vector, _ = vectorize_user(
             self.request.user, curr_course_vectors_dict, past_course_vectors_dict
         )
-        context.update(
-            {
-                "user_vector": user_vector,
-                "curr_course_vectors_dict": curr_course_vectors_dict,
-            }
-        )
+        context["recommendation_scores"] = get_course_vector_matrix(
+            curr_course_vectors_dict
+        ).scores(user_vector)
 
         return context
 
+    def filter_queryset(self, queryset):
+        """
+        Filters the queryset with the filter backends, then orders full text search results
+        by relevance (if `TypedCourseSearchBackend` set a `search_rank`). Since
+        `CourseSearchFilterBackend` selects distinct courses by `full_code` (which requires
+        ordering by `full_code` first), results are ranked in an outer query.
+        """
+        queryset = super().filter_queryset(queryset)
+        if self.search_rank is None:
+            return queryset
+        return (
+            self.prefetch_sections(Course.with_reviews.filter(id__in=queryset.values("id")))
+            .annotate(search_rank=self.search_rank)
+            .order_by("-search_rank", "full_code")
+        )
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lists the filtered courses, from the course search response cache if possible (see
+        `courses/search_cache.py`; while another request rebuilds the response, the previous
+        one is served). Responses are cached without recommendation scores; the scores of
+        authenticated users are overlaid on the cached body.
+        """
+        semester = self.get_semester()
+        variants = (get_bool("COURSE_FULL_TEXT_SEARCH", False),)
+        cache_key = course_search_cache_key(semester, request.query_params, *variants)
+        if cache_key is None:
+            return super().list(request, *args, **kwargs)
+
+        def build():
+            self.personalize = False
+            try:
+                return super(CourseListSearch, self).list(request, *args, **kwargs).data
+            finally:
+                self.personalize = True
+
+        data = get_or_rebuild(
+            cache_key,
+            course_search_stale_key(semester, request.query_params, *variants),
+            build,
+            timeout=COURSE_SEARCH_CACHE_TIMEOUT,
+        )
+
+        context = self.get_serializer_context()
+        for course in data["results"] if isinstance(data, dict) else data:
+            course["recommendation_score"] = CourseListSerializer.compute_recommendation_score(
+                course["id"], context
+            )
+        return Response(data)
+
     filter_backends = [TypedCourseSearchBackend, CourseSearchFilterBackend]
     search_fields = ("full_code", "title", "sections__instructors__name")
-    pagination_class = OptionalPageNumberPagination
+    search_rank = None  # set by TypedCourseSearchBackend for ranked full text search
+    serve_catalog_snapshot = False
+    stream_responses = False  # responses are cached (see list)
+    personalize = True  # include recommendation scores (see get_serializer_context)
 
 
 class CourseDetail(generics.RetrieveAPIView, BaseCourseMixin):
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from plan.recommender_model import load_legacy_model, publish_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the legacy pickled course recommendation model (course-cluster-data.pkl in S3) "
+        "to the memory-mapped format, and publish it as the latest model version (so workers "
+        "load it memory-mapped, rather than each unpickling the legacy model). Only needed "
+        "until trainrecommender --upload-to-s3 publishes a model."
+    )
+
+    def handle(self, *args, **kwargs):
+        version = publish_model(load_legacy_model())
+        self.stdout.write(f"Published model version {version}.")
@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from plan.management.commands.recommendcourses import (
+    CourseVectorMatrix,
+    cosine_similarity,
+    retrieve_course_clusters,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark computing the recommendation scores of a full semester of courses for a "
+        "user vector, comparing per-course cosine similarities (over the course vectors dict) "
+        "with a single matrix-vector product over a pre-normalized course vector matrix."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--courses",
+            type=int,
+            default=5000,
+            help="The number of synthetic course vectors (ignored with --use-model).",
+        )
+        parser.add_argument(
+            "--dims",
+            type=int,
+            default=800,
+            help="The dimension of the synthetic course vectors (ignored with --use-model).",
+        )
+        parser.add_argument(
+            "--use-model",
+            action="store_true",
+            help="Use the current semester's course vectors of the trained model "
+            "(from retrieve_course_clusters) rather than synthetic vectors.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="The number of timed runs of each path."
+        )
+
+    def time_runs(self, fn, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return np.median(times) * 1000
+
+    def handle(self, *args, **kwargs):
+        if kwargs["use_model"]:
+            _, _, course_vectors_dict, _ = retrieve_course_clusters()
+        else:
+            rng = np.random.default_rng(0)
+            course_vectors_dict = {
+                f"BNCH-{i:04d}": rng.standard_normal(kwargs["dims"])
+                for i in range(kwargs["courses"])
+            }
+        user_vector = next(iter(course_vectors_dict.values())) + 0.5
+        dims = len(user_vector)
+        self.stdout.write(f"Scoring {len(course_vectors_dict)} courses ({dims} dims).")
+
+        def per_course():
+            return {
+                code: cosine_similarity(vector, user_vector)
+                for code, vector in course_vectors_dict.items()
+            }
+
+        start = time.perf_counter()
+        matrix = CourseVectorMatrix(course_vectors_dict)
+        build = (time.perf_counter() - start) * 1000
+
+        expected = per_course()
+        scores = matrix.scores(user_vector)
+        max_error = max(abs(scores[code] - expected[code]) for code in expected)
+
+        repeat = kwargs["repeat"]
+        self.stdout.write(
+            f"per-course cosine similarity: {self.time_runs(per_course, repeat):.2f}ms"
+        )
+        scores_time = self.time_runs(lambda: matrix.scores(user_vector), repeat)
+        product_time = self.time_runs(lambda: matrix.similarities(user_vector), repeat)
+        self.stdout.write(
+            f"matrix product: {scores_time:.2f}ms with the scores dict, {product_time:.2f}ms alone "
+            f"(matrix built once per model in {build:.0f}ms; max abs difference {max_error:.1e})"
+        )
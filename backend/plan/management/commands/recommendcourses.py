@@ -1,21 +1,29 @@
-import heapq
+import logging
 import os
-import pickle
-from typing import Optional, Set
 
 import numpy as np
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
 from django.core.management.base import BaseCommand
 
+from courses.code_index import get_code_index
 from courses.models import Course
 from courses.util import get_current_semester, in_dev
-from PennCourses.settings.base import S3_client
 from plan.management.commands.trainrecommender import train_recommender
 from plan.models import Schedule
+from plan.recommender_model import (
+    LEGACY_MODEL_VERSION,
+    CourseVectors,
+    ModelUnavailable,
+    download_model,
+    get_latest_model_version,
+    load_legacy_model,
+    load_model,
+)
 
 
+logger = logging.getLogger(__name__)
+
 # The proportion by which to up-weight current courses
 # relative to past courses when computing a user vector
 CURR_COURSES_BIAS = 3
@@ -108,32 +116,101 @@ def cosine_similarity(v1, v2):
     return np.dot(v1, v2) / norm_prod if norm_prod > 0 else 0
 
 
-def best_recommendations(
-    cluster,
-    curr_course_vectors_dict,
-    user_vector,
-    exclude: Optional[Set[str]] = None,
-    n_recommendations=5,
-):
-    recs = []
-    for course in cluster:
-        if exclude is not None and course in exclude:
-            continue
-        course_vector = curr_course_vectors_dict[course]
-        similarity = cosine_similarity(course_vector, user_vector)
-        recs.append((course, similarity))
-    rec_course_to_score = {course: score for course, score in recs}
-    recs = [
-        (c.full_code, rec_course_to_score[c.full_code])
-        for c in Course.objects.filter(
-            semester=get_current_semester(),
-            full_code__in=list(rec_course_to_score.keys()),
+class CourseVectorMatrix:
+    """
+    The course vectors of a model (e.g. `curr_course_vectors_dict`) stored as one contiguous
+    matrix of unit-normalized rows, with a full_code -> row index, so the cosine similarities
+    of all courses with a vector take a single matrix-vector product.
+    """
+
+    def __init__(self, course_vectors_dict):
+        if isinstance(course_vectors_dict, CourseVectors):
+            # Already backed by a matrix (see plan/recommender_model.py)
+            self.codes, self.index = course_vectors_dict.codes, course_vectors_dict.index
+            matrix = np.asarray(course_vectors_dict.matrix, dtype=np.float64)
+        else:
+            self.codes = list(course_vectors_dict)
+            self.index = {code: row for row, code in enumerate(self.codes)}
+            matrix = np.array([course_vectors_dict[code] for code in self.codes], dtype=np.float64)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        # Zero vectors stay zero (with similarity 0 to everything, as in cosine_similarity)
+        self.matrix = np.ascontiguousarray(
+            np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+        )
+        self._cluster_rows = (None, None)  # (clusters, rows) (see cluster_rows)
+        self._offering_mask = (None, None)  # (code index, mask) (see offering_mask)
+
+    def similarities(self, vector, rows=None):
+        """
+        Returns an array of the cosine similarities of each course (by row, or of the courses
+        at the given array of rows) with the given vector (0 where either vector is zero).
+        """
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return np.zeros(len(matrix))
+        return matrix @ (vector / norm)
+
+    def scores(self, vector):
+        """
+        Returns a dict mapping the full code of each course to its cosine similarity
+        with the given vector.
+        """
+        return dict(zip(self.codes, self.similarities(vector).tolist()))
+
+    def cluster_rows(self, clusters):
+        """
+        Returns a list of arrays of the rows of the courses in each of the given clusters
+        (lists of full codes), reusing the last result if given the same clusters object.
+        """
+        cached_clusters, rows = self._cluster_rows
+        if cached_clusters is not clusters:
+            rows = [
+                np.array([self.index[code] for code in cluster], dtype=np.intp)
+                for cluster in clusters
+            ]
+            self._cluster_rows = (clusters, rows)
+        return rows
+
+    def offering_mask(self, semester):
+        """
+        Returns a boolean array indicating for each course (by row) whether it is offered in the
+        given semester. With the CODE_PREFIX_INDEX setting, the mask is built from the semester's
+        code index (see `courses/code_index.py`), once per load of the index, so it takes no DB
+        query; otherwise the semester's course codes are queried.
+        """
+        code_index = get_code_index(Course, semester) if settings.CODE_PREFIX_INDEX else None
+        if code_index is None:
+            offered = set(
+                Course.objects.filter(semester=semester).values_list("full_code", flat=True)
+            )
+        else:
+            cached_code_index, mask = self._offering_mask
+            if cached_code_index is code_index:
+                return mask
+            offered = set(code_index.codes)
+        mask = np.fromiter(
+            (code.upper() in offered for code in self.codes), dtype=bool, count=len(self.codes)
         )
-    ]  # only recommend currently offered courses
-    if n_recommendations > len(recs):
-        n_recommendations = len(recs)
+        if code_index is not None:
+            self._offering_mask = (code_index, mask)
+        return mask
+
 
-    return [course for course, _ in heapq.nlargest(n_recommendations, recs, lambda x: x[1])]
+_course_vector_matrix = (None, None)  # (course vectors dict, matrix) of the last model used
+
+
+def get_course_vector_matrix(course_vectors_dict):
+    """
+    Returns the `CourseVectorMatrix` of the given course vectors dict, reusing the last
+    built matrix if it was built from the same dict object.
+    """
+    global _course_vector_matrix
+    vectors_dict, matrix = _course_vector_matrix
+    if vectors_dict is not course_vectors_dict:
+        matrix = CourseVectorMatrix(course_vectors_dict)
+        _course_vector_matrix = (course_vectors_dict, matrix)
+    return matrix
 
 
 def recommend_courses(
@@ -144,24 +221,68 @@ def recommend_courses(
     user_courses,
     n_recommendations=5,
 ):
-    min_distance = -1
-    best_cluster_index = -1
-    for cluster_index, centroid in enumerate(cluster_centroids):
-        distance = np.linalg.norm(centroid - user_vector)
-        if best_cluster_index == -1 or distance < min_distance:
-            min_distance = distance
-            best_cluster_index = cluster_index
-
-    return best_recommendations(
-        clusters[best_cluster_index],
-        curr_course_vectors_dict,
-        user_vector,
-        exclude=user_courses,
-        n_recommendations=n_recommendations,
-    )
+    """
+    Returns a list of the full codes of (up to) `n_recommendations` courses offered this
+    semester, excluding `user_courses`, in decreasing order of cosine similarity to the user
+    vector. Candidates are the courses in the cluster with the nearest centroid; if it has
+    fewer than `n_recommendations` candidates, the courses of the next nearest clusters are
+    added until there are enough.
+    """
+    matrix = get_course_vector_matrix(curr_course_vectors_dict)
+    is_candidate = matrix.offering_mask(get_current_semester()).copy()
+    user_rows = [matrix.index[code] for code in user_courses or [] if code in matrix.index]
+    is_candidate[user_rows] = False
+
+    distances = np.linalg.norm(np.asarray(cluster_centroids) - user_vector, axis=1)
+    cluster_rows = matrix.cluster_rows(clusters)
+    candidates = []
+    num_candidates = 0
+    for cluster_index in np.argsort(distances, kind="stable"):
+        rows = cluster_rows[cluster_index]
+        rows = rows[is_candidate[rows]]
+        candidates.append(rows)
+        num_candidates += len(rows)
+        if num_candidates >= n_recommendations:
+            break
+    if not num_candidates:
+        return []
+    candidates = np.concatenate(candidates)
+
+    similarities = matrix.similarities(user_vector, candidates)
+    best = np.argsort(-similarities, kind="stable")[:n_recommendations]
+    return [matrix.codes[row] for row in candidates[best]]
 
 
 dev_course_clusters = None  # a global variable used to "cache" the course clusters in dev
+course_clusters = (None, None)  # the (version, model) loaded in this process (see below)
+
+
+def load_latest_course_clusters():
+    """
+    Returns the latest published course recommendation model, loading it (memory-mapped) if this
+    process hasn't loaded it yet, or the legacy pickled model if none has been published.
+    Per call, this only reads the latest version from the cache (see
+    `plan/recommender_model.py`). If a newer version can't be loaded, the previously loaded
+    model (if any) is returned; otherwise `ModelUnavailable` is raised.
+    """
+    global course_clusters
+    loaded_version, model = course_clusters
+    try:
+        version = get_latest_model_version()
+        if version != loaded_version:
+            if version == LEGACY_MODEL_VERSION:
+                model = load_legacy_model()
+            else:
+                try:
+                    model = load_model(download_model(version))
+                except (OSError, ValueError, KeyError) as e:
+                    raise ModelUnavailable(f"Could not load model version {version}.") from e
+            course_clusters = (version, model)
+    except ModelUnavailable:
+        if model is None:
+            raise
+        logger.exception("Error loading the latest course recommendation model")
+    return model
 
 
 def retrieve_course_clusters():
@@ -181,15 +302,7 @@ def retrieve_course_clusters():
             )
             print("Done training development model.")
         return dev_course_clusters
-    cached_data = cache.get("course-cluster-data", None)
-    if cached_data is not None:
-        return cached_data
-    # Need to redownload
-    course_cluster_data = pickle.loads(
-        S3_client.get_object(Bucket="penn.courses", Key="course-cluster-data.pkl")["Body"].read()
-    )
-    cache.set("course-cluster-data", course_cluster_data, timeout=90000)
-    return course_cluster_data
+    return load_latest_course_clusters()
 
 
 def clean_course_input(course_input):
@@ -0,0 +1,113 @@
+import os
+import pickle
+import shutil
+import time
+import uuid
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from plan.management.commands.recommendcourses import (
+    get_course_vector_matrix,
+    load_latest_course_clusters,
+)
+from plan.recommender_model import LOCAL_MODEL_DIR, MODEL_VERSION_KEY, save_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark loading the course recommendation model and its per-request overhead, "
+        "comparing the previous format (a pickle in the cache, unpickled on every request) with "
+        "the memory-mapped model (loaded once per process, with a version check per request). "
+        "Uses a local-memory cache, so Redis transfer time is not included in either path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--model-path",
+            type=str,
+            default=None,
+            help="The local path of a model pkl (as output by trainrecommender) to benchmark. "
+            "If omitted, a synthetic model is used.",
+        )
+        parser.add_argument(
+            "--courses", type=int, default=5000, help="The number of synthetic courses."
+        )
+        parser.add_argument(
+            "--dims", type=int, default=800, help="The dimension of the synthetic vectors."
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="The number of timed runs of each path."
+        )
+
+    def synthetic_model(self, num_courses, dims):
+        rng = np.random.default_rng(0)
+        codes = [f"BNCH-{i:04d}" for i in range(num_courses)]
+        vectors = rng.standard_normal((num_courses, dims))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        num_clusters = max(num_courses // 100, 1)
+        return (
+            [rows.mean(axis=0) for rows in np.array_split(vectors, num_clusters)],
+            [list(cluster) for cluster in np.array_split(codes, num_clusters)],
+            dict(zip(codes, vectors)),
+            dict(zip(codes, vectors[::-1])),
+        )
+
+    def time_runs(self, fn, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return np.median(times) * 1000
+
+    def handle(self, *args, **kwargs):
+        if kwargs["model_path"]:
+            with open(kwargs["model_path"], "rb") as f:
+                model = pickle.load(f)
+        else:
+            model = self.synthetic_model(kwargs["courses"], kwargs["dims"])
+        repeat = kwargs["repeat"]
+        user_vector = np.array(next(iter(model[2].values()))) + 0.5
+        self.stdout.write(
+            f"Model: {len(model[2])} courses, {len(model[1])} clusters, {len(user_vector)} dims, "
+            f"{len(pickle.dumps(model)) / 2**20:.1f}MiB pickled."
+        )
+
+        def search_scores(course_clusters):
+            get_course_vector_matrix(course_clusters[2]).scores(user_vector)
+
+        version = f"benchmark-{uuid.uuid4().hex}"
+        path = os.path.join(LOCAL_MODEL_DIR, version)
+        with override_settings(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        ):
+            try:
+                cache.set("course-cluster-data", model)
+                before_request = self.time_runs(lambda: cache.get("course-cluster-data"), repeat)
+                before_search = self.time_runs(
+                    lambda: search_scores(cache.get("course-cluster-data")), repeat
+                )
+
+                save_model(model, path)
+                cache.set(MODEL_VERSION_KEY, version)
+                start = time.perf_counter()
+                load_latest_course_clusters()
+                after_load = (time.perf_counter() - start) * 1000
+                after_request = self.time_runs(load_latest_course_clusters, repeat)
+                after_search = self.time_runs(
+                    lambda: search_scores(load_latest_course_clusters()), repeat
+                )
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+
+        self.stdout.write(
+            f"pickle in cache: {before_request:.1f}ms load per request, "
+            f"{before_search:.1f}ms per scored search"
+        )
+        self.stdout.write(
+            f"memory-mapped: {after_load:.1f}ms load once per process, "
+            f"{after_request:.3f}ms per request, {after_search:.1f}ms per scored search"
+        )
@@ -0,0 +1,115 @@
+import math
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from plan.management.commands.trainrecommender import (
+    get_unsequenced_courses_by_user,
+    vectorize_by_copresence,
+    vectorize_courses_by_schedule_presence,
+)
+from plan.models import Schedule
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the schedule-based vectorization stages of trainrecommender (schedule "
+        "presence, copresence and its dimensionality reduction) on synthetic schedule data, "
+        "by time and peak Python heap usage (including numpy buffers). By default the synthetic "
+        "data has 10x as many users as there are users with schedules in the DB."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=None,
+            help="The number of synthetic users (overrides --scale).",
+        )
+        parser.add_argument(
+            "--scale",
+            type=int,
+            default=10,
+            help="The multiple of the number of users with schedules in the DB to generate.",
+        )
+        parser.add_argument(
+            "--courses", type=int, default=3000, help="The number of distinct synthetic courses."
+        )
+        parser.add_argument(
+            "--semesters-per-user", type=int, default=4, help="The semesters of each user."
+        )
+        parser.add_argument(
+            "--courses-per-semester", type=int, default=5, help="The courses of each semester."
+        )
+
+    def synthetic_courses_by_semester_by_user(self, num_users, num_courses, num_sems, per_sem):
+        rng = np.random.default_rng(0)
+        # Skewed course popularity, as in real schedules
+        popularity = 1 / np.arange(1, num_courses + 1) ** 0.8
+        popularity /= popularity.sum()
+        semesters = [f"{2016 + i // 3}{'ABC'[i % 3]}" for i in range(num_sems)]
+        return {
+            user: {
+                semester: {
+                    f"SYN-{course}": int(frequency)
+                    for course, frequency in zip(
+                        rng.choice(num_courses, per_sem, replace=False, p=popularity),
+                        rng.integers(1, 3, per_sem),
+                    )
+                }
+                for semester in semesters
+            }
+            for user in range(num_users)
+        }
+
+    def measure(self, label, fn):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"{label}: {elapsed:.2f}s, peak heap {peak / 2**20:.1f}MiB")
+        return result
+
+    def handle(self, *args, **kwargs):
+        num_users = kwargs["users"]
+        if num_users is None:
+            num_users = kwargs["scale"] * Schedule.objects.values("person").distinct().count()
+            if not num_users:
+                raise CommandError("No schedules found in the DB; specify --users.")
+        grouped_courses = self.synthetic_courses_by_semester_by_user(
+            num_users,
+            kwargs["courses"],
+            kwargs["semesters_per_user"],
+            kwargs["courses_per_semester"],
+        )
+        courses_by_user = get_unsequenced_courses_by_user(grouped_courses)
+        course_to_index = {
+            course: i
+            for i, course in enumerate(
+                sorted({course for user_courses in courses_by_user for course in user_courses})
+            )
+        }
+        self.stdout.write(f"{num_users} users, {len(course_to_index)} courses.")
+
+        self.measure(
+            "schedule presence", lambda: vectorize_courses_by_schedule_presence(courses_by_user)
+        )
+        copresence = {}
+        for as_past_class in [False, True]:
+            copresence[as_past_class] = self.measure(
+                f"copresence (as_past_class={as_past_class})",
+                lambda: vectorize_by_copresence(grouped_courses, course_to_index, as_past_class),
+            )
+        components = round(30 * math.log2(len(course_to_index)))
+        self.measure(
+            f"copresence normalize + TruncatedSVD ({components} components)",
+            lambda: TruncatedSVD(n_components=components).fit_transform(
+                normalize(copresence[False])
+            ),
+        )
@@ -2,18 +2,19 @@ from django.core.cache import cache
 from django.core.management.base import BaseCommand
 
 from plan.management.commands.recommendcourses import retrieve_course_clusters
+from plan.recommender_model import MODEL_UNAVAILABLE_KEY, MODEL_VERSION_KEY
 
 
 def redownload_course_rec_model():
-    cache.delete("course-cluster-data")
+    cache.delete_many([MODEL_VERSION_KEY, MODEL_UNAVAILABLE_KEY])
     retrieve_course_clusters()
 
 
 class Command(BaseCommand):
     help = (
-        "Run this command to invalidate the course-cluster-data key in cache, causing the "
-        "latest course-cluster-data.pkl course recommendation model to be immediately "
-        "redownloaded from S3."
+        "Run this command to invalidate the course-cluster-model-version key in cache, causing "
+        "the latest published course recommendation model version to be re-read from S3 "
+        "(and loaded by each worker on its next request, if it has changed)."
     )
 
     def handle(self, *args, **kwargs):
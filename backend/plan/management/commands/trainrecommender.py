@@ -6,16 +6,17 @@ import pickle
 from typing import Dict, Iterable, List, Tuple
 
 import numpy as np
-from django.core.cache import cache
 from django.core.management.base import BaseCommand
+from scipy import sparse
 from sklearn.cluster import KMeans
 from sklearn.decomposition import PCA, TruncatedSVD
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import normalize
 
 from courses.models import Course
-from PennCourses.settings.base import S3_client, S3_resource
+from PennCourses.settings.base import S3_client
 from plan.models import Schedule
+from plan.recommender_model import publish_model
 
 
 def lookup_course(course):
@@ -117,62 +118,68 @@ def group_courses(courses_data: Iterable[Tuple[int, str, str]]):
     return courses_by_semester_by_user
 
 
-def vectorize_by_copresence(
-    courses_by_semester_by_user, as_past_class=False
-) -> Dict[str, np.ndarray]:
+COPRESENCE_USERS_PER_CHUNK = 1000  # bounds the memory used for course pairs
+
+
+def count_course_pairs(users, course_to_index, as_past_class=False):
+    """
+    Returns a sparse (COO) matrix of the copresence and order counts (see
+    `vectorize_by_copresence`) of the given users' grouped courses (values of the dict
+    returned by group_courses).
+    """
+    # One entry per (user, semester, course), in order of user
+    user_indices, sem_ranks, indices, frequencies = [], [], [], []
+    for user_index, courses_by_semester in enumerate(users):
+        for sem_rank, sem in enumerate(sorted(courses_by_semester.keys())):
+            for course, frequency in courses_by_semester[sem].items():
+                user_indices.append(user_index)
+                sem_ranks.append(sem_rank)
+                indices.append(course_to_index[course])
+                frequencies.append(frequency)
+    user_indices = np.array(user_indices, dtype=np.int64)
+    sem_ranks = np.array(sem_ranks, dtype=np.int64)
+    indices = np.array(indices, dtype=np.int64)
+    frequencies = np.array(frequencies, dtype=np.float64)
+
+    # Pair each entry (a) with every entry (b) of the same user
+    user_sizes = np.bincount(user_indices, minlength=len(users))
+    user_starts = np.cumsum(user_sizes) - user_sizes
+    entry_sizes = user_sizes[user_indices]
+    entry_starts = np.cumsum(entry_sizes) - entry_sizes
+    a = np.repeat(np.arange(len(indices)), entry_sizes)
+    b = np.arange(len(a)) + np.repeat(user_starts[user_indices] - entry_starts, entry_sizes)
+    # As a current class, a course counts with courses in the same semester (copresence) and
+    # in earlier semesters (order). A past class does not occur with classes in the same
+    # semester, but happens after itself, so it counts with all of the user's courses: those
+    # in the same or earlier semesters (order) and in later semesters (copresence).
+    if not as_past_class:
+        same_or_later = sem_ranks[a] >= sem_ranks[b]
+        a, b = a[same_or_later], b[same_or_later]
+
+    # make sure that every course appears with itself
+    return sparse.coo_matrix(
+        (
+            np.concatenate([np.minimum(frequencies[a], frequencies[b]), frequencies]),
+            (np.concatenate([indices[a], indices]), np.concatenate([indices[b], indices])),
+        ),
+        shape=(len(course_to_index), len(course_to_index)),
+    )
+
+
+def vectorize_by_copresence(courses_by_semester_by_user, course_to_index, as_past_class=False):
     """
     Vectorizes courses by whether they're in the user's schedule at the same time,
     as well as the number of times they come after other courses.
     :param courses_by_semester_by_user: Grouped courses data returned by group_courses
-    :return:
+    :param course_to_index: A dict mapping each course in the data to its row (and column) index
+    :return: A sparse (CSR) matrix with the vector of each course as the row at its index
     """
-    courses_set = set()
-    for _, courses_by_semester in courses_by_semester_by_user.items():
-        for _, course_multiset in courses_by_semester.items():
-            for course, _ in course_multiset.items():
-                courses_set.add(course)
-    courses_list = list(courses_set)
-    course_to_index = {course: i for i, course in enumerate(courses_list)}
-
-    copresence_vectors_by_course = {course: np.zeros(len(courses_list)) for course in courses_list}
-    order_vectors_by_course = {course: np.zeros(len(courses_list)) for course in courses_list}
-
-    for user, courses_by_semester in courses_by_semester_by_user.items():
-        for sem, course_multiset in courses_by_semester.items():
-            for course_a, frequency_a in course_multiset.items():
-                index_a = course_to_index[course_a]
-                relevant_vector_a = copresence_vectors_by_course[course_a]
-                # A past class does not occur with classes in the same semester
-                if not as_past_class:
-                    for course_b, frequency_b in course_multiset.items():
-                        co_frequency = min(frequency_a, frequency_b)
-                        index_b = course_to_index[course_b]
-                        relevant_vector_a[index_b] += co_frequency
-                # make sure that every course appears with itself
-                relevant_vector_a[index_a] += frequency_a
-        ordered_sems = sorted(courses_by_semester.keys())
-        for i, sem in enumerate(ordered_sems):
-            courses_first_sem = courses_by_semester[sem]
-            # if this class is being encoded as a past class, it happens after itself
-            start_sem_index = i if as_past_class else i + 1
-            for later_sem in ordered_sems[start_sem_index:]:
-                courses_later_sem = courses_by_semester[later_sem]
-                for course_later, freq1 in courses_later_sem.items():
-                    add_to_copres = as_past_class and later_sem != ordered_sems[start_sem_index]
-                    for course_earlier, freq2 in courses_first_sem.items():
-                        earlier_index = course_to_index[course_earlier]
-                        cofreq = min(freq1, freq2)
-                        order_vectors_by_course[course_later][earlier_index] += cofreq
-                        if add_to_copres:
-                            later_index = course_to_index[course_later]
-                            copresence_vectors_by_course[course_earlier][later_index] += cofreq
-
-    concatenated = {
-        key: order_vectors_by_course[key] + copresence_vectors_by_course[key]
-        for key in order_vectors_by_course
-    }
-
-    return concatenated
+    users = list(courses_by_semester_by_user.values())
+    vectors = sparse.csr_matrix((len(course_to_index), len(course_to_index)))
+    for chunk_start in range(0, len(users), COPRESENCE_USERS_PER_CHUNK):
+        chunk_end = chunk_start + COPRESENCE_USERS_PER_CHUNK
+        vectors += count_course_pairs(users[chunk_start:chunk_end], course_to_index, as_past_class)
+    return vectors
 
 
 def vectorize_courses_by_schedule_presence(courses_by_user: List[Dict[str, int]]):
@@ -181,30 +188,33 @@ def vectorize_courses_by_schedule_presence(courses_by_user: List[Dict[str, int]]
     the number of times a user has it in their schedules.
     :return: A dict mapping course ids to a vector wherein each component
     contains how many times the corresponding user
-    has that course in their schedules.
+    has that course in their schedules (reduced in dimension).
     """
     num_users = len(courses_by_user)
-    course_vectors_dict = {}
+    course_to_index = {}
+    rows, cols, frequencies = [], [], []
     for user_index, user_courses in enumerate(courses_by_user):
         for course, frequency in user_courses.items():
-            relevant_vector: np.ndarray
-            if course not in course_vectors_dict:
-                relevant_vector = np.zeros(num_users)
-                course_vectors_dict[course] = relevant_vector
-            else:
-                relevant_vector = course_vectors_dict[course]
-            relevant_vector[user_index] = frequency
-
-    courses, vectors = zip(*course_vectors_dict.items())
+            rows.append(course_to_index.setdefault(course, len(course_to_index)))
+            cols.append(user_index)
+            frequencies.append(frequency)
+    courses = list(course_to_index)
+    vectors = sparse.csr_matrix(
+        (np.array(frequencies, dtype=np.float64), (rows, cols)), shape=(len(courses), num_users)
+    )
     # reduce dimensionality to the log of the number of users
-    vectors = np.array(vectors)
-    _, dims = vectors.shape
+    dims = num_users
     dim_reduced_components = round(math.log2(num_users + 2))
     if min(dims, dim_reduced_components) > 5:
-        dim_reducer = PCA(n_components=dim_reduced_components)
-        dim_reduced = dim_reducer.fit_transform(vectors)
+        if dim_reduced_components < min(vectors.shape):
+            # ARPACK supports sparse input (centering it implicitly)
+            dim_reducer = PCA(n_components=dim_reduced_components, svd_solver="arpack")
+            dim_reduced = dim_reducer.fit_transform(vectors)
+        else:
+            dim_reducer = PCA(n_components=dim_reduced_components)
+            dim_reduced = dim_reducer.fit_transform(vectors.toarray())
     else:
-        dim_reduced = np.array(vectors)
+        dim_reduced = vectors.toarray()
     # divide the vectors by the average norm
     scaled = normalize(dim_reduced)
     return {course: scaled for course, scaled in zip(courses, scaled)}
@@ -248,19 +258,18 @@ def generate_course_vectors_dict(courses_data, use_descriptions=True, preloaded_
     courses_to_vectors_curr = {}
     courses_to_vectors_past = {}
     grouped_courses = group_courses(courses_data)
-    copresence_vectors_by_course = vectorize_by_copresence(grouped_courses)
-    copresence_vectors_by_course_past = vectorize_by_copresence(grouped_courses, as_past_class=True)
     courses_by_user = get_unsequenced_courses_by_user(grouped_courses)
     courses, courses_vectorized_by_schedule_presence = zip(
         *vectorize_courses_by_schedule_presence(courses_by_user).items()
     )
+    course_to_index = {course: i for i, course in enumerate(courses)}
     courses_vectorized_by_description = vectorize_courses_by_description(
         get_descriptions(courses, preloaded_descriptions)
     )
-    copresence_vectors = [copresence_vectors_by_course[course] for course in courses]
-    copresence_vectors_past = [copresence_vectors_by_course_past[course] for course in courses]
-    copresence_vectors = normalize(copresence_vectors)
-    copresence_vectors_past = normalize(copresence_vectors_past)
+    copresence_vectors = normalize(vectorize_by_copresence(grouped_courses, course_to_index))
+    copresence_vectors_past = normalize(
+        vectorize_by_copresence(grouped_courses, course_to_index, as_past_class=True)
+    )
     _, dims = copresence_vectors_past.shape
     dim_reduced_components = round(30 * math.log2(len(courses)))
     if min(dims, dim_reduced_components) > 5:
@@ -268,6 +277,9 @@ def generate_course_vectors_dict(courses_data, use_descriptions=True, preloaded_
         copresence_vectors = dim_reduce.fit_transform(copresence_vectors)
         dim_reduce = TruncatedSVD(n_components=dim_reduced_components)
         copresence_vectors_past = dim_reduce.fit_transform(copresence_vectors_past)
+    else:
+        copresence_vectors = copresence_vectors.toarray()
+        copresence_vectors_past = copresence_vectors_past.toarray()
     for (
         course,
         schedule_vector,
@@ -371,11 +383,6 @@ def train_recommender(
             output_path.endswith(".pkl") or output_path == os.devnull
         ), "Output file must have a .pkl extension"
 
-    if verbose and not upload_to_s3 and not output_path.endswith("course-cluster-data.pkl"):
-        print(
-            "Warning: The name of the course recommendation model used in prod (stored in S3) "
-            "must be course-cluster-data.pkl."
-        )
     if verbose and "production" not in os.environ.get("DJANGO_SETTINGS_MODULE", ""):
         print(
             "Warning: Make sure you have all the courses in your data source "
@@ -410,10 +417,9 @@ def train_recommender(
     )
 
     if upload_to_s3:
-        S3_resource.Object("penn.courses", "course-cluster-data.pkl").put(
-            Body=pickle.dumps(course_clusters)
-        )
-        cache.set("course-cluster-data", course_clusters, timeout=90000)
+        version = publish_model(course_clusters)
+        if verbose:
+            print(f"Published model version {version}.")
     else:
         pickle.dump(
             course_clusters,
@@ -430,12 +436,9 @@ class Command(BaseCommand):
     help = (
         "Use this script to train a PCP course recommendation model on given training data "
         "(specified via a local path, or from S3), and output the trained model (as a .pkl file) "
-        "to a specified local filepath (or to S3).\n"
-        "If you overwrite the course-cluster-data.pkl object in the penn.courses S3 bucket, "
-        "the course recommendation model actually used in prod will be updated within 25 hours, "
-        "or after the registrarimport management command is next run (done daily by a "
-        "cron job), or when the redownloadmodel management command is run to manually trigger a "
-        "redownload, whichever comes first."
+        "to a specified local filepath (or publish it to S3).\n"
+        "When a model is published to S3 (see plan/recommender_model.py), each prod worker "
+        "loads it on its next course recommendation or search request."
     )
 
     def add_arguments(self, parser):
@@ -497,8 +500,8 @@ class Command(BaseCommand):
             default=False,
             action="store_true",
             help=(
-                "Enable this argument to upload this model to S3, replacing the "
-                "course-cluster-data.pkl key in the penn.courses bucket. "
+                "Enable this argument to publish this model to S3 (as a new version under the "
+                "course-cluster-model prefix in the penn.courses bucket). "
                 "If this argument is flagged, the output_path argument must be omitted."
             ),
         )
@@ -0,0 +1,238 @@
+"""
+The published format of the course recommendation model (see
+`plan/management/commands/trainrecommender.py`), and its process-local loading.
+
+A model is the tuple `(cluster_centroids, clusters, curr_course_vectors_dict,
+past_course_vectors_dict)` returned by `train_recommender`. It is published (by
+`trainrecommender --upload-to-s3`) as a directory of `.npy` matrices plus a compact code index
+(`codes.json`) under a new version in S3, and the version is then written to the cache under
+MODEL_VERSION_KEY. Each worker process downloads a version to local disk once and memory-maps
+its matrices, so the vectors live in the OS page cache (shared by all workers on a machine)
+rather than being unpickled from Redis on every request; a request only reads the version key to
+check whether a newer model has been published.
+
+Before this format, the model was published as a single pickle (LEGACY_MODEL_KEY). Until a
+version has been published (by `trainrecommender --upload-to-s3`, or by converting the legacy
+pickle with the `publishlegacymodel` command), each process loads the legacy pickle into memory
+instead (see `get_latest_model_version` and `load_legacy_model`); requests never write to S3.
+"""
+
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+from collections.abc import Mapping
+
+import numpy as np
+from botocore.exceptions import BotoCoreError, ClientError
+from django.core.cache import cache
+
+from PennCourses.settings.base import S3_client
+
+
+MODEL_BUCKET = "penn.courses"
+MODEL_PREFIX = "course-cluster-model"
+MODEL_LATEST_KEY = f"{MODEL_PREFIX}/latest"  # an S3 object holding the latest version
+MODEL_VERSION_KEY = "course-cluster-model-version"  # the cache key of the latest version
+MODEL_FILES = [
+    "centroids.npy",
+    "curr_vectors.npy",
+    "past_vectors.npy",
+    "cluster_rows.npy",
+    "cluster_offsets.npy",
+    "codes.json",  # written last, so a model directory is complete if it exists
+]
+LOCAL_MODEL_DIR = os.path.join(tempfile.gettempdir(), MODEL_PREFIX)
+LEGACY_MODEL_KEY = "course-cluster-data.pkl"  # the S3 key of the pickled model (old format)
+LEGACY_MODEL_VERSION = "legacy"  # the "version" of the legacy model, while none is published
+# While no model can be loaded, requests skip S3 for this long (rather than retrying every time)
+MODEL_UNAVAILABLE_KEY = "course-cluster-model-unavailable"
+MODEL_UNAVAILABLE_TIMEOUT = 5 * 60
+
+logger = logging.getLogger(__name__)
+
+
+class ModelUnavailable(Exception):
+    """
+    Raised when no course recommendation model can be loaded (e.g. none has been published,
+    or S3 is unreachable).
+    """
+
+
+class CourseVectors(Mapping):
+    """
+    A read-only dict of course full codes to vectors, backed by a matrix (with one row per
+    course, possibly memory-mapped) and a full_code -> row index.
+    """
+
+    def __init__(self, codes, matrix):
+        self.codes = codes
+        self.index = {code: row for row, code in enumerate(codes)}
+        self.matrix = matrix
+
+    def __getitem__(self, code):
+        return self.matrix[self.index[code]]
+
+    def __iter__(self):
+        return iter(self.codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def save_model(course_clusters, path):
+    """
+    Saves the given model tuple (see the module docstring) to a new directory at the given path.
+    """
+    (
+        cluster_centroids,
+        clusters,
+        curr_course_vectors_dict,
+        past_course_vectors_dict,
+    ) = course_clusters
+    os.makedirs(path)
+    curr_codes, past_codes = list(curr_course_vectors_dict), list(past_course_vectors_dict)
+    curr_index = {code: row for row, code in enumerate(curr_codes)}
+    cluster_rows = [curr_index[code] for cluster in clusters for code in cluster]
+    cluster_offsets = np.cumsum([0] + [len(cluster) for cluster in clusters])
+    for name, array in [
+        ("centroids.npy", np.array(cluster_centroids, dtype=np.float64)),
+        ("curr_vectors.npy", np.array([curr_course_vectors_dict[c] for c in curr_codes])),
+        ("past_vectors.npy", np.array([past_course_vectors_dict[c] for c in past_codes])),
+        ("cluster_rows.npy", np.array(cluster_rows, dtype=np.int32)),
+        ("cluster_offsets.npy", cluster_offsets.astype(np.int32)),
+    ]:
+        np.save(os.path.join(path, name), array)
+    with open(os.path.join(path, "codes.json"), "w") as f:
+        json.dump({"curr": curr_codes, "past": past_codes}, f)
+
+
+def load_model(path):
+    """
+    Loads the model saved in the directory at the given path (see `save_model`), memory-mapping
+    its matrices, and returns the model tuple (with `CourseVectors` as the vector dicts).
+    """
+
+    def load(name):
+        return np.load(os.path.join(path, name), mmap_mode="r")
+
+    with open(os.path.join(path, "codes.json")) as f:
+        codes = json.load(f)
+    curr_codes = codes["curr"]
+    cluster_rows, cluster_offsets = load("cluster_rows.npy"), load("cluster_offsets.npy")
+    clusters = [
+        [curr_codes[row] for row in cluster_rows[start:end]]
+        for start, end in zip(cluster_offsets[:-1], cluster_offsets[1:])
+    ]
+    return (
+        load("centroids.npy"),
+        clusters,
+        CourseVectors(curr_codes, load("curr_vectors.npy")),
+        CourseVectors(codes["past"], load("past_vectors.npy")),
+    )
+
+
+def publish_model(course_clusters):
+    """
+    Uploads the given model tuple to S3 as a new version, and makes it the latest version
+    (so each worker loads it on its next request). Returns the new version.
+    """
+    version = uuid.uuid4().hex
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, version)
+        save_model(course_clusters, path)
+        for name in MODEL_FILES:
+            S3_client.upload_file(
+                os.path.join(path, name), MODEL_BUCKET, f"{MODEL_PREFIX}/{version}/{name}"
+            )
+    S3_client.put_object(Bucket=MODEL_BUCKET, Key=MODEL_LATEST_KEY, Body=version.encode())
+    cache.set(MODEL_VERSION_KEY, version, timeout=None)
+    cache.delete(MODEL_UNAVAILABLE_KEY)
+    return version
+
+
+def mark_model_unavailable():
+    """
+    Makes `get_latest_model_version` raise `ModelUnavailable` (without contacting S3) for the
+    next MODEL_UNAVAILABLE_TIMEOUT seconds, or until a model is published.
+    """
+    cache.set(MODEL_UNAVAILABLE_KEY, True, timeout=MODEL_UNAVAILABLE_TIMEOUT)
+
+
+def load_legacy_model():
+    """
+    Downloads and unpickles the legacy model (LEGACY_MODEL_KEY), and returns the model tuple.
+    This doesn't publish it (see the `publishlegacymodel` command).
+    Raises `ModelUnavailable` (and calls `mark_model_unavailable`) if it can't be loaded.
+    """
+    try:
+        return pickle.loads(
+            S3_client.get_object(Bucket=MODEL_BUCKET, Key=LEGACY_MODEL_KEY)["Body"].read()
+        )
+    except (BotoCoreError, ClientError, pickle.UnpicklingError, OSError, ValueError) as e:
+        mark_model_unavailable()
+        raise ModelUnavailable("Could not load the legacy model.") from e
+
+
+def get_latest_model_version():
+    """
+    Returns the latest published model version, from the cache (or from S3, if the cache
+    doesn't have it), or LEGACY_MODEL_VERSION if no version has been published yet (in which
+    case the legacy model should be loaded with `load_legacy_model`).
+    Raises `ModelUnavailable` if S3 can't be reached, or within MODEL_UNAVAILABLE_TIMEOUT
+    seconds of a model failing to load (see `mark_model_unavailable`).
+    """
+    cached = cache.get_many([MODEL_VERSION_KEY, MODEL_UNAVAILABLE_KEY])
+    if cached.get(MODEL_UNAVAILABLE_KEY):
+        raise ModelUnavailable("No course recommendation model is available.")
+    version = cached.get(MODEL_VERSION_KEY)
+    if version is not None:
+        return version
+    try:
+        version = (
+            S3_client.get_object(Bucket=MODEL_BUCKET, Key=MODEL_LATEST_KEY)["Body"].read().decode()
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ["NoSuchKey", "404"]:
+            mark_model_unavailable()
+            raise ModelUnavailable("Could not read the latest model version.") from e
+        logger.warning("No course recommendation model version published; using the legacy model")
+        version = LEGACY_MODEL_VERSION  # replaced in the cache once a version is published
+    except BotoCoreError as e:
+        mark_model_unavailable()
+        raise ModelUnavailable("Could not read the latest model version.") from e
+    cache.set(MODEL_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def download_model(version):
+    """
+    Downloads the given model version from S3 to LOCAL_MODEL_DIR (unless another process
+    already has), deleting older local versions, and returns the path of its directory.
+    Raises `ModelUnavailable` if the download fails.
+    """
+    path = os.path.join(LOCAL_MODEL_DIR, version)
+    if os.path.exists(os.path.join(path, "codes.json")):
+        return path
+    os.makedirs(LOCAL_MODEL_DIR, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix="download-", dir=LOCAL_MODEL_DIR)
+    try:
+        for name in MODEL_FILES:
+            S3_client.download_file(
+                MODEL_BUCKET, f"{MODEL_PREFIX}/{version}/{name}", os.path.join(tmp_path, name)
+            )
+    except (BotoCoreError, ClientError, OSError) as e:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise ModelUnavailable(f"Could not download model version {version}.") from e
+    try:
+        os.rename(tmp_path, path)
+    except OSError:  # downloaded concurrently by another process
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    # Deleting the files of an older version is safe even if a process still has them mapped
+    for other in os.listdir(LOCAL_MODEL_DIR):
+        if other != version and not other.startswith("download-"):
+            shutil.rmtree(os.path.join(LOCAL_MODEL_DIR, other), ignore_errors=True)
+    return path
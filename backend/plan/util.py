@@ -1,5 +1,16 @@
 import datetime
 
+from django.core.cache import cache
+from django.db.models import Q
+
+from courses.models import Meeting, Section
+from courses.util import get_meeting_bitmap
+from PennCourses.settings.base import CACHE_PREFIX
+from plan.models import Break
+
+
+SCHEDULE_OCCUPANCY_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 def get_first_matching_date(start_date_str, days):
     day_map = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
@@ -11,3 +22,39 @@ def get_first_matching_date(start_date_str, days):
         if candidate.weekday() in weekdays:
             return str(candidate)
     return None
+
+
+def schedule_occupancy_cache_key(schedule_id, person_id):
+    # Prefixed so the key is deleted by the cache clear after each registrar import
+    return f"{CACHE_PREFIX}schedule_occupancy:{schedule_id}:{person_id}"
+
+
+def get_schedule_occupancy(schedule_id, person_id):
+    """
+    Returns a meeting bitmap string (see `Section.meeting_bitmap`) of the weekly time slots
+    occupied by the sections and checked breaks of the given schedule (if it belongs to the
+    given person; otherwise no slots are occupied), for the schedule-fit search filter.
+    Cached per schedule (invalidated by `invalidate_schedule_occupancy` whenever the schedule's
+    sections or breaks change, and by the cache clear after each registrar import).
+    """
+    key = schedule_occupancy_cache_key(schedule_id, person_id)
+    occupancy = cache.get(key)
+    if occupancy is None:
+        schedule = Q(schedule__id=schedule_id, schedule__person_id=person_id)
+        occupancy = get_meeting_bitmap(
+            Meeting.objects.filter(
+                Q(section__in=Section.objects.filter(schedule))
+                | Q(associated_break__in=Break.objects.filter(schedule, checked=True))
+            ).values_list("day", "start", "end")
+        )
+        cache.set(key, occupancy, timeout=SCHEDULE_OCCUPANCY_CACHE_TIMEOUT)
+    return occupancy
+
+
+def invalidate_schedule_occupancy(schedules):
+    """
+    Invalidates the cached occupancy of the given schedules.
+    """
+    cache.delete_many(
+        [schedule_occupancy_cache_key(schedule.id, schedule.person_id) for schedule in schedules]
+    )
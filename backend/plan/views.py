@@ -37,8 +37,9 @@ from plan.management.commands.recommendcourses import (
     vectorize_user_by_courses,
 )
 from plan.models import Break, PrimarySchedule, Schedule
+from plan.recommender_model import ModelUnavailable
 from plan.serializers import BreakSerializer, PrimaryScheduleSerializer, ScheduleSerializer
-from plan.util import get_first_matching_date
+from plan.util import get_first_matching_date, invalidate_schedule_occupancy
 
 
 @api_view(["POST"])
@@ -50,6 +51,7 @@ from plan.util import get_first_matching_date
                     200: "[DESCRIBE_RESPONSE_SCHEMA]Response returned successfully.",
                     201: "[UNDOCUMENTED]",
                     400: "Invalid curr_courses, past_courses, or n_recommendations (see response).",
+                    503: "The course recommendation model is temporarily unavailable.",
                 }
             }
         },
@@ -140,7 +142,13 @@ def recommend_courses_view(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    course_clusters = retrieve_course_clusters()
+    try:
+        course_clusters = retrieve_course_clusters()
+    except ModelUnavailable:
+        return Response(
+            "The course recommendation model is temporarily unavailable.",
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
 
     (
         cluster_centroids,
@@ -530,7 +538,9 @@ class ScheduleViewSet(AutoPrefetchViewSetMixin, viewsets.ModelViewSet):
         return name
 
     def destroy(self, request, *args, **kwargs):
-        self.validate_name(request, existing_schedule=self.get_object())
+        schedule = self.get_object()
+        self.validate_name(request, existing_schedule=schedule)
+        invalidate_schedule_occupancy([schedule])
         return super().destroy(request, *args, **kwargs)
 
     def update(self, request, pk=None):
@@ -582,6 +592,8 @@ class ScheduleViewSet(AutoPrefetchViewSetMixin, viewsets.ModelViewSet):
             schedule.save()
             schedule.sections.set(sections)
             schedule.breaks.set(breaks)
+            # Breaks' checked flags may have changed, for other schedules including them too
+            invalidate_schedule_occupancy([schedule, *Schedule.objects.filter(breaks__in=breaks)])
             return Response({"message": "success", "id": schedule.id}, status=status.HTTP_200_OK)
         except IntegrityError as e:
             return Response(
@@ -627,6 +639,7 @@ class ScheduleViewSet(AutoPrefetchViewSetMixin, viewsets.ModelViewSet):
                     name=name,
                 )
             schedule.sections.set(sections)
+            invalidate_schedule_occupancy([schedule])
             return Response(
                 {"message": "success", "id": schedule.id},
                 status=status.HTTP_201_CREATED,
@@ -731,6 +744,7 @@ class BreakViewSet(AutoPrefetchViewSetMixin, viewsets.ModelViewSet):
             return Response(
                 {"detail": "Error saving break: " + str(e)}, status=status.HTTP_400_BAD_REQUEST
             )
+        invalidate_schedule_occupancy(Schedule.objects.filter(breaks=current_break))
 
         return Response(
             {"message": "success", "break_id": current_break.id}, status=status.HTTP_200_OK
@@ -812,6 +826,7 @@ class BreakViewSet(AutoPrefetchViewSetMixin, viewsets.ModelViewSet):
 
         try:
             current_break = self.get_queryset().get(id=break_id)
+            invalidate_schedule_occupancy(Schedule.objects.filter(breaks=current_break))
             current_break.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         except Break.DoesNotExist:
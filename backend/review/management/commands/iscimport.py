@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
 from courses.management.commands.recompute_soft_state import recompute_has_reviews
+from courses.search_cache import bump_course_search_generation
 from courses.util import get_current_semester
 from PennCourses.settings.base import S3_client
 from review.import_utils.import_to_db import (
@@ -305,6 +306,7 @@ class Command(BaseCommand):
         print("Recomputing Section.has_reviews...")
         recompute_has_reviews()
         precompute_pcr_views(verbose=True, is_new_data=True)
+        bump_course_search_generation()  # review averages are listed in course search results
 
         print("Done.")
         return 0
@@ -723,7 +723,9 @@ def instructor_for_course_reviews(request, course_code, instructor_id):
             course_title=F("section__course__title"),
             activity=F("section__activity"),
             efficient_semester=F("section__course__semester"),
-        ).values()
+        )
+        .order_by("section__code")
+        .values()
     )
     existing_sections = {r["section_id"] for r in reviews}
     all_sections = reviews + [
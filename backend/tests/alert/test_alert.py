@@ -1,34 +1,67 @@
 import base64
 import importlib
 import json
+import logging
+import time
 from datetime import datetime, timedelta
-from unittest.mock import patch
+from email.mime.text import MIMEText
+from io import StringIO
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+from unittest.mock import MagicMock, call, patch
 
 from dateutil.tz.tz import gettz
 from ddt import data, ddt, unpack
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import DatabaseError
 from django.db.models.signals import post_save
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
-from options.models import Option
+from options.models import Option, get_bool
+from redis.exceptions import ConnectionError as RedisConnectionError
 from rest_framework.test import APIClient
-
-from alert import tasks
-from alert.alerts import get_meeting_string
-from alert.models import SOURCE_PCA, AddDropPeriod, Registration, RegStatus, register_for_course
+from twilio.http import HttpClient
+from twilio.http.response import Response as TwilioResponse
+from twilio.rest import Client as TwilioClient
+
+from alert import demand_index, latency, queues, status_cache, tasks, webhook_stream
+from alert.alerts import (
+    SMSQueue,
+    SMTPConnectionPool,
+    TokenBucket,
+    dispatch_push_notifications,
+    get_meeting_string,
+)
+from alert.management.commands.pushbenchmark import MockPushServer
+from alert.management.commands.replaywebhooks import REDIS_CLIENTS, REDIS_OPTIONS, LocalBroker
+from alert.models import (
+    SOURCE_PCA,
+    AddDropPeriod,
+    DailyAlertStats,
+    PcaDemandDistributionEstimate,
+    Registration,
+    RegStatus,
+    alert_stats_counts_key,
+    get_alert_stats,
+    register_for_course,
+    rollup_alert_stats,
+)
 from alert.tasks import get_registrations_for_alerts
 from courses.models import StatusUpdate
 from courses.util import (
     get_add_drop_period,
     get_or_create_course_and_section,
     invalidate_current_semester_cache,
+    record_update,
     translate_semester,
 )
 from PennCourses.celery import app as celeryapp
-from PennCourses.settings.base import TIME_ZONE
+from PennCourses.settings.base import DEMAND_CHANGE_COALESCE_SECONDS, TIME_ZONE
 from tests.courses.util import create_mock_data
 
 
@@ -706,6 +739,863 @@ class WebhookTriggeredAlertTestCase(TestCase):
             self.assertTrue(id_ in expected_ids)
 
 
+@patch("alert.models.PushNotification.send_alert")
+@patch("alert.models.Text.send_alert")
+@patch("alert.models.Email.send_alert")
+class BatchedAlertFanoutTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        _, self.section, _, _ = get_or_create_course_and_section("CIS-1600-001", TEST_SEMESTER)
+        self.registrations = [
+            Registration(email=f"{i}@example.com", section=self.section) for i in range(5)
+        ]
+        for reg in self.registrations:
+            reg.save()
+        self.registrations[0].notification_sent = True
+        self.registrations[0].save()
+
+    def fanout(self, chunk_size=2):
+        with patch("alert.tasks.ALERT_FANOUT_CHUNK_SIZE", chunk_size), patch(
+            "alert.tasks.send_alert_batch.delay"
+        ) as mock_delay:
+            mock_delay.side_effect = tasks.send_alert_batch
+            result = tasks.send_course_alerts_batched(
+                "CIS-1600-001", "O", semester=TEST_SEMESTER, sent_by="WEB"
+            )
+        return result, mock_delay
+
+    def test_fanout_sends_all_active(self, mock_email, mock_text, mock_push_notification):
+        mock_email.return_value = True
+        result, mock_delay = self.fanout()
+        self.assertEqual(4, result["result"])
+        self.assertEqual(2, mock_delay.call_count)
+        self.assertEqual(4, mock_email.call_count)
+        for reg in self.registrations[1:]:
+            reg.refresh_from_db()
+            self.assertTrue(reg.notification_sent)
+            self.assertEqual("WEB", reg.notification_sent_by)
+
+    def test_fanout_renders_templates_once(self, mock_email, mock_text, mock_push_notification):
+        mock_email.return_value = True
+        with patch("alert.alerts.render_alert_template") as mock_render:
+            mock_render.return_value = "rendered"
+            self.fanout(chunk_size=1)
+        # Each template is rendered once per auto_resubscribe value, regardless of chunk count
+        self.assertEqual(10, mock_render.call_count)
+
+    def test_fanout_no_registrations(self, mock_email, mock_text, mock_push_notification):
+        for reg in self.registrations:
+            reg.cancelled = True
+            reg.save()
+        result, mock_delay = self.fanout()
+        self.assertEqual(0, result["result"])
+        self.assertFalse(mock_delay.called)
+        self.assertFalse(mock_email.called)
+
+    def test_alert_for_course_uses_option(self, mock_email, mock_text, mock_push_notification):
+        from alert.views import alert_for_course
+
+        Option(key="BATCH_ALERT_FANOUT", value="TRUE", value_type="BOOL").save()
+        with patch("alert.views.send_course_alerts_batched.delay") as mock_batched, patch(
+            "alert.views.send_course_alerts.delay"
+        ) as mock_unbatched:
+            alert_for_course("CIS-1600-001", TEST_SEMESTER, "WEB", "O")
+        self.assertTrue(mock_batched.called)
+        self.assertFalse(mock_unbatched.called)
+
+
+@patch("alert.models.PushNotification.send_alert")
+@patch("alert.models.Text.send_alert")
+@patch("alert.models.Email.send_alert")
+@override_settings(ALERT_LATENCY_METRICS=True)
+class AlertLatencyTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        _, self.section, _, _ = get_or_create_course_and_section("CIS-1600-001", TEST_SEMESTER)
+        Registration(email="e@example.com", phone="+15555555555", section=self.section).save()
+        latency._buffer.clear()
+        patcher = patch("alert.latency.r")
+        self.mock_redis = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pipeline = self.mock_redis.pipeline.return_value
+
+    def recorded_metrics(self):
+        return {
+            c.args[0].split(":", 2)[2]: c.args[1:]
+            for c in self.pipeline.hincrby.call_args_list
+            + self.pipeline.hincrbyfloat.call_args_list
+            if c.args[1] != "sum"
+        }
+
+    def test_records_queue_wait_and_channel_latencies(
+        self, mock_email, mock_text, mock_push_notification
+    ):
+        mock_email.return_value = True
+        mock_text.return_value = True
+        received_at = timezone.now() - timedelta(seconds=3)
+        with patch("alert.tasks.send_alert.delay") as mock_delay:
+            mock_delay.side_effect = tasks.send_alert
+            tasks.send_course_alerts(
+                "CIS-1600-001",
+                "O",
+                semester=TEST_SEMESTER,
+                sent_by="WEB",
+                webhook_received_at=received_at.isoformat(),
+            )
+        self.assertEqual(
+            {
+                "queue_wait:send_course_alerts",
+                "queue_wait:send_alert",
+                "send:email",
+                "send:text",
+                "end_to_end:email",
+                "end_to_end:text",
+            },
+            set(self.recorded_metrics()),
+        )
+        # 3 seconds falls in the (2.5, 5] bucket
+        self.assertEqual(
+            (str(latency.bucket_index(3)), 1), self.recorded_metrics()["end_to_end:email"]
+        )
+        self.assertEqual([], latency._buffer)
+
+    def test_failed_channel_not_recorded(self, mock_email, mock_text, mock_push_notification):
+        mock_email.return_value = False
+        mock_text.return_value = True
+        reg = Registration.objects.get()
+        tasks.send_alert(reg.id, close_notification=False, webhook_received_at=timezone.now())
+        self.assertIn("send:text", self.recorded_metrics())
+        self.assertNotIn("send:email", self.recorded_metrics())
+
+    @override_settings(ALERT_LATENCY_METRICS=False)
+    def test_disabled(self, mock_email, mock_text, mock_push_notification):
+        mock_email.return_value = True
+        reg = Registration.objects.get()
+        tasks.send_alert(reg.id, close_notification=False, webhook_received_at=timezone.now())
+        self.assertFalse(self.mock_redis.pipeline.called)
+
+    def test_redis_error_does_not_block_alert(self, mock_email, mock_text, mock_push_notification):
+        mock_email.return_value = True
+        self.pipeline.execute.side_effect = RedisConnectionError()
+        reg = Registration.objects.get()
+        result = tasks.send_alert(reg.id, close_notification=False)
+        self.assertTrue(result["result"])
+
+    def test_histogram_percentile(self, mock_email, mock_text, mock_push_notification):
+        buckets = [0] * (len(latency.LATENCY_BUCKETS) + 1)
+        buckets[latency.bucket_index(0.75)] = 90  # (0.5, 1]
+        buckets[latency.bucket_index(20)] = 10  # (10, 30]
+        self.assertAlmostEqual(0.75, latency.histogram_percentile(buckets, 100, 45))
+        self.assertAlmostEqual(20, latency.histogram_percentile(buckets, 100, 95))
+        self.assertIsNone(latency.histogram_percentile([0] * len(buckets), 0, 50))
+        buckets[-1] = 1000
+        self.assertEqual(
+            latency.LATENCY_BUCKETS[-1], latency.histogram_percentile(buckets, 1100, 99)
+        )
+
+    def mock_histograms(self):
+        day = timezone.now().date()
+        key = latency.latency_key("end_to_end:email", day).encode()
+        self.mock_redis.scan_iter.side_effect = lambda match: (
+            [key] if match == latency.latency_key("", day) + "*" else []
+        )
+        self.mock_redis.hgetall.return_value = {
+            str(latency.bucket_index(0.75)).encode(): b"3",
+            str(latency.bucket_index(20)).encode(): b"1",
+            b"sum": b"22.25",
+        }
+
+    def test_get_latency_stats(self, mock_email, mock_text, mock_push_notification):
+        self.mock_histograms()
+        stats = latency.get_latency_stats(days=2)
+        self.assertEqual(["end_to_end:email"], list(stats))
+        self.assertEqual(4, stats["end_to_end:email"]["count"])
+        self.assertEqual(5.5625, stats["end_to_end:email"]["mean"])
+        self.assertEqual(3, stats["end_to_end:email"]["buckets"]["<=1"])
+        self.assertAlmostEqual(0.8333, stats["end_to_end:email"]["p50"])
+        self.assertEqual(2, self.mock_redis.scan_iter.call_count)
+
+    def test_latency_endpoint(self, mock_email, mock_text, mock_push_notification):
+        self.mock_histograms()
+        client = APIClient()
+        user = User.objects.create_user(username="jacob", password="top_secret")
+        client.force_authenticate(user)
+        response = client.get(reverse("alert-latency"))
+        self.assertEqual(403, response.status_code)
+        user.is_staff = True
+        user.save()
+        response = client.get(reverse("alert-latency"), {"days": 7})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(4, response.data["end_to_end:email"]["count"])
+        response = client.get(reverse("alert-latency"), {"days": "a"})
+        self.assertEqual(400, response.status_code)
+
+
+class DemandChangeCoalescingTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        _, self.section, _, _ = get_or_create_course_and_section("CIS-1600-001", TEST_SEMESTER)
+        self.section.capacity = 10
+        self.section.has_status_updates = True
+        self.section.save()
+        self.now = timezone.now()
+
+    def schedule(self, mock_redis, *offsets):
+        with patch("alert.tasks.r", mock_redis), patch(
+            "alert.tasks.recompute_demand_distribution_estimate.apply_async"
+        ) as mock_apply_async:
+            for offset in offsets:
+                tasks.schedule_demand_distribution_update(
+                    TEST_SEMESTER, self.now + timedelta(seconds=offset)
+                )
+        return mock_apply_async
+
+    def recompute(self, mock_redis):
+        with patch("alert.tasks.r", mock_redis), patch(
+            "alert.tasks.update_demand_distribution_estimate"
+        ) as mock_update:
+            tasks.recompute_demand_distribution_estimate(TEST_SEMESTER, self.now)
+        return mock_update
+
+    def test_changes_coalesced(self):
+        mock_redis = MagicMock()
+        pipeline = mock_redis.pipeline.return_value
+        # Only the first change sets the scheduled flag
+        pipeline.execute.side_effect = [[1, True, True], [0, True, None], [0, True, None]]
+        mock_apply_async = self.schedule(mock_redis, 0, 2, 1)
+        mock_apply_async.assert_called_once_with(
+            args=(TEST_SEMESTER, self.now), countdown=DEMAND_CHANGE_COALESCE_SECONDS
+        )
+        key = tasks.demand_change_cache_key(TEST_SEMESTER, "latest_updated_at")
+        self.assertEqual(
+            [
+                call(
+                    key, {"updated_at": (self.now + timedelta(seconds=offset)).timestamp()}, gt=True
+                )
+                for offset in (0, 2, 1)
+            ],
+            pipeline.zadd.call_args_list,
+        )
+        # The recomputation uses the latest updated_at of the coalesced changes
+        latest = self.now + timedelta(seconds=2)
+        pipeline.execute.side_effect = [[1, latest.timestamp(), 1]]
+        self.recompute(mock_redis).assert_called_once_with(TEST_SEMESTER, latest)
+
+    def test_recompute_without_coalesced_changes(self):
+        mock_redis = MagicMock()
+        mock_redis.pipeline.return_value.execute.return_value = [0, None, 0]
+        self.recompute(mock_redis).assert_called_once_with(TEST_SEMESTER, self.now)
+
+    def test_redis_down_recomputes_directly(self):
+        mock_redis = MagicMock()
+        mock_redis.pipeline.return_value.execute.side_effect = RedisConnectionError
+        mock_apply_async = self.schedule(mock_redis, 0, 1)
+        self.assertEqual(
+            [
+                call(args=(TEST_SEMESTER, self.now), countdown=None),
+                call(args=(TEST_SEMESTER, self.now + timedelta(seconds=1)), countdown=None),
+            ],
+            mock_apply_async.call_args_list,
+        )
+        self.recompute(mock_redis).assert_called_once_with(TEST_SEMESTER, self.now)
+
+    def test_no_coalesce_window(self):
+        with patch("alert.tasks.DEMAND_CHANGE_COALESCE_SECONDS", 0), patch(
+            "alert.tasks.recompute_demand_distribution_estimate.apply_async"
+        ) as mock_apply_async:
+            for _ in range(3):
+                tasks.schedule_demand_distribution_update(TEST_SEMESTER, self.now)
+        self.assertEqual(3, mock_apply_async.call_count)
+
+    def test_other_semester_ignored(self):
+        with patch("alert.tasks.r") as mock_redis, patch(
+            "alert.tasks.recompute_demand_distribution_estimate.apply_async"
+        ) as mock_apply_async:
+            tasks.schedule_demand_distribution_update("2018C", self.now)
+        self.assertFalse(mock_apply_async.called)
+        self.assertFalse(mock_redis.pipeline.called)
+
+    @patch("alert.tasks.r")
+    def test_registration_updates_estimate(self, mock_redis):
+        # Each change schedules a recompute (run eagerly), which finds no other coalesced changes
+        mock_redis.pipeline.return_value.execute.return_value = [1, None, True]
+        Registration(email="a@example.com", section=self.section).save()
+        estimate = PcaDemandDistributionEstimate.objects.get()
+        self.assertEqual(self.section, estimate.highest_demand_section)
+        self.assertEqual(1, estimate.highest_demand_section_volume)
+
+
+@patch("alert.models.r")
+@patch("alert.models.PushNotification.send_alert")
+@patch("alert.models.Text.send_alert")
+@patch("alert.models.Email.send_alert")
+class DailyAlertStatsTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        _, self.section, _, _ = get_or_create_course_and_section("CIS-1600-001", TEST_SEMESTER)
+        self.r1 = Registration(email="e@example.com", phone="+15555555555", section=self.section)
+        self.r2 = Registration(email="f@example.com", section=self.section, auto_resubscribe=True)
+        self.r1.save()
+        self.r2.save()
+        self.today = timezone.localdate()
+
+    def test_alert_records_channels(
+        self, mock_email, mock_text, mock_push_notification, mock_redis
+    ):
+        mock_email.return_value = True
+        mock_text.return_value = True
+        self.assertTrue(self.r1.alert())
+        mock_text.return_value = None
+        self.assertTrue(self.r2.alert())
+        key = alert_stats_counts_key(TEST_SEMESTER, self.today)
+        pipeline = mock_redis.pipeline.return_value
+        self.assertEqual(
+            [call(key, "emails_sent", 1), call(key, "texts_sent", 1), call(key, "emails_sent", 1)],
+            pipeline.hincrby.call_args_list,
+        )
+        self.assertFalse(DailyAlertStats.objects.exists())
+
+    def test_alert_records_channels_redis_down(
+        self, mock_email, mock_text, mock_push_notification, mock_redis
+    ):
+        mock_redis.pipeline.return_value.execute.side_effect = RedisConnectionError
+        mock_email.return_value = True
+        mock_text.return_value = True
+        self.assertTrue(self.r1.alert())
+        stats = DailyAlertStats.objects.get(date=self.today, semester=TEST_SEMESTER)
+        self.assertEqual(1, stats.emails_sent)
+        self.assertEqual(1, stats.texts_sent)
+        self.assertEqual(0, stats.push_notifications_sent)
+
+    def test_rollup(self, mock_email, mock_text, mock_push_notification, mock_redis):
+        mock_email.return_value = True
+        self.r1.alert()
+        self.r1.resubscribe()
+        record_update(self.section, TEST_SEMESTER, "C", "O", True, "{}")
+        key = alert_stats_counts_key(TEST_SEMESTER, self.today)
+        redis_counts = {key: {b"emails_sent": b"1", b"texts_sent": b"0"}}
+        mock_redis.hgetall.side_effect = lambda k: redis_counts.get(k, {})
+        with self.captureOnCommitCallbacks(execute=True):
+            rollups = rollup_alert_stats(TEST_SEMESTER)
+        mock_redis.pipeline.return_value.hincrby.assert_called_with(key, "emails_sent", -1)
+        redis_counts.clear()
+        self.assertEqual([self.today, self.today - timedelta(days=1)], [r.date for r in rollups])
+        stats = DailyAlertStats.objects.get(date=self.today, semester=TEST_SEMESTER)
+        self.assertEqual(2, stats.new_registrations)
+        self.assertEqual(1, stats.alerts_sent)
+        self.assertEqual(1, stats.resubscribes)
+        self.assertEqual(1, stats.status_updates)
+        self.assertEqual(1, stats.active_auto_resubscribe)
+        self.assertEqual(0, stats.cancelled_auto_resubscribe)
+        self.assertEqual(1, stats.emails_sent)
+        self.assertEqual(0, stats.texts_sent)
+        # Rolling up again is idempotent, and keeps the per-channel counters
+        rollup_alert_stats(TEST_SEMESTER)
+        stats.refresh_from_db()
+        self.assertEqual(2, stats.new_registrations)
+        self.assertEqual(1, stats.emails_sent)
+        self.assertEqual(2, DailyAlertStats.objects.count())
+
+    def test_get_alert_stats(self, mock_email, mock_text, mock_push_notification, mock_redis):
+        for days_ago, new_registrations, active in [(2, 5, 10), (1, 3, 12), (0, 1, 11)]:
+            DailyAlertStats(
+                date=self.today - timedelta(days=days_ago),
+                semester=TEST_SEMESTER,
+                new_registrations=new_registrations,
+                active_auto_resubscribe=active,
+            ).save()
+        stats = get_alert_stats(TEST_SEMESTER, self.today - timedelta(days=2), self.today)
+        self.assertEqual(9, stats["new_registrations"])
+        self.assertEqual(11, stats["active_auto_resubscribe"])
+        stats = get_alert_stats(
+            TEST_SEMESTER, self.today - timedelta(days=2), self.today - timedelta(days=1)
+        )
+        self.assertEqual(8, stats["new_registrations"])
+        self.assertEqual(12, stats["active_auto_resubscribe"])
+        self.assertEqual(0, get_alert_stats("2019C", self.today, self.today)["new_registrations"])
+
+    def test_stats_endpoint(self, mock_email, mock_text, mock_push_notification, mock_redis):
+        rollup_alert_stats(TEST_SEMESTER)
+        client = APIClient()
+        user = User.objects.create_user(username="jacob", password="top_secret")
+        client.force_authenticate(user)
+        self.assertEqual(403, client.get(reverse("alert-stats")).status_code)
+        user.is_staff = True
+        user.save()
+        start_date = (self.today - timedelta(days=6)).isoformat()
+        response = client.get(reverse("alert-stats"), {"start_date": start_date})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, response.data["totals"]["new_registrations"])
+        self.assertEqual(2, len(response.data["days"]))
+        response = client.get(reverse("alert-stats"), {"start_date": "yesterday"})
+        self.assertEqual(400, response.status_code)
+
+
+class AlertQueueRoutingTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        _, self.section, _, _ = get_or_create_course_and_section("CIS-1600-001", TEST_SEMESTER)
+        Registration(email="e@example.com", section=self.section).save()
+
+    def test_route_task(self):
+        for name, args, kwargs, queue in [
+            ("pca.tasks.send_alert", (1,), {"close_notification": False}, "alerts"),
+            ("pca.tasks.send_alert", (1, True), {}, "alerts_close"),
+            ("pca.tasks.send_alert_batch", ([1, 2],), {"close_notification": True}, "alerts_close"),
+            ("pca.tasks.send_course_alerts", ("CIS-1600-001",), {"course_status": "O"}, "alerts"),
+            ("pca.tasks.send_course_alerts_batched", ("CIS-1600-001", "C"), {}, "alerts_close"),
+            ("pca.tasks.recompute_percent_open", (TEST_SEMESTER,), {}, "background"),
+            ("pca.tasks.recompute_demand_distribution_estimate", (), {}, "background"),
+        ]:
+            self.assertEqual({"queue": queue}, queues.route_task(name, args, kwargs, {}))
+        self.assertIsNone(queues.route_task("celery.backend_cleanup", (), {}, {}))
+
+    @patch("alert.queues.r")
+    def test_admission_policy(self, mock_redis):
+        task = tasks.recompute_percent_open_async
+        mock_redis.pipeline.return_value.execute.return_value = [8, 2]
+        with override_settings(ALERT_BACKLOG_THRESHOLD=20), patch.object(
+            task, "apply_async"
+        ) as mock_apply_async:
+            queues.enqueue_background_task(task, (TEST_SEMESTER,))
+        mock_apply_async.assert_called_once_with(args=(TEST_SEMESTER,), countdown=None)
+
+        mock_redis.pipeline.return_value.execute.return_value = [25, 2]
+        with override_settings(ALERT_BACKLOG_THRESHOLD=20), patch.object(
+            task, "apply_async"
+        ) as mock_apply_async, patch("alert.queues.cache", LocMemCache("admission-tests", {})):
+            queues.enqueue_background_task(task, (TEST_SEMESTER,), countdown=10)
+            # An identical task is shed while the first is deferred
+            self.assertIsNone(queues.enqueue_background_task(task, (TEST_SEMESTER,)))
+            queues.enqueue_background_task(task, ("2019C",))
+        self.assertEqual(
+            [
+                call(args=(TEST_SEMESTER,), countdown=settings.BACKGROUND_TASK_DEFER_SECONDS),
+                call(args=("2019C",), countdown=settings.BACKGROUND_TASK_DEFER_SECONDS),
+            ],
+            mock_apply_async.call_args_list,
+        )
+
+    @patch("alert.queues.r")
+    def test_admission_policy_demand_recompute_shed(self, mock_redis):
+        mock_redis.pipeline.return_value.execute.return_value = [25, 2]
+        now = timezone.now()
+        with override_settings(ALERT_BACKLOG_THRESHOLD=20), patch(
+            "alert.tasks.recompute_demand_distribution_estimate.apply_async"
+        ) as mock_apply_async, patch("alert.queues.cache", LocMemCache("admission-tests", {})):
+            tasks.enqueue_demand_distribution_recompute(TEST_SEMESTER, now)
+            # Shed despite its later updated_at, since it would recompute the same estimate
+            tasks.enqueue_demand_distribution_recompute(TEST_SEMESTER, now + timedelta(seconds=1))
+        mock_apply_async.assert_called_once_with(
+            args=(TEST_SEMESTER, now), countdown=settings.BACKGROUND_TASK_DEFER_SECONDS
+        )
+
+    @patch("alert.queues.r")
+    def test_admission_policy_redis_down(self, mock_redis):
+        mock_redis.pipeline.return_value.execute.side_effect = RedisConnectionError()
+        task = tasks.recompute_percent_open_async
+        with override_settings(ALERT_BACKLOG_THRESHOLD=0), patch.object(
+            task, "apply_async"
+        ) as mock_apply_async:
+            queues.enqueue_background_task(task, (TEST_SEMESTER,))
+        mock_apply_async.assert_called_once_with(args=(TEST_SEMESTER,), countdown=None)
+
+    def alert_latency_under_backlog(self, queue_order, backlog=50, task_seconds=0.005):
+        """
+        Queues `backlog` background recomputes (each taking `task_seconds`) in an in-memory
+        broker, then an open alert, and returns (the number of background tasks run before the
+        alert was sent, the alert's latency in seconds).
+        """
+        Registration.objects.update(notification_sent=False, notification_sent_at=None)
+        events = []
+        with patch("alert.tasks.recompute_percent_open") as mock_recompute, patch(
+            "alert.models.Email.send_alert"
+        ) as mock_email, LocalBroker(queue_order=queue_order) as broker:
+            mock_recompute.side_effect = lambda **kwargs: (
+                time.sleep(task_seconds),
+                events.append("background"),
+            )
+            mock_email.side_effect = lambda **kwargs: events.append("alert") or True
+            for _ in range(backlog):
+                tasks.recompute_percent_open_async.delay(TEST_SEMESTER)
+            start = time.perf_counter()
+            tasks.send_course_alerts.delay("CIS-1600-001", "O", semester=TEST_SEMESTER)
+            while "alert" not in events:
+                broker.run_next()
+            latency = time.perf_counter() - start
+        return events.index("alert"), latency
+
+    def test_alerts_prioritized_over_backlog(self):
+        fifo_background_run, fifo_latency = self.alert_latency_under_backlog(queue_order=None)
+        background_run, latency = self.alert_latency_under_backlog(
+            queue_order=queues.QUEUE_PRIORITY_ORDER
+        )
+        self.assertEqual(50, fifo_background_run)
+        self.assertGreaterEqual(fifo_latency, 50 * 0.005)
+        self.assertEqual(0, background_run)
+        self.assertLess(latency, fifo_latency)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+@patch("alert.demand_index.r")
+class SectionDemandIndexTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        set_semester()
+        self.sections = []
+        for i, (volume, status) in enumerate([(5, "C"), (20, "C"), (1, "O")]):
+            _, section, _, _ = get_or_create_course_and_section(f"CIS-160{i}-001", TEST_SEMESTER)
+            section.capacity = 10
+            section.registration_volume = volume
+            section.status = status
+            section.has_status_updates = True
+            section.save()
+            self.sections.append(section)
+
+    def enable_index(self):
+        Option.objects.update_or_create(
+            key="SECTION_DEMAND_INDEX", value_type="BOOL", defaults={"value": "TRUE"}
+        )
+
+    def test_update_disabled(self, mock_redis):
+        demand_index.update_section_demand_index(self.sections[0])
+        self.assertFalse(mock_redis.pipeline.called)
+
+    def test_update_closed_section(self, mock_redis):
+        self.enable_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            demand_index.update_section_demand_index(self.sections[0])
+        pipeline = mock_redis.pipeline.return_value
+        pipeline.zadd.assert_any_call(
+            demand_index.demand_index_key(TEST_SEMESTER), {self.sections[0].id: 0.5}
+        )
+        pipeline.zadd.assert_any_call(
+            demand_index.demand_index_key(TEST_SEMESTER, closed=True), {self.sections[0].id: 0.5}
+        )
+        self.assertTrue(pipeline.execute.called)
+
+    def test_update_open_section(self, mock_redis):
+        self.enable_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            demand_index.update_section_demand_index(self.sections[2])
+        pipeline = mock_redis.pipeline.return_value
+        pipeline.zadd.assert_called_once_with(
+            demand_index.demand_index_key(TEST_SEMESTER), {self.sections[2].id: 0.1}
+        )
+        pipeline.zrem.assert_called_once_with(
+            demand_index.demand_index_key(TEST_SEMESTER, closed=True), self.sections[2].id
+        )
+
+    def test_update_unindexed_section(self, mock_redis):
+        self.enable_index()
+        self.sections[0].capacity = 0
+        self.sections[0].save()
+        with self.captureOnCommitCallbacks(execute=True):
+            demand_index.update_section_demand_index(self.sections[0])
+        pipeline = mock_redis.pipeline.return_value
+        self.assertFalse(pipeline.zadd.called)
+        self.assertEqual(2, pipeline.zrem.call_count)
+
+    def test_update_deferred_until_commit(self, mock_redis):
+        self.enable_index()
+        with self.captureOnCommitCallbacks() as callbacks:
+            demand_index.update_section_demand_index(self.sections[0])
+        self.assertFalse(mock_redis.pipeline.called)
+        self.assertEqual(1, len(callbacks))
+
+    def test_update_error_marks_stale(self, mock_redis):
+        self.enable_index()
+        mock_redis.pipeline.return_value.execute.side_effect = RedisConnectionError
+        with self.captureOnCommitCallbacks(execute=True):
+            demand_index.update_section_demand_index(self.sections[0])
+        self.assertTrue(demand_index.demand_index_is_stale(TEST_SEMESTER))
+        mock_redis.pipeline.return_value.execute.side_effect = None
+        demand_index.rebuild_section_demand_index(TEST_SEMESTER)
+        self.assertFalse(demand_index.demand_index_is_stale(TEST_SEMESTER))
+
+    def test_rebuild(self, mock_redis):
+        self.assertEqual(3, demand_index.rebuild_section_demand_index(TEST_SEMESTER))
+        key = demand_index.demand_index_key(TEST_SEMESTER)
+        mock_redis.pipeline.return_value.zadd.assert_any_call(
+            key + ":rebuild",
+            {self.sections[0].id: 0.5, self.sections[1].id: 2.0, self.sections[2].id: 0.1},
+        )
+        mock_redis.pipeline.return_value.rename.assert_any_call(key + ":rebuild", key)
+
+    def test_check(self, mock_redis):
+        index = {
+            demand_index.demand_index_key(TEST_SEMESTER): [
+                (str(self.sections[0].id).encode(), 0.5),
+                (str(self.sections[1].id).encode(), 1.9),
+                (b"999999", 0.3),
+            ],
+            demand_index.demand_index_key(TEST_SEMESTER, closed=True): [
+                (str(self.sections[0].id).encode(), 0.5),
+                (str(self.sections[1].id).encode(), 2.0),
+            ],
+        }
+        mock_redis.zrange.side_effect = lambda key, *args, **kwargs: index[key]
+        discrepancies = demand_index.check_section_demand_index(TEST_SEMESTER)
+        self.assertEqual(
+            {
+                "missing": [self.sections[2].id],
+                "extra": [999999],
+                "mismatched": [self.sections[1].id],
+            },
+            discrepancies["all"],
+        )
+        self.assertEqual({"missing": [], "extra": [], "mismatched": []}, discrepancies["closed"])
+
+    def test_estimate_reads_index(self, mock_redis):
+        self.enable_index()
+        mock_redis.pipeline.return_value.execute.return_value = [
+            [(str(self.sections[2].id).encode(), 0.1)],
+            [(str(self.sections[1].id).encode(), 2.0)],
+        ]
+        mock_redis.zrange.return_value = [(b"1", 0.5), (b"2", 2.0)]
+        with patch("alert.tasks.get_locked_demand_stats") as mock_locked:
+            tasks.update_demand_distribution_estimate(TEST_SEMESTER, timezone.now())
+        self.assertFalse(mock_locked.called)
+        estimate = PcaDemandDistributionEstimate.objects.get()
+        self.assertEqual(self.sections[1], estimate.highest_demand_section)
+        self.assertEqual(20, estimate.highest_demand_section_volume)
+        self.assertEqual(self.sections[2], estimate.lowest_demand_section)
+        self.assertEqual(0, estimate.csrdv_frac_zero)
+
+    def test_estimate_rebuilds_stale_index(self, mock_redis):
+        self.enable_index()
+        demand_index.mark_section_demand_index_stale(TEST_SEMESTER)
+        mock_redis.pipeline.return_value.execute.side_effect = [
+            [],  # the rebuild
+            [
+                [(str(self.sections[2].id).encode(), 0.1)],
+                [(str(self.sections[1].id).encode(), 2.0)],
+            ],
+        ]
+        mock_redis.zrange.return_value = [(b"1", 0.5), (b"2", 2.0)]
+        with patch("alert.tasks.get_locked_demand_stats") as mock_locked:
+            tasks.update_demand_distribution_estimate(TEST_SEMESTER, timezone.now())
+        self.assertFalse(mock_locked.called)
+        mock_redis.pipeline.return_value.rename.assert_any_call(
+            demand_index.demand_index_key(TEST_SEMESTER) + ":rebuild",
+            demand_index.demand_index_key(TEST_SEMESTER),
+        )
+        self.assertFalse(demand_index.demand_index_is_stale(TEST_SEMESTER))
+
+    def test_estimate_falls_back_to_db(self, mock_redis):
+        self.enable_index()
+        mock_redis.pipeline.return_value.execute.return_value = [[], []]
+        tasks.update_demand_distribution_estimate(TEST_SEMESTER, timezone.now())
+        estimate = PcaDemandDistributionEstimate.objects.get()
+        self.assertEqual(self.sections[1], estimate.highest_demand_section)
+        self.assertEqual(self.sections[2], estimate.lowest_demand_section)
+
+
+@patch("alert.alerts.SMTP")
+class SMTPConnectionPoolTestCase(TestCase):
+    def setUp(self):
+        self.pool = SMTPConnectionPool(
+            "localhost", 1025, "user", "pass", size=2, max_messages_per_connection=3
+        )
+
+    def message(self, i=0):
+        msg = MIMEText(f"alert {i}", "html")
+        msg["To"] = f"{i}@example.com"
+        return msg
+
+    def test_connection_reused(self, mock_smtp):
+        for i in range(3):
+            self.assertTrue(self.pool.send_message(self.message(i)))
+        self.assertEqual(1, mock_smtp.call_count)
+        server = mock_smtp.return_value
+        self.assertEqual(1, server.login.call_count)
+        self.assertEqual(3, server.send_message.call_count)
+        stats = self.pool.stats()
+        self.assertEqual(1, len(stats))
+        self.assertEqual(3, stats[0]["messages_sent"])
+        self.assertEqual(0, stats[0]["reconnects"])
+
+    def test_reconnect_after_max_messages(self, mock_smtp):
+        for i in range(4):
+            self.pool.send_message(self.message(i))
+        self.assertEqual(2, mock_smtp.call_count)
+        stats = self.pool.stats()[0]
+        self.assertEqual(4, stats["messages_sent"])
+        self.assertEqual(1, stats["session_messages_sent"])
+        self.assertEqual(1, stats["reconnects"])
+
+    def test_reconnect_on_disconnect(self, mock_smtp):
+        self.pool.send_message(self.message(0))
+        mock_smtp.return_value.send_message.side_effect = [
+            SMTPServerDisconnected("Connection unexpectedly closed"),
+            None,
+        ]
+        self.assertTrue(self.pool.send_message(self.message(1)))
+        self.assertEqual(2, mock_smtp.call_count)
+        stats = self.pool.stats()[0]
+        self.assertEqual(2, stats["messages_sent"])
+        self.assertEqual(1, stats["failures"])
+        self.assertEqual(1, stats["reconnects"])
+
+    def test_recipients_refused_keeps_connection(self, mock_smtp):
+        mock_smtp.return_value.send_message.side_effect = SMTPRecipientsRefused(
+            {"bad@example.com": (550, b"No such user")}
+        )
+        with self.assertRaises(SMTPRecipientsRefused):
+            self.pool.send_message(self.message(0))
+        mock_smtp.return_value.send_message.side_effect = None
+        self.pool.send_message(self.message(1))
+        self.assertEqual(1, mock_smtp.call_count)
+        self.assertEqual(1, self.pool.stats()[0]["messages_sent"])
+
+    def test_pool_size(self, mock_smtp):
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertNotEqual(first.connection_id, second.connection_id)
+        self.pool.release(first)
+        self.assertIs(first, self.pool.acquire())
+        self.pool.release(first)
+        self.pool.release(second)
+        self.assertEqual(2, len(self.pool.stats()))
+
+
+class StubTwilioHttpClient(HttpClient):
+    """
+    A stand-in for Twilio's HTTP backend, returning the given status codes in order
+    (repeating the last one), and recording every request.
+    """
+
+    def __init__(self, statuses):
+        super().__init__(logger=logging.getLogger(__name__), is_async=False)
+        self.statuses = list(statuses)
+        self.requests = []
+
+    def request(self, method, uri, params=None, data=None, headers=None, auth=None, **kwargs):
+        self.requests.append(data)
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        if status == 201:
+            return TwilioResponse(201, json.dumps({"sid": f"SM{len(self.requests)}"}))
+        return TwilioResponse(status, json.dumps({"code": 20429, "message": "Too Many Requests"}))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SMSQueueTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def sms_queue(self, statuses, **kwargs):
+        http_client = StubTwilioHttpClient(statuses)
+        client = TwilioClient("ACxxx", "token", http_client=http_client)
+        sms_queue = SMSQueue(
+            client_factory=lambda: client,
+            from_="+12153984277",
+            clock=self.clock.time,
+            sleep=self.clock.sleep,
+            **kwargs,
+        )
+        return sms_queue, http_client
+
+    def test_token_bucket_paces(self):
+        bucket = TokenBucket(rate=2, capacity=1, clock=self.clock.time, sleep=self.clock.sleep)
+        for _ in range(5):
+            bucket.acquire()
+        self.assertAlmostEqual(2.0, self.clock.now)
+
+    def test_send(self):
+        sms_queue, http_client = self.sms_queue([201])
+        self.assertTrue(sms_queue.send("+15555555555", "CIS-1200-001 is open!"))
+        self.assertEqual(1, len(http_client.requests))
+        self.assertEqual("+15555555555", http_client.requests[0]["To"])
+        stats = sms_queue.stats()
+        self.assertEqual(1, stats["sent"])
+        self.assertEqual(0, stats["queue_depth"])
+        self.assertIsNotNone(stats["latency_p50"])
+
+    def test_throttled_retried_with_backoff(self):
+        sms_queue, http_client = self.sms_queue([429, 429, 201], backoff=1)
+        self.assertTrue(sms_queue.send("+15555555555", "CIS-1200-001 is open!"))
+        self.assertEqual(3, len(http_client.requests))
+        self.assertEqual(2, sms_queue.stats()["throttled"])
+        self.assertGreaterEqual(self.clock.now, 3)  # backoff of 1s then 2s
+
+    def test_throttled_gives_up(self):
+        sms_queue, http_client = self.sms_queue([429], max_retries=2)
+        self.assertIsNone(sms_queue.send("+15555555555", "CIS-1200-001 is open!"))
+        self.assertEqual(3, len(http_client.requests))
+        self.assertEqual(1, sms_queue.stats()["failed"])
+
+    def test_error_not_retried(self):
+        sms_queue, http_client = self.sms_queue([400])
+        self.assertIsNone(sms_queue.send("+15555555555", "CIS-1200-001 is open!"))
+        self.assertEqual(1, len(http_client.requests))
+
+    def test_client_reused(self):
+        sms_queue, http_client = self.sms_queue([201])
+        futures = [sms_queue.submit(f"+1555555555{i}", "open!") for i in range(5)]
+        self.assertEqual([True] * 5, [f.result() for f in futures])
+        self.assertEqual(5, sms_queue.stats()["sent"])
+
+
+class DispatchPushNotificationsTestCase(TestCase):
+    def setUp(self):
+        self.notifications = [
+            (f"pennkey{i}", "CIS-1200-001 is now open!", f"body {i}") for i in range(10)
+        ]
+
+    def test_dispatch(self):
+        with MockPushServer(latency=0.01) as server:
+            results = dispatch_push_notifications(self.notifications, concurrency=4, url=server.url)
+        self.assertEqual([True] * 10, results)
+        self.assertEqual(
+            {f"pennkey{i}" for i in range(10)}, {r["pennkey"] for r in server.received}
+        )
+
+    def test_dispatch_error_status(self):
+        with MockPushServer(latency=0, status=500) as server:
+            results = dispatch_push_notifications(self.notifications, url=server.url)
+        self.assertEqual([None] * 10, results)
+
+    def test_dispatch_empty(self):
+        self.assertEqual([], dispatch_push_notifications([]))
+
+    @patch("alert.models.Email.send_alert")
+    @patch("alert.models.PushNotification.send_alert")
+    @patch("alert.tasks.dispatch_push_notifications")
+    def test_batch_uses_dispatched_results(self, mock_dispatch, mock_push, mock_email):
+        set_semester()
+        _, section, _, _ = get_or_create_course_and_section("CIS-1600-001", TEST_SEMESTER)
+        regs = []
+        for i in range(3):
+            user = User.objects.create_user(username=f"user{i}", password="top_secret")
+            user.profile.push_notifications = True
+            user.profile.save()
+            reg = Registration(section=section, user=user)
+            reg.save()
+            regs.append(reg)
+        mock_dispatch.side_effect = lambda notifications: [True] * len(notifications)
+        mock_email.return_value = False
+        result = tasks.send_alert_batch([reg.id for reg in regs], close_notification=False)
+        self.assertEqual(sorted(reg.id for reg in regs), sorted(result["result"]))
+        self.assertEqual(1, mock_dispatch.call_count)
+        self.assertEqual(
+            {f"user{i}" for i in range(3)}, {n[0] for n in mock_dispatch.call_args[0][0]}
+        )
+        self.assertFalse(mock_push.called)
+        for reg in regs:
+            reg.refresh_from_db()
+            self.assertTrue(reg.notification_sent)
+
+
 @patch("alert.views.alert_for_course")
 class WebhookViewTestCase(TestCase):
     def setUp(self):
@@ -939,6 +1829,449 @@ class WebhookViewTestCase(TestCase):
         self.assertEqual(0, StatusUpdate.objects.count())
 
 
+class ReplayWebhooksTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        _, self.section, _, _ = get_or_create_course_and_section("CIS-1600-001", TEST_SEMESTER)
+        self.registrations = [
+            Registration(email=f"{i}@example.com", phone=f"+1555555555{i}", section=self.section)
+            for i in range(3)
+        ]
+        for reg in self.registrations:
+            reg.save()
+        start = timezone.now() - timedelta(hours=1)
+        for i, (old_status, new_status) in enumerate([("C", "O"), ("O", "C"), ("C", "O")]):
+            body = json.dumps(
+                {
+                    "section_id_normalized": "CIS 1600001",
+                    "previous_status": old_status,
+                    "status": new_status,
+                    "term": TEST_SEMESTER,
+                }
+            ).encode()
+            StatusUpdate(
+                section=self.section,
+                old_status=old_status,
+                new_status=new_status,
+                alert_sent=False,
+                request_body=str(body) if i else body.decode(),
+                created_at=start + timedelta(minutes=i),
+            ).save()
+        self.section.status = "O"
+        self.section.save()
+
+    def replay(self, **kwargs):
+        out = StringIO()
+        call_command(
+            "replaywebhooks",
+            semester=TEST_SEMESTER,
+            json=True,
+            email_latency=0,
+            text_latency=0,
+            text_rate=1000,
+            push_latency=0,
+            stdout=out,
+            **kwargs,
+        )
+        return json.loads(out.getvalue())
+
+    def test_replay(self):
+        report = self.replay()
+        self.assertEqual(3, report["webhooks"])
+        self.assertEqual(0, report["task_errors"])
+        # The first open alerts all 3 registrations, which aren't alerted again by the reopening
+        self.assertEqual(3, report["alerts_sent"])
+        self.assertEqual(3, report["emails"])
+        self.assertEqual(3, report["texts"])
+        self.assertGreater(report["queries_per_webhook"]["mean"], 0)
+
+    def test_replay_rolled_back(self):
+        self.replay()
+        self.assertEqual(3, StatusUpdate.objects.filter(section=self.section).count())
+        self.section.refresh_from_db()
+        self.assertEqual("O", self.section.status)
+        for reg in self.registrations:
+            reg.refresh_from_db()
+            self.assertFalse(reg.notification_sent)
+
+    @override_settings(WEBHOOK_STATUS_CACHE=True, ALERT_LATENCY_METRICS=True)
+    def test_replay_doesnt_write_redis(self):
+        for key in REDIS_OPTIONS:
+            Option.objects.update_or_create(
+                key=key, defaults={"value": "true", "value_type": Option.TYPE_BOOL}
+            )
+        redis_mocks = []
+        for client in REDIS_CLIENTS:
+            patcher = patch(client)
+            redis_mocks.append(patcher.start())
+            self.addCleanup(patcher.stop)
+        report = self.replay()
+        self.assertEqual(0, report["task_errors"])
+        self.assertEqual(3, report["alerts_sent"])
+        for redis_mock in redis_mocks:
+            self.assertEqual([], redis_mock.method_calls)
+        for key in REDIS_OPTIONS:
+            self.assertTrue(get_bool(key, False))
+
+    def test_replay_no_alerts(self):
+        report = self.replay(no_alerts=True, limit=2)
+        self.assertEqual(2, report["webhooks"])
+        self.assertEqual(0, report["alerts_sent"])
+        self.assertEqual(0, report["emails"])
+
+
+@patch("alert.management.commands.webhookbackup.should_send_pca_alert", return_value=True)
+@patch("alert.management.commands.webhookbackup.alert_for_course")
+@patch("courses.registrar.get_all_course_status")
+class WebhookBackupTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        _, self.section, _, _ = get_or_create_course_and_section("CIS-1600-001", TEST_SEMESTER)
+        _, self.other_section, _, _ = get_or_create_course_and_section(
+            "CIS-1200-001", TEST_SEMESTER
+        )
+        StatusUpdate(section=self.section, old_status="O", new_status="C", alert_sent=False).save()
+
+    def status(self, section_code, previous_status, status):
+        return {
+            "section_id_normalized": section_code,
+            "previous_status": previous_status,
+            "status": status,
+            "term": TEST_SEMESTER,
+        }
+
+    def test_duplicate_of_queued_update_skipped(self, mock_statuses, mock_alert, mock_should):
+        mock_statuses.return_value = [
+            self.status("CIS-1600-001", "C", "C"),  # duplicate of the DB's last status update
+            self.status("CIS-1600-001", "C", "O"),
+            self.status("CIS-1600-001", "C", "O"),  # duplicate of the update queued above
+        ]
+        call_command("webhookbackup", send_alerts=True, stdout=StringIO())
+        self.assertEqual(1, mock_alert.call_count)
+        self.assertEqual(
+            ["C", "O"],
+            list(
+                StatusUpdate.objects.filter(section=self.section)
+                .order_by("created_at")
+                .values_list("new_status", flat=True)
+            ),
+        )
+
+    def test_invalid_status_skipped(self, mock_statuses, mock_alert, mock_should):
+        mock_statuses.return_value = [
+            self.status("CIS-1600-001", "C", "O"),
+            self.status("CIS-1200-001", "C", "Z"),
+        ]
+        call_command("webhookbackup", send_alerts=True, stdout=StringIO())
+        self.assertEqual(1, mock_alert.call_count)
+        self.assertEqual(2, StatusUpdate.objects.count())
+        self.assertFalse(StatusUpdate.objects.filter(section=self.other_section).exists())
+
+
+@override_settings(WEBHOOK_STATUS_CACHE=True)
+@patch("alert.status_cache.r")
+@patch("alert.views.alert_for_course")
+class WebhookStatusCacheTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        self.client = Client()
+        auth = base64.standard_b64encode("webhook:password".encode("ascii"))
+        self.headers = {
+            "Authorization": f"Basic {auth.decode()}",
+        }
+        self.body = json.dumps(
+            {
+                "section_id_normalized": "ANTH-3610-401",
+                "previous_status": "C",
+                "status": "O",
+                "status_code_normalized": "Open",
+                "term": translate_semester(TEST_SEMESTER),
+            }
+        )
+        Option.objects.update_or_create(
+            key="SEND_FROM_WEBHOOK", value_type="BOOL", defaults={"value": "TRUE"}
+        )
+
+    def post(self):
+        return self.client.post(
+            reverse("webhook", urlconf="alert.urls"),
+            data=self.body,
+            content_type="application/json",
+            **self.headers,
+        )
+
+    def test_retry_ignored_without_db(self, mock_alert, mock_redis):
+        mock_redis.hgetall.return_value = {
+            b"status": b"O",
+            b"payload": status_cache.payload_hash(self.body.encode()).encode(),
+        }
+        with self.assertNumQueries(1):  # the WEBHOOK_INGEST_MODE Option
+            res = self.post()
+        self.assertEqual(200, res.status_code)
+        self.assertEqual("duplicate webhook ignored", json.loads(res.content)["message"])
+        mock_redis.hgetall.assert_called_once_with(
+            status_cache.status_cache_key(TEST_SEMESTER, "ANTH-3610-401")
+        )
+        self.assertFalse(mock_alert.called)
+        self.assertFalse(StatusUpdate.objects.exists())
+
+    def test_duplicate_status_rejected(self, mock_alert, mock_redis):
+        mock_redis.hgetall.return_value = {b"status": b"O", b"payload": b"otherhash"}
+        res = self.post()
+        self.assertEqual(200, res.status_code)
+        self.assertTrue("error" in json.loads(res.content)["message"])
+        self.assertFalse(mock_alert.called)
+        self.assertFalse(StatusUpdate.objects.exists())
+
+    def test_cache_miss_processed_and_cached(self, mock_alert, mock_redis):
+        mock_redis.hgetall.return_value = {}
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.post()
+        self.assertEqual(200, res.status_code)
+        self.assertTrue(mock_alert.called)
+        self.assertEqual(1, StatusUpdate.objects.count())
+        key = status_cache.status_cache_key(TEST_SEMESTER, "ANTH-3610-401")
+        mock_redis.pipeline.return_value.hset.assert_called_once_with(
+            key,
+            mapping={"status": "O", "payload": status_cache.payload_hash(self.body.encode())},
+        )
+        mock_redis.pipeline.return_value.expire.assert_called_once_with(
+            key, settings.WEBHOOK_STATUS_CACHE_TTL
+        )
+
+    def test_status_change_processed(self, mock_alert, mock_redis):
+        mock_redis.hgetall.return_value = {b"status": b"C", b"payload": b"otherhash"}
+        res = self.post()
+        self.assertEqual(200, res.status_code)
+        self.assertTrue(mock_alert.called)
+        self.assertEqual(1, StatusUpdate.objects.count())
+
+    def test_cache_unreachable(self, mock_alert, mock_redis):
+        mock_redis.hgetall.side_effect = RedisConnectionError
+        res = self.post()
+        self.assertEqual(200, res.status_code)
+        self.assertTrue(mock_alert.called)
+        self.assertEqual(1, StatusUpdate.objects.count())
+
+    def test_rebuild(self, mock_alert, mock_redis):
+        _, section, _, _ = get_or_create_course_and_section("ANTH-3610-401", TEST_SEMESTER)
+        record_update(section, TEST_SEMESTER, "C", "O", False, "first")
+        record_update(section, TEST_SEMESTER, "O", "C", False, "second")
+        self.assertEqual(1, status_cache.rebuild_status_cache(TEST_SEMESTER))
+        mock_redis.pipeline.return_value.hset.assert_called_with(
+            status_cache.status_cache_key(TEST_SEMESTER, "ANTH-3610-401"),
+            mapping={"status": "C", "payload": status_cache.payload_hash("second")},
+        )
+
+
+@patch("alert.views.alert_for_course")
+@patch("alert.webhook_stream.r")
+class WebhookIngestModeTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        self.client = Client()
+        auth = base64.standard_b64encode("webhook:password".encode("ascii"))
+        self.headers = {
+            "Authorization": f"Basic {auth.decode()}",
+        }
+        self.body = {
+            "section_id_normalized": "ANTH-3610-401",
+            "previous_status": "X",
+            "status": "O",
+            "status_code_normalized": "Open",
+            "term": translate_semester(TEST_SEMESTER),
+        }
+        Option.objects.update_or_create(
+            key="SEND_FROM_WEBHOOK", value_type="BOOL", defaults={"value": "TRUE"}
+        )
+        Option.objects.update_or_create(
+            key="WEBHOOK_INGEST_MODE", value_type="BOOL", defaults={"value": "TRUE"}
+        )
+
+    def entry(self, body, entry_id=b"1700000000000-0"):
+        return (
+            entry_id,
+            {
+                b"body": json.dumps(body).encode(),
+                b"received_at": timezone.now().isoformat().encode(),
+            },
+        )
+
+    def test_webhook_queued(self, mock_redis, mock_alert):
+        res = self.client.post(
+            reverse("webhook", urlconf="alert.urls"),
+            data=json.dumps(self.body),
+            content_type="application/json",
+            **self.headers,
+        )
+        self.assertEqual(200, res.status_code)
+        self.assertEqual("webhook queued", json.loads(res.content)["message"])
+        self.assertTrue(mock_redis.xadd.called)
+        self.assertEqual(json.dumps(self.body).encode(), mock_redis.xadd.call_args[0][1]["body"])
+        self.assertFalse(mock_alert.called)
+        self.assertEqual(0, StatusUpdate.objects.count())
+
+    def test_webhook_bad_json_not_queued(self, mock_redis, mock_alert):
+        res = self.client.post(
+            reverse("webhook", urlconf="alert.urls"),
+            data="blah",
+            content_type="application/json",
+            **self.headers,
+        )
+        self.assertEqual(400, res.status_code)
+        self.assertFalse(mock_redis.xadd.called)
+
+    def test_redis_down_processed_synchronously(self, mock_redis, mock_alert):
+        mock_redis.xadd.side_effect = RedisConnectionError()
+        res = self.client.post(
+            reverse("webhook", urlconf="alert.urls"),
+            data=json.dumps(self.body),
+            content_type="application/json",
+            **self.headers,
+        )
+        self.assertEqual(200, res.status_code)
+        self.assertTrue(mock_alert.called)
+        self.assertEqual(1, StatusUpdate.objects.count())
+
+    def test_process_entry(self, mock_redis, mock_alert):
+        mock_redis.exists.return_value = False
+        entry_id, fields = self.entry(self.body)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(webhook_stream.process_entry("webhook_stream:0", entry_id, fields))
+        self.assertTrue(mock_alert.called)
+        self.assertEqual(1, StatusUpdate.objects.count())
+        mock_redis.xack.assert_called_once_with(
+            "webhook_stream:0", webhook_stream.WEBHOOK_STREAM_GROUP, entry_id
+        )
+        self.assertEqual(
+            webhook_stream.webhook_idempotency_key("webhook_stream:0", entry_id),
+            mock_redis.set.call_args[0][0],
+        )
+
+    def test_alerts_sent_on_commit(self, mock_redis, mock_alert):
+        mock_redis.exists.return_value = False
+        entry_id, fields = self.entry(self.body)
+        with self.captureOnCommitCallbacks() as callbacks:
+            webhook_stream.process_entry("webhook_stream:0", entry_id, fields)
+        self.assertFalse(mock_alert.called)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(mock_alert.called)
+
+    def test_repeated_payloads_processed(self, mock_redis, mock_alert):
+        # Registrar payloads have no event id, so a section reopening sends the same body again
+        processed = set()
+        mock_redis.exists.side_effect = lambda key: key in processed
+        mock_redis.set.side_effect = lambda key, *args, **kwargs: processed.add(key)
+        closed = {**self.body, "previous_status": "O", "status": "C"}
+        reopened = {**self.body, "previous_status": "C", "status": "O"}
+        entries = [
+            self.entry(reopened, b"1700000000000-0"),
+            self.entry(closed, b"1700000000000-1"),
+            self.entry(reopened, b"1700000000000-2"),
+        ]
+        mock_redis.xautoclaim.return_value = [b"0-0", [], []]
+        mock_redis.xreadgroup.side_effect = [[], [["webhook_stream:0", entries]]]
+        with self.captureOnCommitCallbacks(execute=True):
+            webhook_stream.consume_webhook_stream(max_batches=1)
+        self.assertEqual(
+            [("C", "O"), ("O", "C"), ("C", "O")],
+            [(u.old_status, u.new_status) for u in StatusUpdate.objects.order_by("id")],
+        )
+        self.assertEqual(
+            ["O", "C", "O"], [c[1]["course_status"] for c in mock_alert.call_args_list]
+        )
+
+    def test_process_entry_duplicate_payload(self, mock_redis, mock_alert):
+        mock_redis.exists.return_value = True
+        entry_id, fields = self.entry(self.body)
+        self.assertFalse(webhook_stream.process_entry("webhook_stream:0", entry_id, fields))
+        self.assertFalse(mock_alert.called)
+        self.assertEqual(0, StatusUpdate.objects.count())
+        self.assertTrue(mock_redis.xack.called)
+
+    def test_consume_in_order_per_section(self, mock_redis, mock_alert):
+        mock_redis.exists.return_value = False
+        other_section = {**self.body, "section_id_normalized": "CIS-1200-001"}
+        closed = {**self.body, "previous_status": "O", "status": "C"}
+        entries = [
+            self.entry(self.body, b"1700000000000-0"),
+            self.entry(other_section, b"1700000000000-1"),
+            self.entry(closed, b"1700000000000-2"),
+        ]
+        mock_redis.xautoclaim.return_value = [b"0-0", [], []]
+        mock_redis.xreadgroup.side_effect = [[], [["webhook_stream:0", entries]]]
+        with self.captureOnCommitCallbacks(execute=True):
+            webhook_stream.consume_webhook_stream(max_batches=1)
+        updates = StatusUpdate.objects.filter(section__full_code="ANTH-3610-401").order_by("id")
+        self.assertEqual(["O", "C"], [u.new_status for u in updates])
+        self.assertEqual(3, StatusUpdate.objects.count())
+        self.assertEqual(3, mock_redis.xack.call_count)
+        self.assertEqual(
+            ["ANTH-3610-401", "CIS-1200-001"],
+            list(webhook_stream.group_by_section(entries).keys()),
+        )
+
+    def test_consume_failure_leaves_section_pending(self, mock_redis, mock_alert):
+        other_section = {**self.body, "section_id_normalized": "CIS-1200-001"}
+        closed = {**self.body, "previous_status": "O", "status": "C"}
+        entries = [
+            self.entry(self.body, b"1700000000000-0"),
+            self.entry(other_section, b"1700000000000-1"),
+            self.entry(closed, b"1700000000000-2"),
+            self.entry(self.body, b"1700000000000-3"),
+        ]
+        processed = []
+
+        def process_entry(stream, entry_id, fields):
+            if entry_id == b"1700000000000-0" and not processed:
+                raise DatabaseError()
+            processed.append(entry_id)
+            return True
+
+        mock_redis.xautoclaim.return_value = [b"0-0", [], []]
+        mock_redis.xreadgroup.side_effect = [
+            [],
+            [["webhook_stream:0", entries[:3]]],
+            [["webhook_stream:0", entries[3:]]],
+            # The next reclaim retries the pending entries in order
+            [["webhook_stream:0", [entries[0], entries[2], entries[3]]]],
+            [],
+            [],
+        ]
+        with patch("alert.webhook_stream.process_entry", side_effect=process_entry):
+            webhook_stream.consume_webhook_stream(max_batches=2, reclaim_interval=3600)
+            self.assertEqual([b"1700000000000-1"], processed)
+            webhook_stream.consume_webhook_stream(max_batches=2, reclaim_interval=3600)
+        self.assertEqual(
+            [
+                b"1700000000000-1",
+                b"1700000000000-0",
+                b"1700000000000-2",
+                b"1700000000000-3",
+            ],
+            processed,
+        )
+
+    def test_consume_claims_idle_entries_periodically(self, mock_redis, mock_alert):
+        mock_redis.xautoclaim.return_value = [b"0-0", [], []]
+        mock_redis.xreadgroup.return_value = []
+        webhook_stream.consume_webhook_stream(max_batches=3, reclaim_interval=0, claim_idle_ms=10)
+        self.assertEqual(3, mock_redis.xautoclaim.call_count)
+        mock_redis.xautoclaim.assert_called_with(
+            "webhook_stream:0",
+            webhook_stream.WEBHOOK_STREAM_GROUP,
+            "consumer",
+            10,
+            start_id="0-0",
+            count=100,
+        )
+        pending_reads = [
+            c for c in mock_redis.xreadgroup.call_args_list if c[0][2] == {"webhook_stream:0": "0"}
+        ]
+        self.assertEqual(3, len(pending_reads))
+
+
 class CourseStatusUpdateTestCase(TestCase):
     def setUp(self):
         set_semester()
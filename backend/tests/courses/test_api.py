@@ -1,15 +1,23 @@
+import gzip
 import json
 from unittest.mock import patch
 
+import numpy as np
+import redis
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db.models.signals import post_save
-from django.test import RequestFactory, TestCase
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from options.models import Option
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from alert.models import AddDropPeriod
+from courses.catalog_snapshot import catalog_snapshot_key
+from courses.code_index import bump_code_index_version, clear_code_indexes, lookup_code_prefixes
+from courses.management.commands.recompute_soft_state import recompute_precomputed_fields
 from courses.models import (
     Attribute,
     Course,
@@ -18,13 +26,23 @@ from courses.models import (
     NGSSRestriction,
     PreNGSSRequirement,
 )
-from courses.search import TypedCourseSearchBackend
+from courses.search import TypedCourseSearchBackend, update_course_search_vectors
+from courses.search_cache import (
+    bump_course_search_generation,
+    course_search_cache_key,
+    get_or_rebuild,
+)
 from courses.util import (
     get_or_create_course,
     get_or_create_course_and_section,
     invalidate_current_semester_cache,
+    record_update,
+    update_course_from_record,
 )
+from courses.views import CourseList
+from plan.management.commands.recommendcourses import CourseVectorMatrix
 from plan.models import Schedule
+from plan.recommender_model import ModelUnavailable
 from tests import production_CourseListSearch_get_serializer_context
 from tests.courses.util import create_mock_data, fill_course_soft_state
 from tests.plan.test_course_recs import CourseRecommendationsTestCase
@@ -97,6 +115,88 @@ class CourseListTestCase(TestCase):
         self.assertEqual(response.data[1]["num_sections"], 0, response.data)
 
 
+@override_settings(
+    COURSE_CATALOG_SNAPSHOT=True,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class CatalogSnapshotTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        cache.clear()
+        self.course, self.section = create_mock_data("CIS-120-001", TEST_SEMESTER)
+        create_mock_data("MATH-114-001", TEST_SEMESTER)
+        self.client = APIClient()
+        self.url = reverse("courses-list", kwargs={"semester": TEST_SEMESTER})
+
+    def test_matches_serialized_response(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual("application/json", response["Content-Type"])
+        with override_settings(COURSE_CATALOG_SNAPSHOT=False):
+            expected = self.client.get(self.url).json()
+        self.assertEqual(expected, response.json())
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    )
+    def test_cache_unavailable(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+        self.assertEqual({"CIS-120", "MATH-114"}, {course["id"] for course in response.json()})
+
+    @override_settings(STREAM_LIST_RESPONSES=True)
+    def test_with_streaming_enabled(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+        with override_settings(COURSE_CATALOG_SNAPSHOT=False):
+            streamed = self.client.get(self.url)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(json.loads(b"".join(streamed.streaming_content)), response.json())
+
+    def test_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual("gzip", response["Content-Encoding"])
+        self.assertEqual(self.client.get(self.url).content, gzip.decompress(response.content))
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(etag, response["ETag"])
+        self.assertEqual(b"", response.content)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuilt_after_generation_bump(self):
+        etag = self.client.get(self.url)["ETag"]
+        Course.objects.filter(id=self.course.id).update(title="New Title")
+        with self.assertNumQueries(0):
+            self.assertEqual(etag, self.client.get(self.url)["ETag"])
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_course_search_generation(TEST_SEMESTER)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(etag, response["ETag"])
+        self.assertIn("New Title", {course["title"] for course in response.json()})
+
+    def test_previous_snapshot_served_while_rebuilding(self):
+        etag = self.client.get(self.url)["ETag"]
+        Course.objects.filter(id=self.course.id).update(title="New Title")
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_course_search_generation(TEST_SEMESTER)
+        lock_key = f"{catalog_snapshot_key(TEST_SEMESTER)}:rebuilding"
+        self.assertTrue(cache.add(lock_key, True))
+        self.assertEqual(etag, self.client.get(self.url)["ETag"])
+        cache.delete(lock_key)
+        self.assertNotEqual(etag, self.client.get(self.url)["ETag"])
+
+
 class CourseDetailTestCase(TestCase):
     def setUp(self):
         set_semester()
@@ -288,6 +388,69 @@ class CourseSearchTestCase(TestCase):
             )
 
 
+class CourseFullTextSearchTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        Option(key="COURSE_FULL_TEXT_SEARCH", value="TRUE", value_type="BOOL").save()
+        self.cis, self.cis_section = create_mock_data("CIS-120-001", TEST_SEMESTER)
+        self.cis.title = "Programming Languages and Techniques"
+        self.cis.description = "Object oriented programming in Java."
+        self.cis.save()
+        self.cis_section.instructors.add(Instructor.objects.get_or_create(name="Tiffany Chang")[0])
+        self.math, _ = create_mock_data("MATH-114-001", TEST_SEMESTER)
+        self.math.title = "Calculus, Part II"
+        self.math.description = "Calculus with applications to programming."
+        self.math.save()
+        self.nets, _ = create_mock_data("NETS-150-001", TEST_SEMESTER)
+        self.nets.title = "Market and Social Systems on the Internet"
+        self.nets.save()
+        update_course_search_vectors(Course.objects.all())
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get(
+            reverse("courses-search", args=["current"]), {"search": query, "type": "auto"}
+        )
+        self.assertEqual(200, response.status_code)
+        return [d["id"] for d in response.data]
+
+    def test_search_ranked(self):
+        self.assertEqual(["CIS-120", "MATH-114"], self.search("programming"))
+
+    def test_search_stemmed(self):
+        self.assertEqual(["NETS-150"], self.search("social system"))
+
+    def test_search_by_instructor(self):
+        self.assertEqual(["CIS-120"], self.search("chang"))
+
+    def test_search_by_description(self):
+        self.assertEqual(["CIS-120"], self.search("object oriented"))
+
+    def test_search_by_crosslisted_code(self):
+        crosslisting, _ = create_mock_data("ESE-112-001", TEST_SEMESTER)
+        crosslisting.primary_listing = self.cis
+        crosslisting.save()
+        update_course_search_vectors(Course.objects.all())
+        self.assertIn("CIS-120", self.search("ese programming"))
+
+    def test_search_course_created_at_runtime(self):
+        # e.g. by a status update webhook for a section the registrar import hasn't seen
+        course, _, _, _ = get_or_create_course_and_section("ASTR-001-001", TEST_SEMESTER)
+        course.title = "Introduction to Astrophysics"
+        course.save()
+        self.assertEqual(["ASTR-001"], self.search("astrophysics"))
+
+    def test_search_no_match(self):
+        self.assertEqual([], self.search("astrophysics"))
+
+    def test_course_code_search_unchanged(self):
+        self.assertEqual(["MATH-114"], self.search("math"))
+
+    def test_search_option_disabled(self):
+        Option.objects.filter(key="COURSE_FULL_TEXT_SEARCH").delete()
+        self.assertEqual([], self.search("object oriented"))
+
+
 class CourseSearchRecommendationScoreTestCase(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -363,6 +526,24 @@ class CourseSearchRecommendationScoreTestCase(TestCase):
         for course in response.data:
             self.assertIsInstance(course["recommendation_score"], float)
 
+    @patch(
+        "courses.views.CourseListSearch.get_serializer_context",
+        new=production_CourseListSearch_get_serializer_context,
+    )
+    @patch("courses.views.retrieve_course_clusters")
+    def test_recommendation_is_null_when_model_unavailable(self, course_clusters_mock):
+        course_clusters_mock.side_effect = ModelUnavailable("No model.")
+        self.client.login(username=self.username, password=self.password)
+        response = self.client.get(
+            reverse("courses-search", args=["current"]),
+            {"search": "PSCI", "type": "auto"},
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.data)
+        for course in response.data:
+            self.assertIsNone(course["recommendation_score"])
+
 
 class SectionSearchTestCase(TestCase):
     def setUp(self):
@@ -434,6 +615,183 @@ class SectionSearchTestCase(TestCase):
         self.assertEqual(0, len(res.data))
 
 
+@override_settings(CODE_PREFIX_INDEX=True)
+@patch("courses.code_index.r")
+class CodePrefixIndexTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        clear_code_indexes()
+        self.addCleanup(clear_code_indexes)
+        create_mock_data("CIS-1200-001", TEST_SEMESTER)
+        create_mock_data("CIS-1200-201", TEST_SEMESTER)
+        create_mock_data("CIS-1600-001", TEST_SEMESTER)
+        create_mock_data("PSCI-1810-001", TEST_SEMESTER)
+        create_mock_data("CIS-1200-001", "2018C")
+        self.client = APIClient()
+
+    def search_courses(self, query):
+        res = self.client.get(
+            reverse("courses-search", args=["current"]), {"search": query, "type": "auto"}
+        )
+        self.assertEqual(res.status_code, 200)
+        return sorted(d["id"] for d in res.data)
+
+    def search_sections(self, query):
+        res = self.client.get(reverse("section-search", args=["current"]), {"search": query})
+        self.assertEqual(res.status_code, 200)
+        return sorted(d["section_id"] for d in res.data)
+
+    def test_course_search(self, mock_redis):
+        mock_redis.get.return_value = None
+        self.assertEqual(["CIS-1200", "CIS-1600"], self.search_courses("cis"))
+        self.assertEqual(["CIS-1200"], self.search_courses("CIS 120"))
+        self.assertEqual(["PSCI-1810"], self.search_courses("psci1810"))
+        self.assertEqual([], self.search_courses("MATH"))
+
+    def test_section_search(self, mock_redis):
+        mock_redis.get.return_value = None
+        self.assertEqual(["CIS-1200-001", "CIS-1200-201"], self.search_sections("cis1200"))
+        self.assertEqual(["CIS-1200-201"], self.search_sections("CIS 1200 2"))
+        self.assertEqual([], self.search_sections("123bdfsh3wq!@#"))
+
+    def test_lookup(self, mock_redis):
+        mock_redis.get.return_value = None
+        course_ids = lookup_code_prefixes(Course, TEST_SEMESTER, ["CIS-12", "PSCI"])
+        self.assertEqual(
+            set(
+                Course.objects.filter(
+                    semester=TEST_SEMESTER, full_code__in=["CIS-1200", "PSCI-1810"]
+                ).values_list("id", flat=True)
+            ),
+            set(course_ids),
+        )
+
+    def test_index_reused(self, mock_redis):
+        mock_redis.get.return_value = None
+        lookup_code_prefixes(Course, TEST_SEMESTER, ["CIS"])
+        with self.assertNumQueries(0):
+            self.assertEqual(2, len(lookup_code_prefixes(Course, TEST_SEMESTER, ["CIS"])))
+
+    def test_version_bump_reloads_index(self, mock_redis):
+        mock_redis.get.return_value = None
+        self.assertEqual(["CIS-1200", "CIS-1600"], self.search_courses("cis"))
+        create_mock_data("CIS-1210-001", TEST_SEMESTER)
+        with patch("courses.code_index.CODE_INDEX_VERSION_CHECK_SECONDS", 0):
+            self.assertEqual(["CIS-1200", "CIS-1600"], self.search_courses("cis"))
+            bump_code_index_version(TEST_SEMESTER)
+            mock_redis.incr.assert_called_once_with(f"code_index_version:{TEST_SEMESTER}")
+            mock_redis.get.return_value = b"1"
+            self.assertEqual(["CIS-1200", "CIS-1210", "CIS-1600"], self.search_courses("cis"))
+
+    def test_redis_error_falls_back_to_db(self, mock_redis):
+        mock_redis.get.side_effect = redis.exceptions.ConnectionError()
+        self.assertIsNone(lookup_code_prefixes(Course, TEST_SEMESTER, ["CIS"]))
+        self.assertEqual(["CIS-1200", "CIS-1600"], self.search_courses("cis"))
+
+    @override_settings(CODE_PREFIX_INDEX=False)
+    def test_disabled(self, mock_redis):
+        self.assertIsNone(lookup_code_prefixes(Course, TEST_SEMESTER, ["CIS"]))
+        self.assertEqual(["CIS-1200", "CIS-1600"], self.search_courses("cis"))
+        mock_redis.get.assert_not_called()
+
+
+def mock_recommendation_context(view):
+    context = CourseList.get_serializer_context(view)
+    if view.request.user.is_authenticated and view.personalize:
+        context["recommendation_scores"] = CourseVectorMatrix(
+            {"CIS-1200": np.array([1.0, 1.0])}
+        ).scores(np.array([1.0, 0.0]))
+    return context
+
+
+@override_settings(
+    COURSE_SEARCH_CACHE=True,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class CourseSearchCacheTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        cache.clear()
+        self.cis_1200, self.cis_1200_001 = create_mock_data("CIS-1200-001", TEST_SEMESTER)
+        create_mock_data("CIS-1600-001", TEST_SEMESTER)
+        recompute_precomputed_fields()
+        self.client = APIClient()
+
+    def search(self, params):
+        res = self.client.get(reverse("courses-search", args=["current"]), params)
+        self.assertEqual(res.status_code, 200)
+        return res.data
+
+    def search_titles(self):
+        return {d["id"]: d["title"] for d in self.search({"search": "cis", "type": "auto"})}
+
+    def test_cached_until_generation_bumped(self):
+        Course.objects.filter(id=self.cis_1200.id).update(title="Title")
+        self.assertEqual("Title", self.search_titles()["CIS-1200"])
+        Course.objects.filter(id=self.cis_1200.id).update(title="New Title")
+        self.assertEqual("Title", self.search_titles()["CIS-1200"])
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_course_search_generation(TEST_SEMESTER)
+        self.assertEqual("New Title", self.search_titles()["CIS-1200"])
+        Course.objects.filter(id=self.cis_1200.id).update(title="Newer Title")
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_course_search_generation()
+        self.assertEqual("Newer Title", self.search_titles()["CIS-1200"])
+
+    def test_status_change_invalidates(self):
+        self.assertEqual(
+            {"CIS-1200", "CIS-1600"}, {d["id"] for d in self.search({"is_open": "true"})}
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            update = record_update(self.cis_1200_001, TEST_SEMESTER, "O", "C", False, "{}")
+            update_course_from_record(update)
+        self.assertEqual({"CIS-1600"}, {d["id"] for d in self.search({"is_open": "true"})})
+
+    def test_previous_response_served_while_rebuilding(self):
+        Course.objects.filter(id=self.cis_1200.id).update(title="Title")
+        self.assertEqual("Title", self.search_titles()["CIS-1200"])
+        Course.objects.filter(id=self.cis_1200.id).update(title="New Title")
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_course_search_generation(TEST_SEMESTER)
+        cache_key = course_search_cache_key(TEST_SEMESTER, QueryDict("search=cis&type=auto"), False)
+        self.assertTrue(cache.add(f"{cache_key}:rebuilding", True))
+        self.assertEqual("Title", self.search_titles()["CIS-1200"])
+        cache.delete(f"{cache_key}:rebuilding")
+        self.assertEqual("New Title", self.search_titles()["CIS-1200"])
+
+    def test_get_or_rebuild_without_previous_value(self):
+        self.assertTrue(cache.add("key:rebuilding", True))
+        self.assertEqual(1, get_or_rebuild("key", "stale_key", lambda: 1, timeout=60))
+        self.assertIsNone(cache.get("key"))
+        cache.delete("key:rebuilding")
+        self.assertEqual(2, get_or_rebuild("key", "stale_key", lambda: 2, timeout=60))
+        self.assertEqual(2, cache.get("key"))
+        self.assertEqual(2, cache.get("stale_key"))
+
+    def test_schedule_fit_not_cached(self):
+        self.assertIsNotNone(course_search_cache_key(TEST_SEMESTER, QueryDict("search=cis")))
+        self.assertIsNone(course_search_cache_key(TEST_SEMESTER, QueryDict("schedule-fit=1")))
+        self.assertIsNone(course_search_cache_key("all", QueryDict("search=cis")))
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    )
+    def test_cache_unavailable(self):
+        self.assertIsNone(course_search_cache_key(TEST_SEMESTER, QueryDict("search=cis")))
+        self.assertEqual({"CIS-1200", "CIS-1600"}, set(self.search_titles()))
+
+    @patch("courses.views.CourseListSearch.get_serializer_context", new=mock_recommendation_context)
+    def test_recommendation_scores_overlaid(self):
+        User.objects.create_user(username="jacob", password="top_secret")
+        self.client.login(username="jacob", password="top_secret")
+        scores = {d["id"]: d["recommendation_score"] for d in self.search({"search": "cis"})}
+        self.assertAlmostEqual(2**-0.5, scores["CIS-1200"])
+        self.assertIsNone(scores["CIS-1600"])
+        self.client.logout()
+        for course in self.search({"search": "cis"}):
+            self.assertIsNone(course["recommendation_score"])
+
+
 class PreNGSSRequirementListTestCase(TestCase):
     def setUp(self):
         set_semester()
@@ -776,6 +1134,74 @@ class SectionListTestCase(TestCase):
         self.assertEqual("CIS-120-001", response.data[0]["section_id"])
 
 
+class ListPaginationTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        self.codes = ["CIS-1200", "CIS-1210", "CIS-1600", "MATH-1140", "PSCI-1810"]
+        for code in self.codes:
+            create_mock_data(f"{code}-001", TEST_SEMESTER)
+        create_mock_data("CIS-1200-001", "2018C")
+        self.client = APIClient()
+
+    def get_all_pages(self, url, params):
+        codes = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            codes += [d["id"] for d in response.data["results"]]
+            if response.data["next"] is None:
+                return codes
+            response = self.client.get(response.data["next"])
+
+    def test_cursor_pagination(self):
+        url = reverse("courses-list", args=[TEST_SEMESTER])
+        self.assertEqual(self.codes, self.get_all_pages(url, {"cursor": "", "page_size": 2}))
+        self.assertEqual(self.codes, self.get_all_pages(url, {"cursor": "", "page_size": 5}))
+
+    def test_cursor_pagination_all_semesters(self):
+        create_mock_data("CIS-1000-001", "2018C")
+        url = reverse("courses-list", args=["all"])
+        self.assertEqual(
+            ["CIS-1000", *self.codes], self.get_all_pages(url, {"cursor": "", "page_size": 2})
+        )
+
+    def test_cursor_pagination_search(self):
+        url = reverse("courses-search", args=[TEST_SEMESTER])
+        self.assertEqual(
+            ["CIS-1200", "CIS-1210", "CIS-1600"],
+            self.get_all_pages(url, {"search": "cis", "cursor": "", "page_size": 2}),
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            reverse("courses-list", args=[TEST_SEMESTER]), {"cursor": "not a cursor"}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_pagination(self):
+        response = self.client.get(
+            reverse("courses-list", args=[TEST_SEMESTER]), {"page": 2, "page_size": 2}
+        )
+        self.assertEqual(5, response.data["count"])
+        self.assertEqual(["CIS-1600", "MATH-1140"], [d["id"] for d in response.data["results"]])
+
+    @override_settings(STREAM_LIST_RESPONSES=True)
+    @patch("courses.views.CourseList.stream_chunk_size", 2)
+    def test_streaming(self):
+        for name in ["courses-list", "section-search"]:
+            url = reverse(name, args=[TEST_SEMESTER])
+            response = self.client.get(url)
+            self.assertTrue(response.streaming)
+            content = json.loads(b"".join(response.streaming_content))
+            with override_settings(STREAM_LIST_RESPONSES=False):
+                expected = self.client.get(url).json()
+            self.assertEqual(expected, content)
+        response = self.client.get(
+            reverse("courses-list", args=[TEST_SEMESTER]), {"cursor": "", "page_size": 2}
+        )
+        self.assertFalse(response.streaming)
+
+
 class UserTestCase(TestCase):
     def setUp(self):
         set_semester()
@@ -1,4 +1,5 @@
 import json
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
@@ -10,12 +11,21 @@ from rest_framework.test import APIClient
 
 from alert.models import AddDropPeriod
 from courses.management.commands.recompute_soft_state import recompute_precomputed_fields
-from courses.models import Course, Department, PreNGSSRequirement, Section, Topic, UserProfile
+from courses.models import (
+    Course,
+    Department,
+    PreNGSSRequirement,
+    Section,
+    StatusUpdate,
+    Topic,
+    UserProfile,
+)
 from courses.util import (
     get_or_create_course,
     get_or_create_course_and_section,
     invalidate_current_semester_cache,
     record_update,
+    record_updates_bulk,
     separate_course_code,
     set_crosslistings,
     update_course_from_record,
@@ -226,6 +236,61 @@ class CourseStatusUpdateTestCase(TestCase):
         self.assertEqual("O", section.status)
 
 
+class RecordUpdatesBulkTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        self.add_drop = AddDropPeriod.objects.get(semester=TEST_SEMESTER)
+        _, self.section = create_mock_data("CIS-120-001", TEST_SEMESTER)
+        _, self.other_section = create_mock_data("CIS-121-001", TEST_SEMESTER)
+        self.start = self.add_drop.estimated_start
+
+    def test_bulk_matches_per_row_fields(self):
+        created_at = self.start + (self.add_drop.estimated_end - self.start) / 4
+        with patch("alert.tasks.schedule_demand_distribution_update") as mock_schedule:
+            (bulk,) = record_updates_bulk(
+                [(self.section, "C", "O", created_at, "JSON", True)], TEST_SEMESTER
+            )
+        single = record_update(self.other_section, TEST_SEMESTER, "C", "O", True, "JSON")
+        single.created_at = created_at
+        single.save()
+        bulk = StatusUpdate.objects.get(id=bulk.id)
+        self.assertTrue(bulk.alert_sent)
+        self.assertEqual(single.in_add_drop_period, bulk.in_add_drop_period)
+        self.assertAlmostEqual(
+            single.percent_through_add_drop_period, bulk.percent_through_add_drop_period
+        )
+        section = Section.objects.get(id=self.section.id)
+        self.assertEqual("O", section.status)
+        self.assertTrue(section.has_status_updates)
+        mock_schedule.assert_called_once_with(TEST_SEMESTER, created_at)
+
+    def test_bulk_percent_open(self):
+        length = self.add_drop.estimated_end - self.start
+        with patch("alert.tasks.schedule_demand_distribution_update") as mock_schedule:
+            updates = record_updates_bulk(
+                [
+                    (self.section, "O", "C", self.start + length / 2, "JSON"),
+                    (self.section, "C", "O", self.start + length / 4, "JSON"),
+                    (self.other_section, "C", "O", self.start + length / 4, "JSON"),
+                ],
+                TEST_SEMESTER,
+            )
+        # Updates are applied in order of created_at, and the demand update is scheduled once
+        self.assertEqual(3, StatusUpdate.objects.count())
+        self.assertEqual(self.start + length / 2, updates[-1].created_at)
+        mock_schedule.assert_called_once_with(TEST_SEMESTER, self.start + length / 2)
+        section = Section.objects.get(id=self.section.id)
+        self.assertEqual("C", section.status)
+        # Closed for the first quarter of add/drop, then open for the second
+        self.assertAlmostEqual(0.5, float(section.percent_open))
+        self.assertEqual("O", Section.objects.get(id=self.other_section.id).status)
+
+    def test_bulk_invalid_status(self):
+        with self.assertRaises(ValidationError):
+            record_updates_bulk([(self.section, "C", "Z", None, "JSON")], TEST_SEMESTER)
+        self.assertFalse(StatusUpdate.objects.exists())
+
+
 class SectionHasStatusUpdateTestCase(TestCase):
     def setUp(self):
         set_semester()
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.db.models.signals import post_save
 from django.test.testcases import TestCase
 from options.models import Option
@@ -6,13 +8,25 @@ from alert.models import AddDropPeriod
 from courses.management.commands.recompute_soft_state import (
     deduplicate_status_updates,
     recompute_course_credits,
+    recompute_meeting_bitmaps,
     recompute_precomputed_fields,
 )
-from courses.models import Building, Course, Meeting, Room, Section, StatusUpdate
+from courses.models import (
+    MEETING_BITMAP_LENGTH,
+    MEETING_BITMAP_SLOTS_PER_DAY,
+    Building,
+    Course,
+    Meeting,
+    Room,
+    Section,
+    StatusUpdate,
+)
 from courses.util import (
     all_semesters,
+    get_meeting_bitmap,
     get_or_create_course_and_section,
     invalidate_current_semester_cache,
+    set_meetings,
 )
 from tests.courses.util import create_mock_data
 
@@ -173,6 +187,79 @@ class RecomputePrecomputedFieldsTestCase(TestCase):
         self.assertEquals(Course.objects.get(id=self.cis_120_old.id).credits, 3)
         self.assertEquals(Section.objects.get(id=self.cis_120_001_old.id).num_meetings, 3)
 
+    def test_open_activities(self):
+        self.cis_160_201.status = "C"
+        self.cis_160_201.save()
+        recompute_precomputed_fields()
+        cis_160 = Course.objects.get(id=self.cis_160.id)
+        self.assertEqual(cis_160.num_open_activities, 1)
+        self.assertFalse(cis_160.all_activities_open)
+        cis_120 = Course.objects.get(id=self.cis_120.id)
+        self.assertEqual(cis_120.num_open_activities, 1)
+        self.assertTrue(cis_120.all_activities_open)
+
+
+class RecomputeMeetingBitmapsTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        self.course, self.section = create_mock_data("CIS-120-001", TEST_SEMESTER)
+        _, self.async_section = create_mock_data("CIS-120-002", TEST_SEMESTER)
+        set_meetings(self.async_section, [])
+        building, _ = Building.objects.get_or_create(code=1)
+        self.room, _ = Room.objects.get_or_create(building=building, number=1)
+
+    def get_bitmap(self, section):
+        return Section.objects.get(id=section.id).meeting_bitmap
+
+    def test_matches_python(self):
+        for day, start, end in [
+            ("R", Decimal("8.30"), Decimal("9.50")),
+            ("S", Decimal("13.02"), Decimal("14.58")),
+            ("U", Decimal("23.55"), Decimal("23.59")),
+            ("T", Decimal("10.00"), Decimal("10.00")),
+        ]:
+            Meeting(section=self.section, day=day, start=start, end=end, room=self.room).save()
+        recompute_meeting_bitmaps()
+        self.assertEqual(
+            get_meeting_bitmap(
+                self.section.meetings.values_list("day", "start", "end"),
+            ),
+            self.get_bitmap(self.section),
+        )
+        self.assertEqual("0" * MEETING_BITMAP_LENGTH, self.get_bitmap(self.async_section))
+
+    def test_slots(self):
+        recompute_meeting_bitmaps()
+        bitmap = self.get_bitmap(self.section)
+        # MWF 11:00 AM - 12:00 PM
+        occupied = {
+            day_index * MEETING_BITMAP_SLOTS_PER_DAY + slot
+            for day_index in [0, 2, 4]
+            for slot in range(11 * 12, 12 * 12)
+        }
+        self.assertEqual(occupied, {i for i, bit in enumerate(bitmap) if bit == "1"})
+
+    def test_set_meetings(self):
+        set_meetings(
+            self.section,
+            [
+                {
+                    "building_code": "LLAB",
+                    "room_code": "10",
+                    "days": "TR",
+                    "begin_time_24": 1330,
+                    "begin_time": "1:30 PM",
+                    "end_time_24": 1500,
+                    "end_time": "3:00 PM",
+                }
+            ],
+        )
+        self.section.save()
+        bitmap = self.get_bitmap(self.section)
+        recompute_meeting_bitmaps()
+        self.assertEqual(bitmap, self.get_bitmap(self.section))
+        self.assertEqual(2 * 18, bitmap.count("1"))
+
 
 class RecomputeCourseCreditsTestCase(TestCase):
     """
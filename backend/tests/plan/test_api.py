@@ -1,6 +1,8 @@
+import json
+
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from options.models import Option
 from rest_framework.test import APIClient
@@ -8,14 +10,23 @@ from rest_framework.test import APIClient
 from alert.models import AddDropPeriod
 from courses.management.commands.recompute_soft_state import recompute_precomputed_fields
 from courses.models import Instructor, PreNGSSRequirement, Section
-from courses.util import invalidate_current_semester_cache, set_meetings
-from plan.models import Schedule
+from courses.util import (
+    invalidate_current_semester_cache,
+    record_update,
+    record_updates_bulk,
+    set_meetings,
+    update_course_from_record,
+)
+from PennCourses.settings.base import CACHE_PREFIX
+from plan.models import Break, Schedule
+from plan.util import schedule_occupancy_cache_key
 from review.models import Review
 from tests.courses.util import create_mock_async_class, create_mock_data
 
 
 TEST_SEMESTER = "2021C"
 assert TEST_SEMESTER >= "2021C", "Some tests assume TEST_SEMESTER >= 2021C"
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
 
 
 def set_semester():
@@ -213,6 +224,31 @@ class IsOpenFilterTestCase(TestCase):
             self.assertEqual(len(response.data), 0)
             self.assertEqual({res["id"] for res in response.data}, set())
 
+    def search_open(self):
+        response = self.client.get(reverse("courses-search", args=[TEST_SEMESTER]), {"is_open": ""})
+        self.assertEqual(response.status_code, 200)
+        return {res["id"] for res in response.data}
+
+    def test_status_update_from_webhook(self):
+        update = record_update(self.cis_160_001, TEST_SEMESTER, "O", "C", False, "{}")
+        update_course_from_record(update)
+        self.assertEqual(set(), self.search_open())
+        update = record_update(self.cis_160_001, TEST_SEMESTER, "C", "O", False, "{}")
+        update_course_from_record(update)
+        self.assertEqual(self.all_codes, self.search_open())
+
+    def test_status_updates_bulk(self):
+        record_updates_bulk(
+            [
+                (self.cis_160_201, "O", "C", None, "{}"),
+                (self.cis_160_202, "O", "C", None, "{}"),
+            ],
+            TEST_SEMESTER,
+        )
+        self.assertEqual(set(), self.search_open())
+        record_updates_bulk([(self.cis_160_202, "C", "O", None, "{}")], TEST_SEMESTER)
+        self.assertEqual(self.all_codes, self.search_open())
+
 
 class CourseReviewAverageTestCase(TestCase):
     def setUp(self):
@@ -942,3 +978,97 @@ class ScheduleFilterTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 1)
         self.assertEqual({res["id"] for res in response.data}, {"CIS-262"})
+
+    def add_break(self, schedule, checked=True):
+        new_break = Break.objects.create(person=self.user, name="Lunch", checked=checked)
+        set_meetings(
+            new_break,
+            [
+                {
+                    "building_code": None,
+                    "room_code": None,
+                    "days": "TR",
+                    "begin_time_24": 1200,
+                    "begin_time": "12:00 PM",
+                    "end_time_24": 1400,
+                    "end_time": "2:00 PM",
+                }
+            ],
+        )
+        schedule.breaks.add(new_break)
+        return new_break
+
+    def search_schedule_fit(self, schedule):
+        response = self.client.get(
+            reverse("courses-search", args=[TEST_SEMESTER]), {"schedule-fit": str(schedule.id)}
+        )
+        self.assertEqual(response.status_code, 200)
+        return {res["id"] for res in response.data}
+
+    def test_break_schedule(self):
+        self.client.login(username="jacob", password="top_secret")
+        self.add_break(self.empty_schedule)
+        self.assertEqual(
+            self.all_codes - {"CIS-121"}, self.search_schedule_fit(self.empty_schedule)
+        )
+
+    def test_unchecked_break_schedule(self):
+        self.client.login(username="jacob", password="top_secret")
+        self.add_break(self.empty_schedule, checked=False)
+        self.assertEqual(self.all_codes, self.search_schedule_fit(self.empty_schedule))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_cached_occupancy_invalidated_on_schedule_update(self):
+        self.client.login(username="jacob", password="top_secret")
+        self.assertEqual(self.all_codes, self.search_schedule_fit(self.empty_schedule))
+        self.empty_schedule.sections.set([self.cis_120_001, self.cis_121_001])
+        self.assertEqual(self.all_codes, self.search_schedule_fit(self.empty_schedule))  # cached
+        response = self.client.put(
+            f"/api/plan/schedules/{self.empty_schedule.id}/",
+            json.dumps(
+                {
+                    "name": "Empty Schedule",
+                    "sections": [
+                        {"id": "CIS-120-001", "semester": TEST_SEMESTER},
+                        {"id": "CIS-121-001", "semester": TEST_SEMESTER},
+                    ],
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({"CIS-120", "CIS-262"}, self.search_schedule_fit(self.empty_schedule))
+
+    def test_cached_occupancy_deleted_by_clearcache(self):
+        # clearcache (run after each registrar import) only deletes keys with CACHE_PREFIX
+        key = schedule_occupancy_cache_key(self.empty_schedule.id, self.user.id)
+        self.assertTrue(key.startswith(CACHE_PREFIX))
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_cached_occupancy_invalidated_on_break_update(self):
+        self.client.login(username="jacob", password="top_secret")
+        lunch = self.add_break(self.empty_schedule, checked=False)
+        self.assertEqual(self.all_codes, self.search_schedule_fit(self.empty_schedule))
+        response = self.client.put(
+            f"/api/plan/breaks/{lunch.id}/",
+            json.dumps(
+                {
+                    "name": "Lunch",
+                    "checked": True,
+                    "meetings": [
+                        {
+                            "days": "TR",
+                            "begin_time_24": 1200,
+                            "begin_time": "12:00 PM",
+                            "end_time_24": 1400,
+                            "end_time": "2:00 PM",
+                        }
+                    ],
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.all_codes - {"CIS-121"}, self.search_schedule_fit(self.empty_schedule)
+        )
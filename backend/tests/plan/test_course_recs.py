@@ -1,30 +1,55 @@
 import csv
+import io
 import json
 import os
+import pickle
+import tempfile
 from unittest.mock import patch
 
 import numpy as np
+from botocore.exceptions import ClientError
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
 from django.core.management import call_command
+from django.db import connection
 from django.db.models.signals import post_save
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from options.models import Option
 from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
 from alert.models import AddDropPeriod
+from courses.code_index import clear_code_indexes
 from courses.models import Course, Department, Section
-from courses.util import invalidate_current_semester_cache
-from plan.management.commands.recommendcourses import retrieve_course_clusters
+from courses.util import get_or_create_course, invalidate_current_semester_cache
+from plan.management.commands.recommendcourses import (
+    CourseVectorMatrix,
+    cosine_similarity,
+    get_course_vector_matrix,
+    load_latest_course_clusters,
+    recommend_courses,
+    retrieve_course_clusters,
+)
 from plan.management.commands.trainrecommender import (
     generate_course_vectors_dict,
     group_courses,
     train_recommender,
+    vectorize_by_copresence,
 )
 from plan.models import Schedule
+from plan.recommender_model import (
+    LEGACY_MODEL_KEY,
+    MODEL_LATEST_KEY,
+    MODEL_VERSION_KEY,
+    CourseVectors,
+    ModelUnavailable,
+    load_model,
+    save_model,
+)
 
 
 TEST_SEMESTER = "2021C"
@@ -258,6 +283,11 @@ class CourseRecommendationsTestCase(TestCase):
         mock.return_value = self.course_clusters_with_schedules
         self.subtest_with_user()
 
+    def test_model_unavailable(self, mock):
+        mock.side_effect = ModelUnavailable("No model.")
+        response = self.client.post(reverse("recommend-courses"))
+        self.assertEqual(response.status_code, 503, response.content)
+
     def subtest_with_edge_case_users(self):
         freshman = User.objects.get(username="freshman")
         freshman_client = APIClient()
@@ -675,3 +705,242 @@ class CourseRecommendationsTestCase(TestCase):
         self.assertEqual(response.status_code, 200, response.content)
         self.check_response_data(response.data)
         self.assertEqual(len(response.data), 5)
+
+
+class CourseVectorMatrixTestCase(TestCase):
+    def setUp(self):
+        self.course_vectors_dict = {
+            "CIS-1200": np.array([1.0, 2.0, 0.0]),
+            "CIS-1600": np.array([-3.0, 0.5, 4.0]),
+            "CIS-0000": np.zeros(3),
+        }
+        self.matrix = CourseVectorMatrix(self.course_vectors_dict)
+
+    def test_scores_match_cosine_similarity(self):
+        user_vector = np.array([0.5, 1.0, -2.0])
+        scores = self.matrix.scores(user_vector)
+        self.assertEqual(set(self.course_vectors_dict), set(scores))
+        for code, vector in self.course_vectors_dict.items():
+            self.assertAlmostEqual(cosine_similarity(vector, user_vector), scores[code])
+            self.assertIsInstance(scores[code], float)
+
+    def test_zero_user_vector(self):
+        self.assertEqual(
+            {code: 0 for code in self.course_vectors_dict}, self.matrix.scores(np.zeros(3))
+        )
+
+    def test_matrix_reused_for_same_model(self):
+        matrix = get_course_vector_matrix(self.course_vectors_dict)
+        self.assertIs(matrix, get_course_vector_matrix(self.course_vectors_dict))
+        self.assertIsNot(matrix, get_course_vector_matrix(dict(self.course_vectors_dict)))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class RecommenderModelTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.model = (
+            [np.array([0.5, 0.5]), np.array([0.0, 1.0])],
+            [["CIS-1200", "CIS-1600"], ["CIS-1210"]],
+            {
+                "CIS-1200": np.array([1.0, 0.0]),
+                "CIS-1210": np.array([0.0, 1.0]),
+                "CIS-1600": np.array([0.6, 0.8]),
+            },
+            {
+                "CIS-1200": np.array([0.0, 1.0]),
+                "CIS-1210": np.array([1.0, 0.0]),
+                "CIS-1600": np.array([0.8, 0.6]),
+            },
+        )
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.model_dir = tmp_dir.name
+        patcher = patch("plan.recommender_model.LOCAL_MODEL_DIR", self.model_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertModelEqual(self, model, loaded):
+        centroids, clusters, curr_course_vectors_dict, past_course_vectors_dict = loaded
+        np.testing.assert_array_equal(np.array(model[0]), centroids)
+        self.assertEqual(model[1], clusters)
+        for expected, vectors in [
+            (model[2], curr_course_vectors_dict),
+            (model[3], past_course_vectors_dict),
+        ]:
+            self.assertIsInstance(vectors, CourseVectors)
+            self.assertEqual(set(expected), set(vectors))
+            for code, vector in expected.items():
+                np.testing.assert_array_equal(vector, vectors[code])
+
+    def test_save_and_load(self):
+        path = os.path.join(self.model_dir, "v1")
+        save_model(self.model, path)
+        self.assertModelEqual(self.model, load_model(path))
+
+    def test_load_latest_reloads_new_version(self):
+        save_model(self.model, os.path.join(self.model_dir, "v1"))
+        cache.set(MODEL_VERSION_KEY, "v1")
+        loaded = load_latest_course_clusters()
+        self.assertModelEqual(self.model, loaded)
+        self.assertIs(loaded, load_latest_course_clusters())
+
+        new_model = (self.model[0][:1], self.model[1][:1], self.model[2], self.model[2])
+        save_model(new_model, os.path.join(self.model_dir, "v2"))
+        cache.set(MODEL_VERSION_KEY, "v2")
+        self.assertModelEqual(new_model, load_latest_course_clusters())
+
+    def mock_s3(self, objects):
+        """
+        Patches the S3 client of `plan/recommender_model.py` with a mock backed by the given
+        dict of keys to bytes, and returns the mock.
+        """
+
+        def get_object(Bucket, Key):
+            if Key not in objects:
+                raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+            return {"Body": io.BytesIO(objects[Key])}
+
+        def upload_file(path, bucket, key):
+            with open(path, "rb") as f:
+                objects[key] = f.read()
+
+        def download_file(bucket, key, path):
+            with open(path, "wb") as f:
+                f.write(get_object(bucket, key)["Body"].read())
+
+        def put_object(Bucket, Key, Body):
+            objects[Key] = Body
+
+        patcher = patch("plan.recommender_model.S3_client")
+        s3_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        s3_client.get_object.side_effect = get_object
+        s3_client.upload_file.side_effect = upload_file
+        s3_client.download_file.side_effect = download_file
+        s3_client.put_object.side_effect = put_object
+        return s3_client
+
+    @patch("plan.management.commands.recommendcourses.course_clusters", (None, None))
+    def test_legacy_model_loaded_if_no_version(self):
+        objects = {LEGACY_MODEL_KEY: pickle.dumps(self.model)}
+        s3_client = self.mock_s3(objects)
+        loaded = load_latest_course_clusters()
+        np.testing.assert_array_equal(np.array(self.model[0]), np.array(loaded[0]))
+        self.assertEqual(self.model[1], loaded[1])
+        self.assertIs(loaded, load_latest_course_clusters())
+        # Requests never publish the legacy model
+        self.assertFalse(s3_client.upload_file.called)
+        self.assertFalse(s3_client.put_object.called)
+
+    @patch("plan.management.commands.recommendcourses.course_clusters", (None, None))
+    def test_publish_legacy_model_command(self):
+        objects = {LEGACY_MODEL_KEY: pickle.dumps(self.model)}
+        self.mock_s3(objects)
+        call_command("publishlegacymodel", stdout=io.StringIO())
+        version = cache.get(MODEL_VERSION_KEY)
+        self.assertEqual(version.encode(), objects[MODEL_LATEST_KEY])
+        self.assertModelEqual(self.model, load_latest_course_clusters())
+
+    @patch("plan.management.commands.recommendcourses.course_clusters", (None, None))
+    def test_no_model_unavailable(self):
+        s3_client = self.mock_s3({})
+        with self.assertRaises(ModelUnavailable):
+            load_latest_course_clusters()
+        calls = s3_client.get_object.call_count
+        # Until MODEL_UNAVAILABLE_TIMEOUT, S3 isn't retried
+        with self.assertRaises(ModelUnavailable):
+            load_latest_course_clusters()
+        self.assertEqual(calls, s3_client.get_object.call_count)
+
+    def test_previous_model_kept_if_new_version_unavailable(self):
+        self.mock_s3({})
+        save_model(self.model, os.path.join(self.model_dir, "v1"))
+        cache.set(MODEL_VERSION_KEY, "v1")
+        loaded = load_latest_course_clusters()
+        cache.set(MODEL_VERSION_KEY, "v2")
+        self.assertIs(loaded, load_latest_course_clusters())
+
+    def test_vector_matrix_from_loaded_model(self):
+        path = os.path.join(self.model_dir, "v1")
+        save_model(self.model, path)
+        _, _, curr_course_vectors_dict, _ = load_model(path)
+        user_vector = np.array([1.0, 1.0])
+        scores = get_course_vector_matrix(curr_course_vectors_dict).scores(user_vector)
+        for code, vector in self.model[2].items():
+            self.assertAlmostEqual(cosine_similarity(vector, user_vector), scores[code])
+
+
+class RecommendCoursesTestCase(TestCase):
+    def setUp(self):
+        set_semester()
+        for code in ["CIS-1200", "CIS-1210", "CIS-1600", "CIS-2400", "CIS-3200"]:
+            get_or_create_course(*code.split("-"), TEST_SEMESTER)
+        get_or_create_course("CIS", "1100", "2018C")  # not offered this semester
+        self.vectors = {
+            "CIS-1100": np.array([1.0, 0.0]),
+            "CIS-1200": np.array([0.9, 0.1]),
+            "CIS-1210": np.array([0.7, 0.3]),
+            "CIS-1600": np.array([0.1, 0.9]),
+            "CIS-2400": np.array([0.0, 1.0]),
+            "CIS-3200": np.array([0.5, 0.5]),
+        }
+        self.clusters = [["CIS-1100", "CIS-1200", "CIS-1210"], ["CIS-1600", "CIS-2400", "CIS-3200"]]
+        self.centroids = [np.array([0.8, 0.2]), np.array([0.2, 0.8])]
+
+    def recommend(self, user_vector, user_courses=(), n_recommendations=2):
+        return recommend_courses(
+            self.vectors,
+            self.centroids,
+            self.clusters,
+            np.array(user_vector),
+            set(user_courses),
+            n_recommendations,
+        )
+
+    def test_nearest_cluster_by_similarity(self):
+        self.assertEqual(["CIS-2400", "CIS-1600"], self.recommend([0.0, 1.0]))
+        self.assertEqual(["CIS-1210", "CIS-3200"], self.recommend([0.6, 0.4], ["CIS-1200"]))
+
+    def test_only_offered_courses(self):
+        self.assertEqual(["CIS-1200", "CIS-1210"], self.recommend([1.0, 0.0]))
+
+    def test_thin_cluster_adds_next_nearest_cluster(self):
+        self.assertEqual(
+            ["CIS-1210", "CIS-3200", "CIS-1600"],
+            self.recommend([1.0, 0.0], ["CIS-1200"], n_recommendations=3),
+        )
+        self.assertEqual(5, len(self.recommend([1.0, 0.0], n_recommendations=10)))
+
+    @override_settings(CODE_PREFIX_INDEX=True)
+    @patch("courses.code_index.r")
+    def test_offering_mask_from_code_index(self, mock_redis):
+        mock_redis.get.return_value = b"1"
+        clear_code_indexes()
+        self.addCleanup(clear_code_indexes)
+        self.assertEqual(["CIS-1200", "CIS-1210"], self.recommend([1.0, 0.0]))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(["CIS-2400", "CIS-1600"], self.recommend([0.0, 1.0]))
+        self.assertFalse([q for q in queries.captured_queries if "courses_course" in q["sql"]])
+
+
+class VectorizeByCopresenceTestCase(TestCase):
+    def setUp(self):
+        self.courses_by_semester_by_user = {
+            0: {"2020A": {"CIS-1200": 1, "CIS-1600": 2}, "2020C": {"CIS-1210": 1}},
+        }
+        self.course_to_index = {"CIS-1200": 0, "CIS-1600": 1, "CIS-1210": 2}
+
+    def test_current_class(self):
+        vectors = vectorize_by_copresence(self.courses_by_semester_by_user, self.course_to_index)
+        np.testing.assert_array_equal(
+            np.array([[2, 1, 0], [1, 4, 0], [1, 1, 2]]), vectors.toarray()
+        )
+
+    def test_past_class(self):
+        vectors = vectorize_by_copresence(
+            self.courses_by_semester_by_user, self.course_to_index, as_past_class=True
+        )
+        np.testing.assert_array_equal(
+            np.array([[2, 1, 1], [1, 4, 1], [1, 1, 2]]), vectors.toarray()
+        )
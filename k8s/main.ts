@@ -30,6 +30,8 @@ export class MyChart extends PennLabsChart {
 			persistData: false,
 		})
 
+		// Alert worker: consumes open alerts first, then close notifications
+		// (see backend/alert/queues.py)
 		new DjangoApplication(this, 'celery', {
 			deployment: {
 				image: backendImage,
@@ -40,7 +42,31 @@ export class MyChart extends PennLabsChart {
 					'PennCourses',
 					'worker',
 					'-Q',
-					'alerts,celery',
+					'alerts,alerts_close,celery',
+					'--concurrency',
+					'8',
+					'--prefetch-multiplier',
+					'1',
+					'-linfo',
+				],
+			},
+			djangoSettingsModule: 'PennCourses.settings.production',
+		})
+
+		// Background worker: demand / percent open recomputes, kept off the alert worker
+		new DjangoApplication(this, 'celery-background', {
+			deployment: {
+				image: backendImage,
+				secret,
+				cmd: [
+					'celery',
+					'-A',
+					'PennCourses',
+					'worker',
+					'-Q',
+					'background',
+					'--concurrency',
+					'2',
 					'-linfo',
 				],
 			},
@@ -133,6 +159,13 @@ export class MyChart extends PennLabsChart {
 			cmd: ['python', 'manage.py', 'registrarimport'],
 		})
 
+		new CronJob(this, 'rollup-stats', {
+			schedule: cronTime.everyHourAt(55),
+			image: backendImage,
+			secret,
+			cmd: ['python', 'manage.py', 'rollupalertstats'],
+		})
+
 		new CronJob(this, 'report-stats', {
 			schedule: cronTime.everyDayAt(20),
 			image: backendImage,